@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""部品衝突チェックのベンチマーク
+
+従来の全部品線形スキャンと、部品インデックス（外形ボックス判定・精密判定）の
+処理時間と削除対象数を比較する。KiCad付属のPythonで実行する。
+
+    python benchmarks/bench_components.py board.kicad_pcb [--clearance 0.2]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import pcbnew
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from via_cleaner_core import DEFAULT_SETTINGS, ViaChecker, copper_layers, extract_geometry, via_record
+
+
+def run_legacy(board, vias):
+    """従来方式: VIAごとに全部品のGetBoundingBoxを呼び出す"""
+    footprints = list(board.GetFootprints())
+    removed = 0
+    for via in vias:
+        via_pos = via.GetPosition()
+        for footprint in footprints:
+            if footprint.GetBoundingBox().Contains(via_pos):
+                removed += 1
+                break
+    return removed
+
+
+def run_indexed(checker, board, vias, clearance, precise):
+    """部品インデックスを使ったチェック（形状の抽出を含む。VIAの層で部品・パッドを絞るのも本番と同じ）"""
+    settings = dict(DEFAULT_SETTINGS, clearance=clearance, precise_components=precise, check_nets=False,
+                    check_board_edge=False, check_zones=False, check_outside_board=False)
+    geometry = extract_geometry(board, settings)
+    copper = copper_layers(board)
+    reasons = checker.check_vias(geometry, [via_record(via, copper) for via in vias], settings)
+    return sum(1 for reason in reasons if reason)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('board')
+    parser.add_argument('--clearance', type=float, default=0.2, help='最小クリアランス (mm)')
+    args = parser.parse_args()
+
+    checker = ViaChecker()
+    board = pcbnew.LoadBoard(args.board)
+    vias = [item for item in board.GetTracks() if item.Type() == pcbnew.PCB_VIA_T]
+    print(f"VIA: {len(vias)}個, 部品: {len(board.GetFootprints())}個")
+
+    cases = [
+        ('従来（線形スキャン）', lambda: run_legacy(board, vias)),
+        ('インデックス（外形ボックス）', lambda: run_indexed(checker, board, vias, args.clearance, False)),
+        ('インデックス（精密判定）', lambda: run_indexed(checker, board, vias, args.clearance, True)),
+    ]
+    for label, case in cases:
+        start_time = time.perf_counter()
+        removed = case()
+        elapsed = time.perf_counter() - start_time
+        print(f"{label}: {elapsed:.3f}秒, 削除対象 {removed}個")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""並列チェックのベンチマーク
+
+.kicad_pcbを直接読み込み（pcbnew不要）、全VIAをワーカー数1〜Nでチェックして
+処理時間と速度向上率を表示する。結果がワーカー数1と一致することも確認する。
+
+    python benchmarks/bench_parallel.py board.kicad_pcb [--max-workers 16]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from via_cleaner_core import DEFAULT_SETTINGS, ViaChecker
+from via_cleaner_sexpr import SexprBoard
+
+
+def worker_counts(max_workers):
+    """1, 2, 4, ... , max_workers"""
+    counts = []
+    count = 1
+    while count < max_workers:
+        counts.append(count)
+        count *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('board')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1, help='最大ワーカー数')
+    args = parser.parse_args()
+
+    settings = dict(DEFAULT_SETTINGS)
+    board = SexprBoard(args.board, settings)
+    geometry = board.geometry
+    board.close()
+    print(f"VIA: {len(geometry.vias)}個, 配線: {len(geometry.tracks)}本, ゾーン: {len(geometry.zones)}個")
+
+    baseline = None
+    baseline_time = None
+    for workers in worker_counts(args.max_workers):
+        start_time = time.perf_counter()
+        reasons = ViaChecker().check_vias(geometry, geometry.vias, dict(settings, workers=workers))
+        elapsed = time.perf_counter() - start_time
+        if baseline is None:
+            baseline, baseline_time = reasons, elapsed
+        removed = sum(1 for reason in reasons if reason)
+        match = "一致" if reasons == baseline else "不一致"
+        print(f"ワーカー {workers:2d}: {elapsed:.3f}秒 (x{baseline_time / elapsed:.2f}), "
+              f"削除対象 {removed}個, 結果 {match}")
+
+
+if __name__ == '__main__':
+    main()
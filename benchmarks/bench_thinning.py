@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""スティッチングVIAの間引きのベンチマーク
+
+格子状のGNDのスティッチングVIA（ランダムに少しずらす）と、ランダムな位置の信号VIA、
+基板全体のGNDゾーンと小さな島のゾーンを作り、間引きにかかる時間と削除数を表示する。
+残したVIAの間隔と、島ごとにVIAが残っていることも確かめる。pcbnewは不要。
+
+    python benchmarks/bench_thinning.py [--vias 100000] [--grid 0.5] [--pitch 1.0]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from via_cleaner_core import DEFAULT_SETTINGS, IU_PER_MM, BoardGeometry, ViaChecker, ViaRecord, point_in_polygon
+
+LAYERS = ('F.Cu', 'In1.Cu', 'In2.Cu', 'B.Cu')
+
+
+def _rectangle(x0, y0, x1, y1):
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+
+def make_geometry(count, grid, signals, islands, seed):
+    """GND（ネット1）のスティッチングVIAと信号VIA、GNDゾーンだけの形状"""
+    rng = random.Random(seed)
+    columns = int(count ** 0.5) + 1
+    step = int(grid * IU_PER_MM)
+    geometry = BoardGeometry()
+    geometry.copper_layers = list(LAYERS)
+    geometry.net_names = {1: "GND"}
+    geometry.net_names.update((net, f"N{net}") for net in range(2, 52))
+    for index in range(count):
+        x = (index % columns) * step + rng.randint(-step // 10, step // 10)
+        y = (index // columns) * step + rng.randint(-step // 10, step // 10)
+        geometry.vias.append(ViaRecord(x, y, int(0.2 * IU_PER_MM), 1, f"g{index}", LAYERS))
+    size = columns * step
+    for index in range(signals):
+        geometry.vias.append(ViaRecord(rng.randrange(size), rng.randrange(size), int(0.2 * IU_PER_MM),
+                                       rng.randint(2, 51), f"s{index}", LAYERS))
+
+    # 内層の全面ゾーンと、外層の小さな島（間隔より小さく、VIAが1～2個しか入らない）
+    geometry.zones.append({'uuid': 'plane', 'name': 'GND plane', 'net': 1, 'layers': ('In1.Cu',),
+                           'polygons': [(_rectangle(-step, -step, size, size), [])]})
+    for index in range(islands):
+        x = rng.randrange(columns - 1) * step
+        y = rng.randrange(count // columns - 1) * step
+        geometry.zones.append({'uuid': f"island{index}", 'name': f"island{index}", 'net': 1, 'layers': ('F.Cu',),
+                               'polygons': [(_rectangle(x - step // 3, y - step // 3, x + step // 3, y + step // 3),
+                                             [])]})
+    return geometry
+
+
+def verify(geometry, vias, reasons, summary, pitch):
+    """(間隔より近い残したVIAの組の数, 繋がるVIAが残っていない島の数)"""
+    kept = [via for via, reason in zip(vias, reasons) if reason is None]
+    grid = {}
+    for via in kept:
+        grid.setdefault((via.x // pitch, via.y // pitch), []).append(via)
+    close = 0
+    for via in kept:
+        cx, cy = via.x // pitch, via.y // pitch
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for other in grid.get((cx + dx, cy + dy), []):
+                    if other is not via and (other.x - via.x) ** 2 + (other.y - via.y) ** 2 < pitch * pitch:
+                        close += 1
+    empty = 0
+    for zone in geometry.zones[1:]:
+        outline = zone['polygons'][0][0]
+        inside = [via for via in vias if point_in_polygon(via.x, via.y, outline)]
+        if inside and not any(via in kept for via in inside):
+            empty += 1
+    return close // 2, empty
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vias', type=int, default=100000)
+    parser.add_argument('--grid', type=float, default=0.5, help='スティッチングVIAの格子の間隔 (mm)')
+    parser.add_argument('--pitch', type=float, default=1.0, help='間引き後の最小間隔 (mm)')
+    parser.add_argument('--signals', type=int, default=2000, help='信号VIAの数')
+    parser.add_argument('--islands', type=int, default=50, help='小さな島のゾーンの数')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    geometry = make_geometry(args.vias, args.grid, args.signals, args.islands, args.seed)
+    vias = [via for via in geometry.vias if via.net == 1]
+    settings = dict(DEFAULT_SETTINGS, thin_stitching=True, thinning_pitch=args.pitch)
+    start_time = time.perf_counter()
+    reasons, summary = ViaChecker().thin_vias(geometry, vias, [None] * len(vias), settings)
+    elapsed = time.perf_counter() - start_time
+    print(f"VIA: {summary['candidates']}個, 削除: {summary['removed']}個, 残したVIA: {summary['kept']}個, "
+          f"島のために残したVIA: {summary['protected']}個 ({elapsed:.3f}秒)")
+    close, empty = verify(geometry, vias, reasons, summary, int(args.pitch * IU_PER_MM))
+    print(f"間隔より近い残したVIAの組: {close} (島のために残したVIAの分を含む), VIAが無くなった島: {empty}")
+    return 1 if empty else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
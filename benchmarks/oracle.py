@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""チェック結果の正しさを確かめるための総当たりの参照実装
+
+空間インデックス・一括計算・キャッシュを使わず、VIAごとに基板上の全アイテムとの距離を
+そのまま計算する（遅いので一部のVIAだけを調べる用途）。距離の計算式とクリアランスの決定
+（ClearanceResolver）はvia_cleaner_coreのものを使い、候補の絞り込みだけを確かめる。
+
+reference_reasonsの結果はViaChecker.check_vias（VIA同士の衝突の解消前）と一致するはずで、
+解消後の結果はconflict_violationsで、残したVIA同士が衝突せず、削除したVIAがどれかの
+残したVIAと衝突していることを確かめる（残すVIAの選び方は一通りではないので結果の性質だけを見る）。
+"""
+
+import math
+
+from via_cleaner_core import (IU_PER_MM, ClearanceResolver, arc_from_three_points, point_arc_distance,
+                              point_in_polygon, point_poly_set_distance, point_polygon_distance,
+                              point_segment_distance)
+
+
+class _Layers:
+    """銅箔層名のタプル → ビットマスク（層が分からなければ全層の-1）"""
+    def __init__(self, geometry):
+        self.bits = {layer: 1 << bit for bit, layer in enumerate(geometry.copper_layers)}
+
+    def mask(self, layers):
+        if not layers or any(layer not in self.bits for layer in layers):
+            return -1
+        mask = 0
+        for layer in layers:
+            mask |= self.bits[layer]
+        return mask
+
+
+def reference_reasons(geometry, vias, settings, selection=None):
+    """vias（ViaRecord）の削除理由を総当たりで求める（selectionは選択VIA全体。省略時はvias）"""
+    clearance = int(settings['clearance'] * IU_PER_MM)
+    resolver = ClearanceResolver(geometry, clearance, settings.get('use_design_rules', True))
+    layers = _Layers(geometry)
+    excluded = _excluded(vias if selection is None else selection, settings)
+    closed = _outline_closed(geometry.outlines)
+
+    checks = []
+    if settings['check_outside_board']:
+        checks.append(('outside_board', lambda via: _outside_board(geometry, closed, via)))
+    if settings.get('check_keepouts'):
+        checks.append(('keepout_violation', lambda via: _keepout_violation(geometry, via)))
+    if settings['check_components']:
+        checks.append(('component_collision', lambda via: _component_collision(geometry, resolver, layers, via)))
+    if settings['check_nets']:
+        checks.append(('net_collision', lambda via: _net_collision(geometry, resolver, layers, excluded, via)))
+    if settings.get('check_drills'):
+        hole_to_hole = int(settings['hole_to_hole'] * IU_PER_MM)
+        checks.append(('drill_collision', lambda via: _drill_collision(geometry, layers, excluded, hole_to_hole, via)))
+    if settings['check_board_edge'] and geometry.outlines:
+        edge = int(settings['board_edge_clearance'] * IU_PER_MM)
+        checks.append(('board_edge_collision', lambda via: _outline_distance(geometry, via) < edge + via.radius))
+    if settings['check_zones']:
+        zone = int(settings['zone_clearance'] * IU_PER_MM)
+        use_fills = settings.get('use_zone_fills', False)
+        checks.append(('zone_collision', lambda via: _zone_collision(geometry, zone, use_fills, via)))
+
+    reasons = []
+    for via in vias:
+        reasons.append(next((reason for reason, check in checks if check(via)), None))
+    return reasons
+
+
+def conflict_violations(geometry, selected_vias, reasons, settings, indices=None):
+    """VIA同士の衝突の解消結果の誤りを数える（indicesは調べる選択VIAの番号。省略時は全部）
+
+    (ほかの残したVIAと衝突している残したVIAの数, どの残したVIAとも衝突しないのに削除したVIAの数)を返す。
+    穴の間隔で削除したVIAは、残したVIAとも選択外の穴とも間隔が足りていれば誤りとする。
+    """
+    clearance = int(settings['clearance'] * IU_PER_MM)
+    resolver = ClearanceResolver(geometry, clearance, settings.get('use_design_rules', True))
+    layers = _Layers(geometry)
+    kept = [via for via, reason in zip(selected_vias, reasons) if reason is None]
+    excluded = _excluded(selected_vias, settings)
+    hole_to_hole = int(settings['hole_to_hole'] * IU_PER_MM) if settings.get('check_drills') else None
+
+    def conflict(a, b):
+        shared = layers.mask(a.layers) & layers.mask(b.layers)
+        if not shared:
+            return False
+        distance = math.hypot(a.x - b.x, a.y - b.y)
+        if (hole_to_hole is not None and a.drill_radius > 0 and b.drill_radius > 0
+                and distance < hole_to_hole + a.drill_radius + b.drill_radius):
+            return True
+        if a.net == b.net or not settings['check_nets']:
+            return False
+        return distance < resolver.clearance(a.net, b.net, shared, 'Via') + a.radius + b.radius
+
+    overlapping = 0
+    needless = 0
+    for index in (range(len(selected_vias)) if indices is None else indices):
+        via = selected_vias[index]
+        if reasons[index] is None:
+            overlapping += any(conflict(via, other) for other in kept if other is not via)
+        elif reasons[index] == 'via_conflict':
+            needless += not any(conflict(via, other) for other in kept)
+        elif reasons[index] == 'drill_collision':
+            needless += not (any(conflict(via, other) for other in kept)
+                             or _drill_collision(geometry, layers, excluded, hole_to_hole, via))
+    return overlapping, needless
+
+
+def _excluded(selection, settings):
+    """VIA同士の衝突を後で解消する場合に、チェックの相手から外す選択VIAのUUID"""
+    if settings.get('resolve_via_conflicts') and (settings['check_nets'] or settings.get('check_drills')):
+        return {via.uuid for via in selection}
+    return set()
+
+
+def _outline_closed(outlines):
+    """端点が全て偶数回使われていれば閉じた外形"""
+    endpoints = {}
+    for primitive in outlines:
+        if primitive[0] == 'segment':
+            ends = [primitive[1:3], primitive[3:5]]
+        elif primitive[0] == 'arc':
+            ends = [primitive[1:3], primitive[5:7]]
+        else:
+            continue
+        for x, y in ends:
+            key = (int(round(x / 1000.0)), int(round(y / 1000.0)))
+            endpoints[key] = endpoints.get(key, 0) + 1
+    return bool(outlines) and all(count % 2 == 0 for count in endpoints.values())
+
+
+def _outside_board(geometry, closed, via):
+    if geometry.board_bbox:
+        x0, y0, x1, y1 = geometry.board_bbox
+        if not (x0 <= via.x <= x1 and y0 <= via.y <= y1):
+            return True
+    if not closed:
+        return False
+    # 右向きの半直線と外形の交差回数（円は内側なら1回、円弧は細かい折れ線で数える）
+    inside = False
+    for primitive in geometry.outlines:
+        if primitive[0] == 'circle':
+            _, cx, cy, radius, _ = primitive
+            if math.hypot(via.x - cx, via.y - cy) < radius:
+                inside = not inside
+            continue
+        if primitive[0] == 'arc':
+            segments = _arc_segments(*primitive[1:7])
+        else:
+            segments = [primitive[1:5]]
+        for x1, y1, x2, y2 in segments:
+            if (y1 > via.y) != (y2 > via.y) and via.x < x1 + (via.y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+    return not inside
+
+
+def _arc_segments(sx, sy, mx, my, ex, ey, count=256):
+    arc = arc_from_three_points(sx, sy, mx, my, ex, ey)
+    if arc is None:
+        return [(sx, sy, ex, ey)]
+    cx, cy, radius, start_angle, sweep = arc
+    points = [(sx, sy)]
+    for step in range(1, count):
+        angle = start_angle + sweep * step / count
+        points.append((cx + radius * math.cos(angle), cy + radius * math.sin(angle)))
+    points.append((ex, ey))
+    return [(x1, y1, x2, y2) for (x1, y1), (x2, y2) in zip(points, points[1:])]
+
+
+def _outline_distance(geometry, via):
+    distance = float('inf')
+    for primitive in geometry.outlines:
+        if primitive[0] == 'segment':
+            distance = min(distance, point_segment_distance(via.x, via.y, *primitive[1:5]))
+        elif primitive[0] == 'circle':
+            _, cx, cy, radius, _ = primitive
+            distance = min(distance, abs(math.hypot(via.x - cx, via.y - cy) - radius))
+        else:
+            _, sx, sy, mx, my, ex, ey, _ = primitive
+            arc = arc_from_three_points(sx, sy, mx, my, ex, ey)
+            if arc is None:
+                distance = min(distance, point_segment_distance(via.x, via.y, sx, sy, ex, ey))
+            else:
+                distance = min(distance, point_arc_distance(via.x, via.y, *arc, sx, sy, ex, ey))
+    return distance
+
+
+def _keepout_violation(geometry, via):
+    for keepout in geometry.keepouts:
+        if via.layers and not set(via.layers) & set(keepout['layers']):
+            continue
+        if point_poly_set_distance(via.x, via.y, keepout['polygons']) < via.radius:
+            return True
+    return False
+
+
+def _component_collision(geometry, resolver, layers, via):
+    via_mask = layers.mask(via.layers)
+    for footprint in geometry.footprints:
+        courtyards = footprint['courtyards']
+        pads = footprint['pads']
+        if not courtyards and not pads:
+            x0, y0, x1, y1 = footprint['bbox']
+            if x0 <= via.x <= x1 and y0 <= via.y <= y1:
+                return True
+            continue
+        if any(point_in_polygon(via.x, via.y, outline) for outline in courtyards):
+            return True
+        for pad_net, outline, bbox, pad_layers in pads:
+            if pad_net == via.net and pad_net != 0:
+                continue
+            shared = via_mask & layers.mask(pad_layers)
+            if not shared:
+                continue
+            reach = resolver.clearance(via.net, pad_net, shared, 'Pad') + via.radius
+            if point_polygon_distance(via.x, via.y, outline) < reach:
+                return True
+    return False
+
+
+def _net_collision(geometry, resolver, layers, excluded, via):
+    via_mask = layers.mask(via.layers)
+    for other in geometry.vias:
+        if other.net == via.net or other.uuid in excluded:
+            continue
+        shared = via_mask & layers.mask(other.layers)
+        if not shared:
+            continue
+        required = resolver.clearance(via.net, other.net, shared, 'Via') + via.radius + other.radius
+        if math.hypot(via.x - other.x, via.y - other.y) < required:
+            return True
+    for track in geometry.tracks:
+        if track.net == via.net:
+            continue
+        shared = via_mask & layers.mask((track.layer,) if track.layer else ())
+        if not shared:
+            continue
+        arc = arc_from_three_points(track.x1, track.y1, track.mx, track.my, track.x2, track.y2) \
+            if track.kind == 'arc' else None
+        if arc is None:
+            distance = point_segment_distance(via.x, via.y, track.x1, track.y1, track.x2, track.y2)
+        else:
+            distance = point_arc_distance(via.x, via.y, *arc, track.x1, track.y1, track.x2, track.y2)
+        item_type = 'Arc' if track.kind == 'arc' else 'Track'
+        if distance < resolver.clearance(via.net, track.net, shared, item_type) + via.radius + track.half_width:
+            return True
+    return False
+
+
+def _drill_collision(geometry, layers, excluded, hole_to_hole, via):
+    if via.drill_radius <= 0:
+        return False
+    via_mask = layers.mask(via.layers)
+    for other in geometry.vias:
+        if other.uuid == via.uuid or other.uuid in excluded or other.drill_radius <= 0:
+            continue
+        if not via_mask & layers.mask(other.layers):
+            continue
+        if math.hypot(via.x - other.x, via.y - other.y) < hole_to_hole + via.drill_radius + other.drill_radius:
+            return True
+    for hole in geometry.holes:
+        if not via_mask & layers.mask(hole.layers):
+            continue
+        distance = point_segment_distance(via.x, via.y, hole.x1, hole.y1, hole.x2, hole.y2)
+        if distance < hole_to_hole + via.drill_radius + hole.radius:
+            return True
+    return False
+
+
+def _zone_collision(geometry, zone_clearance, use_fills, via):
+    for zone in geometry.zones:
+        if zone['net'] == via.net:
+            continue
+        layers = [layer for layer in zone['layers'] if not via.layers or layer in via.layers]
+        fills = zone.get('fills') if use_fills else None
+        if fills is None:
+            shapes = [zone['polygons']] if layers and any(outline for outline, holes in zone['polygons']) else []
+        else:
+            shapes = [fills[layer] for layer in layers if fills.get(layer)]
+        for polygons in shapes:
+            if point_poly_set_distance(via.x, via.y, polygons) < zone_clearance + via.radius:
+                return True
+    return False
@@ -0,0 +1,640 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""ベンチマーク用のpcbnewの代用品
+
+プラグインとvia_cleaner_coreが使うpcbnewのAPIだけを純Pythonで持つ（座標はnm、
+層IDは値だけ合わせた定数）。KiCadの無い環境で合成基板（synthetic_board.py）を
+作ってチェック処理を動かすためのもので、KiCadの動作を再現するものではない。
+
+    import pcbnew_stub
+    pcbnew_stub.install()   # import via_cleaner_coreより前に呼ぶ
+"""
+
+import math
+import sys
+import uuid as _uuid
+
+# 層ID（KiCad 9の値）
+F_Cu = 0
+B_Cu = 2
+In1_Cu = 4
+Edge_Cuts = 25
+B_CrtYd = 29
+F_CrtYd = 31
+
+# アイテム種別・図形種別
+PCB_VIA_T = 1
+PCB_TRACE_T = 2
+PCB_ARC_T = 3
+PCB_GROUP_T = 4
+SHAPE_T_SEGMENT = 0
+SHAPE_T_RECT = 1
+SHAPE_T_ARC = 2
+SHAPE_T_CIRCLE = 3
+SHAPE_T_POLY = 4
+SHAPE_T_BEZIER = 5
+ERROR_INSIDE = 0
+
+_boards = {}
+_current_board = None
+
+
+def install():
+    """このモジュールをpcbnewとして登録（本物のpcbnewがあっても置き換える）"""
+    sys.modules['pcbnew'] = sys.modules[__name__]
+
+
+def inner_layer(index):
+    """内層In{index}.CuのID"""
+    return In1_Cu + 2 * (index - 1)
+
+
+def FromMM(value):
+    return int(round(value * 1000000))
+
+
+def ToMM(value):
+    return value / 1000000
+
+
+def GetBoard():
+    return _current_board
+
+
+def SetBoard(board):
+    """GetBoard()が返す基板を設定（プラグインのRunを動かす場合）"""
+    global _current_board
+    _current_board = board
+
+
+def LoadBoard(path):
+    return _boards[path]
+
+
+def SaveBoard(path, board):
+    _boards[path] = board
+    return True
+
+
+def Refresh():
+    pass
+
+
+class ActionPlugin:
+    def register(self):
+        pass
+
+
+class VECTOR2I:
+    def __init__(self, x=0, y=0):
+        self.x = int(x)
+        self.y = int(y)
+
+
+class EDA_ANGLE:
+    def __init__(self, degrees=0.0):
+        self.degrees = degrees
+
+    def AsDegrees(self):
+        return self.degrees
+
+    def AsRadians(self):
+        return math.radians(self.degrees)
+
+
+class KIID:
+    def __init__(self, text=None):
+        self.text = text or str(_uuid.uuid4())
+
+    def AsString(self):
+        return self.text
+
+
+class BOX2I:
+    def __init__(self, x0, y0, x1, y1):
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+
+    def GetLeft(self):
+        return self.x0
+
+    def GetTop(self):
+        return self.y0
+
+    def GetRight(self):
+        return self.x1
+
+    def GetBottom(self):
+        return self.y1
+
+    def GetWidth(self):
+        return self.x1 - self.x0
+
+    def GetHeight(self):
+        return self.y1 - self.y0
+
+    def Contains(self, point):
+        return self.x0 <= point.x <= self.x1 and self.y0 <= point.y <= self.y1
+
+
+def _points_box(points):
+    if not points:
+        return BOX2I(0, 0, 0, 0)
+    xs = [x for x, y in points]
+    ys = [y for x, y in points]
+    return BOX2I(min(xs), min(ys), max(xs), max(ys))
+
+
+def _segment_distance(px, py, x1, y1, x2, y2):
+    dx = x2 - x1
+    dy = y2 - y1
+    length_squared = dx * dx + dy * dy
+    t = 0.0 if length_squared == 0 else max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length_squared))
+    return math.hypot(px - x1 - dx * t, py - y1 - dy * t)
+
+
+def _inside(px, py, points):
+    inside = False
+    x1, y1 = points[-1]
+    for x2, y2 in points:
+        if (y1 > py) != (y2 > py) and px < x1 + (py - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+class LSET:
+    def __init__(self, layer_ids):
+        self.layer_ids = list(layer_ids)
+
+    def CuStack(self):
+        """銅箔層（KiCad 9では偶数のID）を積層順に"""
+        copper = [layer_id for layer_id in self.layer_ids if layer_id % 2 == 0]
+        inner = sorted(layer_id for layer_id in copper if layer_id >= In1_Cu)
+        return [F_Cu] * (F_Cu in copper) + inner + [B_Cu] * (B_Cu in copper)
+
+    def Contains(self, layer_id):
+        return layer_id in self.layer_ids
+
+
+class SHAPE_LINE_CHAIN:
+    def __init__(self, points):
+        self.points = [VECTOR2I(x, y) for x, y in points]
+
+    def PointCount(self):
+        return len(self.points)
+
+    def CPoint(self, index):
+        return self.points[index]
+
+
+class SHAPE_POLY_SET:
+    """[(外周の点列, [穴の点列, ...]), ...]"""
+    def __init__(self, polygons=()):
+        self.polygons = [(list(outline), [list(hole) for hole in holes]) for outline, holes in polygons]
+
+    def OutlineCount(self):
+        return len(self.polygons)
+
+    def Outline(self, index):
+        return SHAPE_LINE_CHAIN(self.polygons[index][0])
+
+    def HoleCount(self, index):
+        return len(self.polygons[index][1])
+
+    def Hole(self, index, hole):
+        return SHAPE_LINE_CHAIN(self.polygons[index][1][hole])
+
+    def TotalVertices(self):
+        return sum(len(outline) + sum(len(hole) for hole in holes) for outline, holes in self.polygons)
+
+    def BBox(self):
+        return _points_box([point for outline, holes in self.polygons for point in outline])
+
+    def Contains(self, point):
+        return any(_inside(point.x, point.y, outline) and not any(_inside(point.x, point.y, hole) for hole in holes)
+                   for outline, holes in self.polygons)
+
+    def Distance(self, point):
+        """塗りつぶし部分までの距離（内側なら0）"""
+        if self.Contains(point):
+            return 0
+        distance = float('inf')
+        for outline, holes in self.polygons:
+            for ring in [outline] + holes:
+                x1, y1 = ring[-1]
+                for x2, y2 in ring:
+                    distance = min(distance, _segment_distance(point.x, point.y, x1, y1, x2, y2))
+                    x1, y1 = x2, y2
+        return int(distance)
+
+
+class _Item:
+    def __init__(self, uuid=None):
+        self.m_Uuid = KIID(uuid)
+        self.selected = False
+
+    def IsSelected(self):
+        return self.selected
+
+    def SetSelected(self):
+        self.selected = True
+
+    def ClearSelected(self):
+        self.selected = False
+
+
+class NETCLASS:
+    def __init__(self, name, clearance):
+        self.name = name
+        self.clearance = clearance
+
+    def GetName(self):
+        return self.name
+
+    def GetClearance(self):
+        return self.clearance
+
+
+class NETINFO_ITEM:
+    def __init__(self, code, name, net_class):
+        self.code = code
+        self.name = name
+        self.net_class = net_class
+
+    def GetNetCode(self):
+        return self.code
+
+    def GetNetname(self):
+        return self.name
+
+    def GetNetClass(self):
+        return self.net_class
+
+
+class _Connected(_Item):
+    def __init__(self, net, board=None, uuid=None):
+        super().__init__(uuid)
+        self.net = net
+        self.board = board
+
+    def GetNetCode(self):
+        return self.net
+
+    def GetNetname(self):
+        if self.board is None or self.net not in self.board.nets:
+            return ""
+        return self.board.nets[self.net].GetNetname()
+
+
+class PCB_TRACK(_Connected):
+    def __init__(self, start, end, width, net, layer=F_Cu, board=None, uuid=None):
+        super().__init__(net, board, uuid)
+        self.start = start
+        self.end = end
+        self.width = width
+        self.layer = layer
+
+    def Type(self):
+        return PCB_TRACE_T
+
+    def GetStart(self):
+        return self.start
+
+    def GetEnd(self):
+        return self.end
+
+    def GetWidth(self):
+        return self.width
+
+    def GetLayer(self):
+        return self.layer
+
+    def IsOnLayer(self, layer_id):
+        return layer_id == self.layer
+
+    def GetBoundingBox(self):
+        half = self.width // 2
+        return BOX2I(min(self.start.x, self.end.x) - half, min(self.start.y, self.end.y) - half,
+                     max(self.start.x, self.end.x) + half, max(self.start.y, self.end.y) + half)
+
+    def HitTest(self, position, accuracy=0):
+        return _segment_distance(position.x, position.y, self.start.x, self.start.y,
+                                 self.end.x, self.end.y) <= self.width / 2 + accuracy
+
+
+class PCB_ARC(PCB_TRACK):
+    def __init__(self, start, mid, end, width, net, layer=F_Cu, board=None, uuid=None):
+        super().__init__(start, end, width, net, layer, board, uuid)
+        self.mid = mid
+
+    def Type(self):
+        return PCB_ARC_T
+
+    def GetMid(self):
+        return self.mid
+
+    def GetBoundingBox(self):
+        half = self.width // 2
+        points = [(p.x, p.y) for p in (self.start, self.mid, self.end)]
+        box = _points_box(points)  # 3点の外形（膨らみの大きい円弧では小さめ）
+        return BOX2I(box.x0 - half, box.y0 - half, box.x1 + half, box.y1 + half)
+
+
+class PCB_VIA(_Connected):
+    def __init__(self, position, width, net, top=F_Cu, bottom=B_Cu, drill=None, board=None, uuid=None):
+        super().__init__(net, board, uuid)
+        self.position = position
+        self.width = width
+        self.top = top
+        self.bottom = bottom
+        self.drill = drill if drill is not None else width // 2
+
+    def Type(self):
+        return PCB_VIA_T
+
+    def GetPosition(self):
+        return self.position
+
+    def GetStart(self):
+        return self.position
+
+    def GetEnd(self):
+        return self.position
+
+    def GetWidth(self):
+        return self.width
+
+    def GetDrillValue(self):
+        return self.drill
+
+    def TopLayer(self):
+        return self.top
+
+    def BottomLayer(self):
+        return self.bottom
+
+    def IsOnLayer(self, layer_id):
+        stack = self.board.copper_ids if self.board is not None else [F_Cu, B_Cu]
+        if layer_id not in stack:
+            return False
+        first, last = sorted((stack.index(self.top), stack.index(self.bottom)))
+        return first <= stack.index(layer_id) <= last
+
+    def GetBoundingBox(self):
+        radius = self.width // 2
+        return BOX2I(self.position.x - radius, self.position.y - radius,
+                     self.position.x + radius, self.position.y + radius)
+
+    def HitTest(self, position, accuracy=0):
+        return math.hypot(position.x - self.position.x, position.y - self.position.y) <= self.width / 2 + accuracy
+
+
+class PAD(_Connected):
+    """外形が多角形のパッド（layersは銅箔層IDのリスト、drillは穴の(幅, 高さ)で穴が無ければ(0, 0)）
+
+    位置は外形ボックスの中心、穴はそこに開ける。
+    """
+    def __init__(self, points, net, layers, board=None, uuid=None, drill=(0, 0), orientation=0.0):
+        super().__init__(net, board, uuid)
+        self.points = list(points)
+        self.layers = list(layers)
+        self.drill = drill
+        self.orientation = orientation
+
+    def GetPosition(self):
+        box = _points_box(self.points)
+        return VECTOR2I((box.GetLeft() + box.GetRight()) // 2, (box.GetTop() + box.GetBottom()) // 2)
+
+    def GetOrientation(self):
+        return EDA_ANGLE(self.orientation)
+
+    def GetDrillSize(self):
+        return VECTOR2I(*self.drill)
+
+    def GetPrincipalLayer(self):
+        return self.layers[0]
+
+    def GetLayer(self):
+        return self.layers[0]
+
+    def GetLayerSet(self):
+        return LSET(self.layers)
+
+    def GetEffectivePolygon(self, layer=None, error=ERROR_INSIDE):
+        return SHAPE_POLY_SET([(self.points, [])])
+
+    def GetBoundingBox(self):
+        return _points_box(self.points)
+
+    def HitTest(self, position, accuracy=0):
+        return self.GetEffectivePolygon().Distance(position) <= accuracy
+
+
+class FOOTPRINT(_Item):
+    def __init__(self, position, pads, courtyard, layer=F_Cu, uuid=None):
+        super().__init__(uuid)
+        self.position = position
+        self.pads = list(pads)
+        self.courtyard = list(courtyard)
+        self.layer = layer
+
+    def GetPosition(self):
+        return self.position
+
+    def GetOrientationDegrees(self):
+        return 0.0
+
+    def GetLayer(self):
+        return self.layer
+
+    def GetLastEditTime(self):
+        return 0
+
+    def Pads(self):
+        return self.pads
+
+    def BuildCourtyardCaches(self):
+        pass
+
+    def GetCourtyard(self, layer):
+        if (layer == F_CrtYd) == (self.layer == F_Cu) and self.courtyard:
+            return SHAPE_POLY_SET([(self.courtyard, [])])
+        return SHAPE_POLY_SET()
+
+    def GetBoundingBox(self, *args):
+        points = list(self.courtyard)
+        for pad in self.pads:
+            points.extend(pad.points)
+        return _points_box(points or [(self.position.x, self.position.y)])
+
+
+class PCB_SHAPE(_Item):
+    def __init__(self, shape, start, end, layer=Edge_Cuts, mid=None, radius=0, polygons=(), uuid=None):
+        super().__init__(uuid)
+        self.shape = shape
+        self.start = start
+        self.end = end
+        self.layer = layer
+        self.mid = mid
+        self.radius = radius
+        self.polygons = polygons
+
+    def GetClass(self):
+        return "PCB_SHAPE"
+
+    def GetShape(self):
+        return self.shape
+
+    def GetLayer(self):
+        return self.layer
+
+    def GetStart(self):
+        return self.start
+
+    def GetEnd(self):
+        return self.end
+
+    def GetCenter(self):
+        return self.start
+
+    def GetRadius(self):
+        return self.radius
+
+    def GetArcMid(self):
+        return self.mid
+
+    def GetPolyShape(self):
+        return SHAPE_POLY_SET(self.polygons)
+
+    def GetBoundingBox(self):
+        if self.shape == SHAPE_T_CIRCLE:
+            return BOX2I(self.start.x - self.radius, self.start.y - self.radius,
+                         self.start.x + self.radius, self.start.y + self.radius)
+        if self.shape == SHAPE_T_POLY:
+            return self.GetPolyShape().BBox()
+        points = [(self.start.x, self.start.y), (self.end.x, self.end.y)]
+        if self.mid is not None:
+            points.append((self.mid.x, self.mid.y))
+        return _points_box(points)
+
+
+class ZONE(_Connected):
+    def __init__(self, polygons, net, layers, board=None, uuid=None, name='', fills=None, rule_area=False,
+                 allow_vias=True):
+        """fillsは{層ID: [(外周, [穴, ...]), ...]}の塗りつぶし形状（Noneなら未塗りつぶし）
+
+        rule_areaならルールエリア（allow_viasがFalseならVIA禁止のキープアウト）。
+        """
+        super().__init__(net, board, uuid)
+        self.outline = SHAPE_POLY_SET(polygons)
+        self.layers = list(layers)
+        self.name = name
+        self.fills = None if fills is None else {layer: SHAPE_POLY_SET(value) for layer, value in fills.items()}
+        self.rule_area = rule_area
+        self.allow_vias = allow_vias
+
+    def GetIsRuleArea(self):
+        return self.rule_area
+
+    def GetDoNotAllowVias(self):
+        return self.rule_area and not self.allow_vias
+
+    def GetZoneName(self):
+        return self.name
+
+    def GetLayer(self):
+        return self.layers[0]
+
+    def GetLayerSet(self):
+        return LSET(self.layers)
+
+    def IsOnLayer(self, layer_id):
+        return layer_id in self.layers
+
+    def Outline(self):
+        return self.outline
+
+    def IsFilled(self):
+        return self.fills is not None
+
+    def GetFilledPolysList(self, layer_id):
+        return self.fills.get(layer_id, SHAPE_POLY_SET()) if self.fills is not None else SHAPE_POLY_SET()
+
+    def GetBoundingBox(self):
+        return self.outline.BBox()
+
+    def HitTestFilledArea(self, layer, position, accuracy=0):
+        shape = self.fills.get(layer) if self.fills is not None else self.outline
+        return layer in self.layers and shape is not None and shape.Distance(position) <= accuracy
+
+
+class _DesignSettings:
+    def __init__(self, min_clearance):
+        self.m_MinClearance = min_clearance
+
+
+class BOARD:
+    def __init__(self, copper_count=2, file_name=''):
+        inner = [inner_layer(index) for index in range(1, copper_count - 1)]
+        self.copper_ids = [F_Cu] + inner + [B_Cu]
+        self.layer_names = {F_Cu: 'F.Cu', B_Cu: 'B.Cu', Edge_Cuts: 'Edge.Cuts', F_CrtYd: 'F.Courtyard',
+                            B_CrtYd: 'B.Courtyard'}
+        self.layer_names.update((inner_layer(index), f'In{index}.Cu') for index in range(1, copper_count - 1))
+        self.file_name = file_name
+        self.nets = {0: NETINFO_ITEM(0, "", NETCLASS('Default', FromMM(0.2)))}
+        self.tracks = []
+        self.footprints = []
+        self.drawings = []
+        self.zones = []
+        self.min_clearance = 0
+
+    def GetFileName(self):
+        return self.file_name
+
+    def GetEnabledLayers(self):
+        return LSET(self.copper_ids + [Edge_Cuts, F_CrtYd, B_CrtYd])
+
+    def GetLayerName(self, layer_id):
+        return self.layer_names.get(layer_id, str(layer_id))
+
+    def GetNetsByNetcode(self):
+        return self.nets
+
+    def GetDesignSettings(self):
+        return _DesignSettings(self.min_clearance)
+
+    def GetTracks(self):
+        return self.tracks
+
+    def GetFootprints(self):
+        return self.footprints
+
+    def GetDrawings(self):
+        return self.drawings
+
+    def Zones(self):
+        return self.zones
+
+    def Groups(self):
+        return []
+
+    def GetBoardEdgesBoundingBox(self):
+        boxes = [drawing.GetBoundingBox() for drawing in self.drawings if drawing.GetLayer() == Edge_Cuts]
+        if not boxes:
+            return BOX2I(0, 0, 0, 0)
+        return BOX2I(min(box.x0 for box in boxes), min(box.y0 for box in boxes),
+                     max(box.x1 for box in boxes), max(box.y1 for box in boxes))
+
+    def Add(self, item):
+        if isinstance(item, (PCB_TRACK, PCB_VIA)):
+            self.tracks.append(item)
+        elif isinstance(item, FOOTPRINT):
+            self.footprints.append(item)
+        elif isinstance(item, ZONE):
+            self.zones.append(item)
+        else:
+            self.drawings.append(item)
+
+    def Remove(self, item):
+        self.tracks.remove(item)
+
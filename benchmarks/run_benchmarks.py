@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""合成基板でのベンチマーク（KiCad不要）
+
+pcbnew_stubとsynthetic_boardで大きさの違う基板を作り、ステージごと（フィンガープリント、
+形状の抽出、前処理、チェック、VIA同士の衝突の解消）の処理時間、VIA/秒、メモリのピークを記録する。
+メモリはtracemallocで別に1回実行して測る（時間には影響させない）。--verifyで選んだ数のVIAを
+総当たりの参照実装（oracle.py）と照合し、一致しなければ終了コード1を返す。
+
+    python benchmarks/run_benchmarks.py [--sizes 1000,10000,50000] [--seed 1] [--output result.csv]
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import pcbnew_stub
+pcbnew_stub.install()
+
+from via_cleaner_core import (DEFAULT_SETTINGS, ViaChecker, board_fingerprint, copper_layers, extract_geometry,
+                              via_record)
+from synthetic_board import board_vias, generate_board
+from oracle import conflict_violations, reference_reasons
+
+# --classesで使うネットクラス（mm）
+NET_CLASSES = {'Default': 0.2, 'Power': 0.3, 'HV': 0.5}
+
+
+def run_stages(size, args, settings, trace_memory):
+    """1つの大きさの基板で各ステージを実行し、(ステージ名, 秒, メモリのピーク(バイト), 結果)のリストを返す"""
+    results = []
+
+    def stage(name, function):
+        if trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start_time = time.perf_counter()
+        value = function()
+        elapsed = time.perf_counter() - start_time
+        peak = tracemalloc.get_traced_memory()[1] - base if trace_memory else None
+        results.append((name, elapsed, peak))
+        return value
+
+    board = stage('generate', lambda: generate_board(
+        vias=size, copper_layers=args.layers, seed=args.seed,
+        net_classes=NET_CLASSES if args.classes else None))
+    vias = board_vias(board)
+    stage('fingerprint', lambda: board_fingerprint(board, settings))
+    geometry = stage('extract_geometry', lambda: extract_geometry(board, settings))
+    copper = copper_layers(board)
+    records = [via_record(via, copper) for via in vias]
+    checker = ViaChecker()
+    checker.excluded_rows = checker._selected_rows(geometry, records, settings)
+    stage('prepare', lambda: checker.prepare(geometry, settings))
+    reasons = stage('check', lambda: checker.check_chunk(records))
+    final, summary = stage('resolve_conflicts',
+                           lambda: checker.resolve_conflicts(geometry, records, reasons, settings))
+    return results, (geometry, records, reasons, final, summary)
+
+
+def verify(geometry, records, reasons, final, settings, count, seed):
+    """選んだVIAをoracleと照合し、(調べた数, 削除理由の不一致数, 衝突解消の誤り数)を返す"""
+    rng = random.Random(seed)
+    indices = sorted(rng.sample(range(len(records)), min(count, len(records))))
+    expected = reference_reasons(geometry, [records[i] for i in indices], settings, records)
+    mismatches = sum(1 for i, reason in zip(indices, expected) if reasons[i] != reason)
+    overlapping, needless = conflict_violations(geometry, records, final, settings, indices)
+    return len(indices), mismatches, overlapping + needless
+
+
+def write_rows(rows, path):
+    """結果を.csvならCSV、それ以外はJSONで保存"""
+    if path.lower().endswith('.csv'):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,50000', help='VIA数（カンマ区切り）')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--layers', type=int, default=4, help='銅箔層数')
+    parser.add_argument('--classes', action='store_true', help='ネットクラス（クリアランス違い）を割り当てる')
+    parser.add_argument('--precise', action='store_true', help='部品をパッド形状とコートヤードで判定')
+    parser.add_argument('--zone-fills', action='store_true', help='ゾーンを塗りつぶし形状で判定')
+    parser.add_argument('--verify', type=int, default=200, help='参照実装と照合するVIA数（0で照合しない）')
+    parser.add_argument('--no-memory', action='store_true', help='メモリのピークを測らない')
+    parser.add_argument('--output', help='結果の出力先（.csvならCSV、それ以外はJSON）')
+    args = parser.parse_args()
+
+    settings = dict(DEFAULT_SETTINGS, precise_components=args.precise, use_zone_fills=args.zone_fills, workers=1)
+    rows = []
+    failed = False
+    for size in [int(value) for value in args.sizes.split(',')]:
+        timings, (geometry, records, reasons, final, summary) = run_stages(size, args, settings, False)
+        peaks = {}
+        if not args.no_memory:
+            tracemalloc.start()
+            try:
+                peaks = {name: peak for name, elapsed, peak in run_stages(size, args, settings, True)[0]}
+            finally:
+                tracemalloc.stop()
+
+        print(f"VIA {len(records)}個, 配線 {len(geometry.tracks)}本, 部品 {len(geometry.footprints)}個, "
+              f"ゾーン {len(geometry.zones)}個, 削除 {sum(1 for reason in final if reason)}個 "
+              f"(VIA同士の衝突で残した数: {summary['kept'] if summary else 0})")
+        for name, elapsed, peak in timings:
+            rate = len(records) / elapsed if elapsed > 0 and name != 'generate' else None
+            peak = peaks.get(name)
+            rows.append({'vias': len(records), 'stage': name, 'seconds': round(elapsed, 4),
+                         'vias_per_second': round(rate) if rate else '',
+                         'peak_mb': round(peak / (1024 * 1024), 2) if peak is not None else ''})
+            print(f"  {name:<18} {elapsed:8.3f}秒  "
+                  f"{(f'{rate:,.0f} VIA/秒' if rate else ''):>16}  "
+                  f"{(f'{peak / (1024 * 1024):.1f}MB' if peak is not None else ''):>9}")
+
+        if args.verify:
+            start_time = time.perf_counter()
+            checked, mismatches, conflicts = verify(geometry, records, reasons, final, settings, args.verify,
+                                                    args.seed)
+            print(f"  参照実装との照合: {checked}個中 不一致 {mismatches}個, 衝突解消の誤り {conflicts}個 "
+                  f"({time.perf_counter() - start_time:.1f}秒)")
+            failed = failed or mismatches > 0 or conflicts > 0
+
+    if args.output and rows:
+        write_rows(rows, args.output)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
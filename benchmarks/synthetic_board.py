@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""ベンチマーク用の合成基板（pcbnew_stubのBOARD）を乱数の種から再現可能に作る
+
+矩形の基板外形（取り付け穴の円を含む）に、配線・円弧、部品（パッドとコートヤード）、
+ゾーン（穴あり、塗りつぶし済み）、ルールエリア、VIA（4層以上なら一部をブラインドVIAに）をランダムに置く。
+同じ引数なら同じ基板（UUIDを含む）になる。
+
+    import pcbnew_stub
+    pcbnew_stub.install()
+    from synthetic_board import generate_board
+    board = generate_board(vias=10000, tracks=30000, zones=8, footprints=500, nets=200, seed=1)
+"""
+
+import math
+import random
+
+import pcbnew_stub as pcbnew
+
+# 密度の目安: 1VIAあたりの基板面積 (mm^2)
+AREA_PER_VIA = 6.0
+
+
+def generate_board(vias=1000, tracks=None, zones=None, footprints=None, nets=None, copper_layers=4, seed=1,
+                   net_classes=None, mounting_holes=4, knockouts=40, keepouts=4):
+    """合成基板を作る（省略した数はVIA数から決める）
+
+    net_classesは{クラス名: クリアランス(mm)}。指定すると各ネットをランダムに割り当てる（省略時は全てDefault 0.2mm）。
+    ゾーンは塗りつぶし済みで、塗りつぶし形状には外形の穴のほかにknockouts個の小さな抜き（他ネットの逃げ）を開ける。
+    keepouts個のルールエリアを置き、1つおきにVIA禁止にする（それ以外は配線だけを禁止）。
+    """
+    tracks = vias if tracks is None else tracks
+    zones = max(4, vias // 2000) if zones is None else zones
+    footprints = vias // 40 if footprints is None else footprints
+    nets = max(10, vias // 50) if nets is None else nets
+    rng = random.Random(seed)
+    board = pcbnew.BOARD(copper_layers)
+    copper = board.copper_ids
+    side = math.sqrt(max(vias, 1) * AREA_PER_VIA)
+    width = pcbnew.FromMM(side)
+    height = pcbnew.FromMM(side * 0.75)
+    counter = [0]
+
+    def uuid():
+        counter[0] += 1
+        return f"00000000-0000-4000-8000-{seed:04x}{counter[0]:08x}"
+
+    def point(margin=0.0):
+        # 基板の外側にも少しはみ出させて、基板外・エッジのチェックにも掛かるようにする
+        return (rng.uniform(-margin, side + margin), rng.uniform(-margin, side * 0.75 + margin))
+
+    def net():
+        return rng.randint(1, nets)
+
+    classes = [pcbnew.NETCLASS('Default', pcbnew.FromMM(0.2))]
+    if net_classes:
+        classes = [pcbnew.NETCLASS(name, pcbnew.FromMM(clearance)) for name, clearance in net_classes.items()]
+    for code in range(1, nets + 1):
+        board.nets[code] = pcbnew.NETINFO_ITEM(code, f"N{code}", rng.choice(classes) if net_classes else classes[0])
+
+    # 基板外形と取り付け穴
+    corners = [(0, 0), (width, 0), (width, height), (0, height)]
+    for (x1, y1), (x2, y2) in zip(corners, corners[1:] + corners[:1]):
+        board.Add(pcbnew.PCB_SHAPE(pcbnew.SHAPE_T_SEGMENT, pcbnew.VECTOR2I(x1, y1), pcbnew.VECTOR2I(x2, y2),
+                                   uuid=uuid()))
+    for _ in range(mounting_holes):
+        x, y = point()
+        radius = pcbnew.FromMM(rng.uniform(1.0, 2.0))
+        board.Add(pcbnew.PCB_SHAPE(pcbnew.SHAPE_T_CIRCLE, pcbnew.VECTOR2I(pcbnew.FromMM(x), pcbnew.FromMM(y)),
+                                   pcbnew.VECTOR2I(pcbnew.FromMM(x) + radius, pcbnew.FromMM(y)), radius=radius,
+                                   uuid=uuid()))
+
+    # 配線（1割は円弧）
+    for _ in range(tracks):
+        x, y = point(1.0)
+        length = rng.uniform(0.5, 8.0)
+        angle = rng.choice((0.0, 0.25, 0.5, 0.75)) * math.pi + rng.choice((0.0, math.pi))
+        x2 = x + length * math.cos(angle)
+        y2 = y + length * math.sin(angle)
+        track_width = pcbnew.FromMM(rng.choice((0.1, 0.15, 0.2, 0.25, 0.4)))
+        layer = rng.choice(copper)
+        start = pcbnew.VECTOR2I(pcbnew.FromMM(x), pcbnew.FromMM(y))
+        end = pcbnew.VECTOR2I(pcbnew.FromMM(x2), pcbnew.FromMM(y2))
+        if rng.random() < 0.1:
+            bulge = length * rng.uniform(0.1, 0.4)
+            mid = pcbnew.VECTOR2I(pcbnew.FromMM((x + x2) / 2 - bulge * math.sin(angle)),
+                                  pcbnew.FromMM((y + y2) / 2 + bulge * math.cos(angle)))
+            board.Add(pcbnew.PCB_ARC(start, mid, end, track_width, net(), layer, board, uuid()))
+        else:
+            board.Add(pcbnew.PCB_TRACK(start, end, track_width, net(), layer, board, uuid()))
+
+    # 部品（表面実装は表層だけ、3割は全層のスルーホール。縦長のスルーホールパッドの穴は長穴）
+    for _ in range(footprints):
+        x, y = point()
+        pad_count = rng.choice((2, 2, 3, 4, 8, 16))
+        pitch = rng.choice((0.5, 0.65, 1.27, 2.54))
+        pad_width = pitch * 0.6
+        pad_height = rng.uniform(0.6, 2.0)
+        through_hole = rng.random() < 0.3
+        layer = rng.choice((pcbnew.F_Cu, pcbnew.B_Cu))
+        pad_layers = copper if through_hole else [layer]
+        rows = 1 if pad_count <= 3 else 2
+        per_row = -(-pad_count // rows)
+        drill = (0, 0)
+        if through_hole:
+            drill_width = pcbnew.FromMM(min(pad_width, pad_height) * 0.6)
+            drill = (drill_width, max(drill_width, pcbnew.FromMM(pad_height * 0.6)) if pad_height > 2 * pad_width
+                     else drill_width)
+        pads = []
+        for index in range(pad_count):
+            row, column = divmod(index, per_row)
+            cx = x + (column - (per_row - 1) / 2) * pitch
+            cy = y + (row - (rows - 1) / 2) * (pad_height + 1.0)
+            points = [(pcbnew.FromMM(cx - pad_width / 2), pcbnew.FromMM(cy - pad_height / 2)),
+                      (pcbnew.FromMM(cx + pad_width / 2), pcbnew.FromMM(cy - pad_height / 2)),
+                      (pcbnew.FromMM(cx + pad_width / 2), pcbnew.FromMM(cy + pad_height / 2)),
+                      (pcbnew.FromMM(cx - pad_width / 2), pcbnew.FromMM(cy + pad_height / 2))]
+            pads.append(pcbnew.PAD(points, net() if rng.random() < 0.8 else 0, pad_layers, board, uuid(), drill))
+        half_x = per_row * pitch / 2 + 0.5
+        half_y = rows * (pad_height + 1.0) / 2 + 0.5
+        courtyard = [(pcbnew.FromMM(x - half_x), pcbnew.FromMM(y - half_y)),
+                     (pcbnew.FromMM(x + half_x), pcbnew.FromMM(y - half_y)),
+                     (pcbnew.FromMM(x + half_x), pcbnew.FromMM(y + half_y)),
+                     (pcbnew.FromMM(x - half_x), pcbnew.FromMM(y + half_y))]
+        board.Add(pcbnew.FOOTPRINT(pcbnew.VECTOR2I(pcbnew.FromMM(x), pcbnew.FromMM(y)), pads, courtyard, layer,
+                                   uuid()))
+
+    # ゾーン（矩形の外周に矩形の穴を1つ）
+    for index in range(zones):
+        x, y = point()
+        zone_width = rng.uniform(side * 0.1, side * 0.4)
+        zone_height = rng.uniform(side * 0.1, side * 0.3)
+        outline = _rectangle(x, y, zone_width, zone_height)
+        hole = _rectangle(x + zone_width * 0.4, y + zone_height * 0.4, zone_width * 0.2, zone_height * 0.2)
+        fill_holes = [hole]
+        for _ in range(knockouts):
+            size = rng.uniform(0.6, 2.0)
+            kx = rng.uniform(x, x + zone_width - size)
+            ky = rng.uniform(y, y + zone_height - size)
+            fill_holes.append(_rectangle(kx, ky, size, size))
+        layer = rng.choice(copper)
+        board.Add(pcbnew.ZONE([(outline, [hole])], net(), [layer], board, uuid(), f"Z{index + 1}",
+                              fills={layer: [(outline, _disjoint(fill_holes))]}))
+
+    # ルールエリア（VIA禁止は全層か1層だけ）
+    for index in range(keepouts):
+        x, y = point()
+        size = rng.uniform(2.0, 6.0)
+        layers = copper if rng.random() < 0.5 else [rng.choice(copper)]
+        board.Add(pcbnew.ZONE([(_rectangle(x, y, size, size), [])], 0, layers, board, uuid(), f"K{index + 1}",
+                              rule_area=True, allow_vias=index % 2 == 1))
+
+    # VIA（4層以上なら1割を表層から1つ内側の層までのブラインドVIAに）
+    for _ in range(vias):
+        x, y = point(0.5)
+        diameter = pcbnew.FromMM(rng.choice((0.4, 0.5, 0.6, 0.8)))
+        top, bottom = copper[0], copper[-1]
+        if len(copper) > 2 and rng.random() < 0.1:
+            bottom = copper[1]
+        board.Add(pcbnew.PCB_VIA(pcbnew.VECTOR2I(pcbnew.FromMM(x), pcbnew.FromMM(y)), diameter, net(), top, bottom,
+                                 board=board, uuid=uuid()))
+    return board
+
+
+def _rectangle(x, y, width, height):
+    """左上(x, y) mmの矩形の点列（nm）"""
+    return [(pcbnew.FromMM(x), pcbnew.FromMM(y)), (pcbnew.FromMM(x + width), pcbnew.FromMM(y)),
+            (pcbnew.FromMM(x + width), pcbnew.FromMM(y + height)), (pcbnew.FromMM(x), pcbnew.FromMM(y + height))]
+
+
+def _disjoint(rectangles):
+    """先にある矩形と重なる矩形を除く（塗りつぶしの穴同士は重ならない）"""
+    boxes = []
+    result = []
+    for rectangle in rectangles:
+        (x0, y0), (x1, y1) = rectangle[0], rectangle[2]
+        if all(x1 < bx0 or bx1 < x0 or y1 < by0 or by1 < y0 for bx0, by0, bx1, by1 in boxes):
+            boxes.append((x0, y0, x1, y1))
+            result.append(rectangle)
+    return result
+
+
+def board_vias(board):
+    """基板上の全VIA"""
+    return [item for item in board.GetTracks() if item.Type() == pcbnew.PCB_VIA_T]
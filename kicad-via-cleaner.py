@@ -3,55 +3,47 @@
 
 import os
 import sys
+
+# チェック処理（via_cleaner_core.py）は同じディレクトリから読み込む
+plugin_dir = os.path.dirname(os.path.abspath(__file__))
+if plugin_dir not in sys.path:
+    sys.path.insert(0, plugin_dir)
+
+if __name__ == '__main__':
+    # コマンドライン実行（wxを読み込まずにチェック処理だけを使う）
+    from via_cleaner_core import main
+    sys.exit(main())
+
 import wx
 import pcbnew
 import time
-import math
-import json
-from collections import defaultdict
-from typing import List, Tuple, Dict, Set
 
-class SpatialIndex:
-    """空間インデックスによる高速近隣検索"""
-    def __init__(self, grid_size=1000000):  # 1mm単位のグリッド
-        self.grid_size = grid_size
-        self.grid = defaultdict(list)
-    
-    def add_item(self, x, y, item):
-        grid_x = x // self.grid_size
-        grid_y = y // self.grid_size
-        self.grid[(grid_x, grid_y)].append((x, y, item))
-    
-    def get_nearby_items(self, x, y, radius):
-        grid_x = x // self.grid_size
-        grid_y = y // self.grid_size
-        grid_radius = (radius // self.grid_size) + 1
-        
-        nearby_items = []
-        for gx in range(grid_x - grid_radius, grid_x + grid_radius + 1):
-            for gy in range(grid_y - grid_radius, grid_y + grid_radius + 1):
-                nearby_items.extend(self.grid.get((gx, gy), []))
-        
-        return nearby_items
+from via_cleaner_core import (DEFAULT_SETTINGS, IU_PER_MM, SETTINGS_FILE, CheckCancelled, CheckProfile,
+                              count_reasons, find_vias, load_settings, load_verdicts, open_cache, open_violation_writer,
+                              profile_stage, remove_vias, run_board_check, save_settings, save_verdicts)
+
+# 削除理由の表示名
+REASON_LABELS = {
+    "outside_board": "基板外VIA",
+    "keepout_violation": "VIA禁止エリア",
+    "component_collision": "部品衝突",
+    "net_collision": "ネット衝突",
+    "drill_collision": "穴の間隔",
+    "board_edge_collision": "基板エッジ衝突",
+    "zone_collision": "ゾーン衝突",
+    "via_conflict": "VIA同士の衝突",
+    "thinned": "間引き"
+}
 
 class ViaCleanerDialog(wx.Dialog):
     def __init__(self, parent):
-        wx.Dialog.__init__(self, parent, title="VIA クリーナー（高速化版）", size=(380, 340))
+        wx.Dialog.__init__(self, parent, title="VIA クリーナー（高速化版）", size=(380, 525))
         
         # デフォルト設定
-        self.default_settings = {
-            'clearance': 0.2,
-            'board_edge_clearance': 0.3,
-            'zone_clearance': 0.2,
-            'check_components': True,
-            'check_nets': True,
-            'check_board_edge': True,
-            'check_zones': True,
-            'check_outside_board': True
-        }
+        self.default_settings = dict(DEFAULT_SETTINGS)
         
         # 設定ファイルのパス
-        self.settings_file = os.path.join(os.path.dirname(__file__), 'via_cleaner_settings.json')
+        self.settings_file = SETTINGS_FILE
         
         # 設定を読み込み
         self.load_settings()
@@ -65,7 +57,7 @@ class ViaCleanerDialog(wx.Dialog):
         values_sizer = wx.StaticBoxSizer(values_box, wx.VERTICAL)
         
         # グリッドレイアウトで数値設定を整理
-        grid_sizer = wx.FlexGridSizer(3, 2, 5, 10)
+        grid_sizer = wx.FlexGridSizer(4, 2, 5, 10)
         grid_sizer.AddGrowableCol(1, 1)
         
         # 最小クリアランス
@@ -86,6 +78,12 @@ class ViaCleanerDialog(wx.Dialog):
         grid_sizer.Add(zone_label, flag=wx.ALIGN_CENTER_VERTICAL)
         grid_sizer.Add(self.zone_ctrl, flag=wx.EXPAND)
         
+        # 穴の縁どうしの間隔
+        hole_label = wx.StaticText(main_panel, label="穴の間隔:")
+        self.hole_to_hole_ctrl = wx.TextCtrl(main_panel, value=str(self.hole_to_hole), size=(80, -1))
+        grid_sizer.Add(hole_label, flag=wx.ALIGN_CENTER_VERTICAL)
+        grid_sizer.Add(self.hole_to_hole_ctrl, flag=wx.EXPAND)
+        
         values_sizer.Add(grid_sizer, flag=wx.EXPAND|wx.ALL, border=10)
         
         # ===== チェックオプション部分 =====
@@ -93,7 +91,7 @@ class ViaCleanerDialog(wx.Dialog):
         options_sizer = wx.StaticBoxSizer(options_box, wx.VERTICAL)
         
         # チェックボックスを2列に配置
-        checkbox_grid = wx.FlexGridSizer(3, 2, 5, 10)
+        checkbox_grid = wx.FlexGridSizer(6, 2, 5, 10)
         checkbox_grid.AddGrowableCol(0, 1)
         checkbox_grid.AddGrowableCol(1, 1)
         
@@ -117,11 +115,68 @@ class ViaCleanerDialog(wx.Dialog):
         self.check_outside_board.SetValue(self.check_outside_board_value)
         checkbox_grid.Add(self.check_outside_board, flag=wx.EXPAND)
         
-        # 空のスペースを追加してバランスを取る
-        checkbox_grid.Add(wx.StaticText(main_panel, label=""), flag=wx.EXPAND)
+        self.precise_components = wx.CheckBox(main_panel, label="部品形状で判定")
+        self.precise_components.SetToolTip("部品の外形ボックスではなく、パッド形状とコートヤードで衝突を判定します")
+        self.precise_components.SetValue(self.precise_components_value)
+        checkbox_grid.Add(self.precise_components, flag=wx.EXPAND)
+        
+        self.use_design_rules = wx.CheckBox(main_panel, label="ネットクラス・ルール")
+        self.use_design_rules.SetToolTip("異なるネットとのクリアランスに、ネットクラスとカスタムルールの値を使います"
+                                         "（設定の無いネットは最小クリアランス）")
+        self.use_design_rules.SetValue(self.use_design_rules_value)
+        checkbox_grid.Add(self.use_design_rules, flag=wx.EXPAND)
+        
+        self.resolve_via_conflicts = wx.CheckBox(main_panel, label="VIA同士は片方を残す")
+        self.resolve_via_conflicts.SetToolTip("選択したVIA同士が衝突する場合、両方ではなく必要な分だけ削除します")
+        self.resolve_via_conflicts.SetValue(self.resolve_via_conflicts_value)
+        checkbox_grid.Add(self.resolve_via_conflicts, flag=wx.EXPAND)
+        
+        self.use_zone_fills = wx.CheckBox(main_panel, label="ゾーンの塗りつぶしで判定")
+        self.use_zone_fills.SetToolTip("ゾーンの外形ではなく、塗りつぶされた銅箔との距離で判定します"
+                                       "（逃げやサーマル、削除された島の中のVIAを残せます。未塗りつぶしのゾーンは外形で判定）")
+        self.use_zone_fills.SetValue(self.use_zone_fills_value)
+        checkbox_grid.Add(self.use_zone_fills, flag=wx.EXPAND)
+        
+        self.check_keepouts = wx.CheckBox(main_panel, label="VIA禁止エリア")
+        self.check_keepouts.SetToolTip("VIAを禁止したルールエリア（キープアウト）に掛かるVIAを、ネットによらず削除します")
+        self.check_keepouts.SetValue(self.check_keepouts_value)
+        checkbox_grid.Add(self.check_keepouts, flag=wx.EXPAND)
+        
+        self.check_drills = wx.CheckBox(main_panel, label="穴の間隔")
+        self.check_drills.SetToolTip("VIAの穴と、他のVIA・スルーホールパッドの穴の縁どうしの間隔が"
+                                     "「穴の間隔」より狭いVIAを、ネットによらず削除します")
+        self.check_drills.SetValue(self.check_drills_value)
+        checkbox_grid.Add(self.check_drills, flag=wx.EXPAND)
         
         options_sizer.Add(checkbox_grid, flag=wx.EXPAND|wx.ALL, border=10)
         
+        # ===== 間引き部分 =====
+        thinning_box = wx.StaticBox(main_panel, label="スティッチングVIAの間引き")
+        thinning_sizer = wx.StaticBoxSizer(thinning_box, wx.HORIZONTAL)
+        
+        self.thin_stitching = wx.CheckBox(main_panel, label="間引く")
+        self.thin_stitching.SetToolTip("チェックを通った選択VIAのうち、最も多いネット（設定ファイルのthinning_netで指定可）の"
+                                       "VIAを最小間隔まで減らします")
+        self.thin_stitching.SetValue(self.thin_stitching_value)
+        pitch_label = wx.StaticText(main_panel, label="最小間隔 (mm):")
+        self.thinning_pitch_ctrl = wx.TextCtrl(main_panel, value=str(self.thinning_pitch), size=(80, -1))
+        
+        thinning_sizer.Add(self.thin_stitching, flag=wx.ALIGN_CENTER_VERTICAL|wx.RIGHT, border=10)
+        thinning_sizer.AddStretchSpacer()
+        thinning_sizer.Add(pitch_label, flag=wx.ALIGN_CENTER_VERTICAL|wx.RIGHT, border=5)
+        thinning_sizer.Add(self.thinning_pitch_ctrl)
+        
+        # ===== プレビュー部分 =====
+        preview_box = wx.BoxSizer(wx.HORIZONTAL)
+        
+        preview_button = wx.Button(main_panel, wx.ID_PREVIEW, "プレビュー")
+        preview_button.SetToolTip("削除せずに、削除対象のVIAを選択状態にして削除理由ごとの件数を表示します")
+        apply_button = wx.Button(main_panel, wx.ID_APPLY, "プレビューを適用")
+        apply_button.SetToolTip("前回のプレビューの結果をチェックし直さずに削除します（プレビュー後に基板が変わっていない場合）")
+        
+        preview_box.Add(preview_button, flag=wx.RIGHT, border=5)
+        preview_box.Add(apply_button)
+        
         # ===== ボタン部分 =====
         button_box = wx.BoxSizer(wx.HORIZONTAL)
         
@@ -140,6 +195,8 @@ class ViaCleanerDialog(wx.Dialog):
         # メイン配置
         main_sizer.Add(values_sizer, flag=wx.EXPAND|wx.ALL, border=10)
         main_sizer.Add(options_sizer, flag=wx.EXPAND|wx.LEFT|wx.RIGHT|wx.BOTTOM, border=10)
+        main_sizer.Add(thinning_sizer, flag=wx.EXPAND|wx.LEFT|wx.RIGHT|wx.BOTTOM, border=10)
+        main_sizer.Add(preview_box, flag=wx.EXPAND|wx.LEFT|wx.RIGHT, border=15)
         main_sizer.Add(button_box, flag=wx.EXPAND|wx.ALL, border=15)
         
         main_panel.SetSizer(main_sizer)
@@ -147,6 +204,8 @@ class ViaCleanerDialog(wx.Dialog):
         # イベントバインディング 
         ok_button.Bind(wx.EVT_BUTTON, self.on_ok)
         reset_button.Bind(wx.EVT_BUTTON, self.on_reset)
+        preview_button.Bind(wx.EVT_BUTTON, self.on_preview)
+        apply_button.Bind(wx.EVT_BUTTON, self.on_apply)
         
         # ダイアログを中央に配置
         self.Center()
@@ -155,18 +214,26 @@ class ViaCleanerDialog(wx.Dialog):
         """設定を読み込み"""
         try:
             if os.path.exists(self.settings_file):
-                with open(self.settings_file, 'r', encoding='utf-8') as f:
-                    settings = json.load(f)
-                
                 # 設定値を適用（存在しない場合はデフォルト値を使用）
+                settings = load_settings(self.settings_file)
+                self.settings = settings
                 self.clearance = settings.get('clearance', self.default_settings['clearance'])
                 self.board_edge_clearance = settings.get('board_edge_clearance', self.default_settings['board_edge_clearance'])
                 self.zone_clearance = settings.get('zone_clearance', self.default_settings['zone_clearance'])
+                self.hole_to_hole = settings.get('hole_to_hole', self.default_settings['hole_to_hole'])
                 self.check_components_value = settings.get('check_components', self.default_settings['check_components'])
                 self.check_nets_value = settings.get('check_nets', self.default_settings['check_nets'])
                 self.check_board_edge_value = settings.get('check_board_edge', self.default_settings['check_board_edge'])
                 self.check_zones_value = settings.get('check_zones', self.default_settings['check_zones'])
                 self.check_outside_board_value = settings.get('check_outside_board', self.default_settings['check_outside_board'])
+                self.precise_components_value = settings.get('precise_components', self.default_settings['precise_components'])
+                self.use_design_rules_value = settings.get('use_design_rules', self.default_settings['use_design_rules'])
+                self.resolve_via_conflicts_value = settings.get('resolve_via_conflicts', self.default_settings['resolve_via_conflicts'])
+                self.use_zone_fills_value = settings.get('use_zone_fills', self.default_settings['use_zone_fills'])
+                self.check_keepouts_value = settings.get('check_keepouts', self.default_settings['check_keepouts'])
+                self.check_drills_value = settings.get('check_drills', self.default_settings['check_drills'])
+                self.thin_stitching_value = settings.get('thin_stitching', self.default_settings['thin_stitching'])
+                self.thinning_pitch = settings.get('thinning_pitch', self.default_settings['thinning_pitch'])
             else:
                 # 設定ファイルが存在しない場合はデフォルト値を使用
                 self.reset_to_defaults()
@@ -176,37 +243,58 @@ class ViaCleanerDialog(wx.Dialog):
                          "警告", wx.OK | wx.ICON_WARNING)
             self.reset_to_defaults()
     
+    def get_settings(self):
+        """ダイアログの設定値（ダイアログに無い項目は設定ファイルの値を引き継ぐ）"""
+        settings = dict(self.settings)
+        settings.update({
+            'clearance': self.clearance,
+            'board_edge_clearance': self.board_edge_clearance,
+            'zone_clearance': self.zone_clearance,
+            'hole_to_hole': self.hole_to_hole,
+            'check_components': self.check_components.GetValue(),
+            'check_nets': self.check_nets.GetValue(),
+            'check_board_edge': self.check_board_edge.GetValue(),
+            'check_zones': self.check_zones.GetValue(),
+            'check_outside_board': self.check_outside_board.GetValue(),
+            'precise_components': self.precise_components.GetValue(),
+            'use_design_rules': self.use_design_rules.GetValue(),
+            'resolve_via_conflicts': self.resolve_via_conflicts.GetValue(),
+            'use_zone_fills': self.use_zone_fills.GetValue(),
+            'check_keepouts': self.check_keepouts.GetValue(),
+            'check_drills': self.check_drills.GetValue(),
+            'thin_stitching': self.thin_stitching.GetValue(),
+            'thinning_pitch': self.thinning_pitch
+        })
+        return settings
+    
     def save_settings(self):
         """設定を保存"""
         try:
-            settings = {
-                'clearance': self.clearance,
-                'board_edge_clearance': self.board_edge_clearance,
-                'zone_clearance': self.zone_clearance,
-                'check_components': self.check_components.GetValue(),
-                'check_nets': self.check_nets.GetValue(),
-                'check_board_edge': self.check_board_edge.GetValue(),
-                'check_zones': self.check_zones.GetValue(),
-                'check_outside_board': self.check_outside_board.GetValue()
-            }
-            
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
-                json.dump(settings, f, indent=2, ensure_ascii=False)
-                
+            save_settings(self.get_settings(), self.settings_file)
         except Exception as e:
             wx.MessageBox(f"設定ファイルの保存に失敗しました。\nエラー: {str(e)}", 
                          "エラー", wx.OK | wx.ICON_ERROR)
     
     def reset_to_defaults(self):
         """デフォルト値に戻す"""
+        self.settings = dict(self.default_settings)
         self.clearance = self.default_settings['clearance']
         self.board_edge_clearance = self.default_settings['board_edge_clearance']
         self.zone_clearance = self.default_settings['zone_clearance']
+        self.hole_to_hole = self.default_settings['hole_to_hole']
         self.check_components_value = self.default_settings['check_components']
         self.check_nets_value = self.default_settings['check_nets']
         self.check_board_edge_value = self.default_settings['check_board_edge']
         self.check_zones_value = self.default_settings['check_zones']
         self.check_outside_board_value = self.default_settings['check_outside_board']
+        self.precise_components_value = self.default_settings['precise_components']
+        self.use_design_rules_value = self.default_settings['use_design_rules']
+        self.resolve_via_conflicts_value = self.default_settings['resolve_via_conflicts']
+        self.use_zone_fills_value = self.default_settings['use_zone_fills']
+        self.check_keepouts_value = self.default_settings['check_keepouts']
+        self.check_drills_value = self.default_settings['check_drills']
+        self.thin_stitching_value = self.default_settings['thin_stitching']
+        self.thinning_pitch = self.default_settings['thinning_pitch']
     
     def on_reset(self, event):
         """デフォルトに戻すボタンのイベント"""
@@ -217,30 +305,100 @@ class ViaCleanerDialog(wx.Dialog):
             self.clearance_ctrl.SetValue(str(self.clearance))
             self.board_edge_ctrl.SetValue(str(self.board_edge_clearance))
             self.zone_ctrl.SetValue(str(self.zone_clearance))
+            self.hole_to_hole_ctrl.SetValue(str(self.hole_to_hole))
             self.check_components.SetValue(self.check_components_value)
             self.check_nets.SetValue(self.check_nets_value)
             self.check_board_edge.SetValue(self.check_board_edge_value)
             self.check_zones.SetValue(self.check_zones_value)
             self.check_outside_board.SetValue(self.check_outside_board_value)
+            self.precise_components.SetValue(self.precise_components_value)
+            self.use_design_rules.SetValue(self.use_design_rules_value)
+            self.resolve_via_conflicts.SetValue(self.resolve_via_conflicts_value)
+            self.use_zone_fills.SetValue(self.use_zone_fills_value)
+            self.check_keepouts.SetValue(self.check_keepouts_value)
+            self.check_drills.SetValue(self.check_drills_value)
+            self.thin_stitching.SetValue(self.thin_stitching_value)
+            self.thinning_pitch_ctrl.SetValue(str(self.thinning_pitch))
             
             wx.MessageBox("設定をデフォルト値に戻しました", "完了", wx.OK | wx.ICON_INFORMATION)
         
     def on_ok(self, event):
+        if self.store_values():
+            event.Skip()  # ダイアログを閉じる
+    
+    def on_preview(self, event):
+        """プレビューボタンのイベント（設定を保存して閉じる。削除はしない）"""
+        if self.store_values():
+            self.EndModal(wx.ID_PREVIEW)
+    
+    def on_apply(self, event):
+        """プレビューを適用ボタンのイベント（保存した判定結果を使うので設定は変えない）"""
+        self.EndModal(wx.ID_APPLY)
+    
+    def store_values(self):
+        """入力されたクリアランスを確認して設定を保存（入力が正しくなければFalse）"""
         try:
             self.clearance = float(self.clearance_ctrl.GetValue())
             self.board_edge_clearance = float(self.board_edge_ctrl.GetValue())
             self.zone_clearance = float(self.zone_ctrl.GetValue())
+            self.hole_to_hole = float(self.hole_to_hole_ctrl.GetValue())
+            self.thinning_pitch = float(self.thinning_pitch_ctrl.GetValue())
             
-            if self.clearance < 0 or self.board_edge_clearance < 0 or self.zone_clearance < 0:
+            if (self.clearance < 0 or self.board_edge_clearance < 0 or self.zone_clearance < 0
+                    or self.hole_to_hole < 0):
                 wx.MessageBox("クリアランスは正の値を入力してください", "エラー", wx.OK | wx.ICON_ERROR)
-                return
+                return False
+            if self.thin_stitching.GetValue() and self.thinning_pitch <= 0:
+                wx.MessageBox("間引きの最小間隔は正の値を入力してください", "エラー", wx.OK | wx.ICON_ERROR)
+                return False
             
             # 設定を保存
             self.save_settings()
-            
-            event.Skip()  # ダイアログを閉じる
+            return True
         except ValueError:
             wx.MessageBox("有効な数値を入力してください", "エラー", wx.OK | wx.ICON_ERROR)
+            return False
+
+def thinning_text(thinning):
+    """間引きの集計（ゾーンごとの削除数）の表示文"""
+    lines = [f"間引き（{thinning['net']}、間隔 {thinning['pitch']:.2f}mm）: "
+             f"{thinning['candidates']} 個中 {thinning['removed']} 個"]
+    lines.extend(f"  ゾーン {zone['name'] or zone['uuid']}: {zone['removed']}個"
+                 for zone in thinning['zones'] if zone['removed'])
+    if thinning['outside_zones']:
+        lines.append(f"  ゾーン外: {thinning['outside_zones']}個")
+    if thinning['protected']:
+        lines.append(f"  島の接続のために残したVIA: {thinning['protected']}個")
+    return "\n".join(lines)
+
+class CheckProgress:
+    """チェック中の進捗ダイアログ（処理速度と残り時間を表示し、キャンセルされたらFalseを返す）
+
+    チェックはメインスレッドで塊ごとに行い、塊の合間のUpdateで画面の更新とキャンセルを受け付ける。
+    """
+    def __init__(self, total):
+        style = wx.PD_APP_MODAL | wx.PD_CAN_ABORT | wx.PD_AUTO_HIDE | wx.PD_ELAPSED_TIME
+        self.dialog = wx.ProgressDialog("VIA クリーナー（高速化版）", "基板を読み込み中...", maximum=max(total, 1),
+                                        style=style)
+        self.start_time = None
+        self.start_done = 0
+    
+    def __call__(self, done, total):
+        now = time.time()
+        if self.start_time is None or done == 0:  # 前処理の時間は処理速度に含めない
+            self.start_time = now
+            self.start_done = done
+        elapsed = now - self.start_time
+        message = f"チェック中: {done} / {total} 個"
+        if done > self.start_done and elapsed > 0:
+            rate = (done - self.start_done) / elapsed
+            message += f"\n{rate:.0f} 個/秒、残り約 {(total - done) / rate:.0f} 秒"
+        self.dialog.SetRange(max(total, 1))
+        keep_going, skip = self.dialog.Update(min(done, total), message)
+        return keep_going
+    
+    def close(self):
+        self.dialog.Destroy()
 
 class OptimizedViaCleaner(pcbnew.ActionPlugin):
     def defaults(self):
@@ -265,329 +423,168 @@ class OptimizedViaCleaner(pcbnew.ActionPlugin):
         
         # ダイアログを表示
         dialog = ViaCleanerDialog(None)
-        if dialog.ShowModal() != wx.ID_OK:
+        action = dialog.ShowModal()
+        if action not in (wx.ID_OK, wx.ID_PREVIEW, wx.ID_APPLY):
             dialog.Destroy()
             return
         
         # 設定取得
-        min_clearance = pcbnew.FromMM(dialog.clearance)
-        board_edge_clearance = pcbnew.FromMM(dialog.board_edge_clearance)
-        zone_clearance = pcbnew.FromMM(dialog.zone_clearance)
-        check_components = dialog.check_components.GetValue()
-        check_nets = dialog.check_nets.GetValue()
-        check_board_edge = dialog.check_board_edge.GetValue()
-        check_zones = dialog.check_zones.GetValue()
-        check_outside_board = dialog.check_outside_board.GetValue()
+        settings = dialog.get_settings()
         dialog.Destroy()
+        cache = open_cache(settings)
+        
+        if action == wx.ID_APPLY:
+            self.apply_preview(board, cache)
+            return
         
         start_time = time.time()
         
-        # 高速化のための前処理
-        spatial_cache = self._build_spatial_cache(board, selected_vias, min_clearance, check_components, check_nets)
-        board_info = self._get_board_info(board, check_board_edge, check_outside_board)
-        zone_info = self._get_zone_info(board, check_zones)
-        
-        # VIAをチェック
-        vias_to_remove = []
-        outside_board_count = 0
-        component_collision_count = 0
-        net_collision_count = 0
-        board_edge_collision_count = 0
-        zone_collision_count = 0
-        
-        for via in selected_vias:
-            removal_reason = self._check_via_fast(via, spatial_cache, board_info, zone_info, 
-                                                min_clearance, board_edge_clearance, zone_clearance,
-                                                check_components, check_nets, check_board_edge, 
-                                                check_zones, check_outside_board)
-            
-            if removal_reason:
-                vias_to_remove.append(via)
-                if removal_reason == "outside_board":
-                    outside_board_count += 1
-                elif removal_reason == "component_collision":
-                    component_collision_count += 1
-                elif removal_reason == "net_collision":
-                    net_collision_count += 1
-                elif removal_reason == "board_edge_collision":
-                    board_edge_collision_count += 1
-                elif removal_reason == "zone_collision":
-                    zone_collision_count += 1
-        
-        # 削除実行
+        # VIAをチェック（チェック処理はvia_cleaner_core）
+        profile = CheckProfile() if settings.get('profile_path') else None
+        violations = self.open_violations(settings)
+        progress = CheckProgress(len(selected_vias))
+        try:
+            geometry, records, reasons, conflicts, thinning = run_board_check(board, selected_vias, settings,
+                                                                              profile, cache, progress, violations)
+        except CheckCancelled:
+            reasons = None
+        finally:
+            progress.close()
+            self.close_violations(violations)
+        self.warn_cache_error(cache)
+        if reasons is None:
+            wx.MessageBox("チェックを中断しました。VIAは削除していません。", "情報", wx.OK | wx.ICON_INFORMATION)
+            return
+        if action == wx.ID_PREVIEW:
+            self.write_profile(profile, settings)
+            self.show_preview(board, settings, cache, selected_vias, records, reasons, thinning,
+                              time.time() - start_time)
+            return
+        vias_to_remove = [via for via, reason in zip(selected_vias, reasons) if reason]
+        reason_counts = count_reasons(reasons)
+        
+        # 削除実行（元に戻す操作はKiCadがプラグインの実行単位で記録する）
         if vias_to_remove:
-            for via in vias_to_remove:
-                board.Remove(via)
+            with profile_stage(profile, 'remove'):
+                remove_vias(board, vias_to_remove)
             
             pcbnew.Refresh()
+            self.write_profile(profile, settings)
             
             end_time = time.time()
             execution_time = end_time - start_time
             
             # 詳細な削除理由を表示
             details = []
-            if outside_board_count > 0:
-                details.append(f"基板外VIA: {outside_board_count}個")
-            if component_collision_count > 0:
-                details.append(f"部品衝突: {component_collision_count}個")
-            if net_collision_count > 0:
-                details.append(f"ネット衝突: {net_collision_count}個")
-            if board_edge_collision_count > 0:
-                details.append(f"基板エッジ衝突: {board_edge_collision_count}個")
-            if zone_collision_count > 0:
-                details.append(f"ゾーン衝突: {zone_collision_count}個")
+            for reason, label in REASON_LABELS.items():
+                if reason_counts[reason] > 0:
+                    details.append(f"{label}: {reason_counts[reason]}個")
             
             detail_text = "\n".join(details) if details else ""
             
             message = f"{len(vias_to_remove)} 個のVIAを削除しました。\n"
             if detail_text:
                 message += f"\n削除理由の詳細:\n{detail_text}\n"
+            if conflicts and conflicts['kept']:
+                message += f"\n衝突の解消で残したVIA: {conflicts['kept']}個\n"
+            if thinning and thinning['removed']:
+                message += "\n" + thinning_text(thinning) + "\n"
             message += f"\n処理時間: {execution_time:.2f}秒"
             
             wx.MessageBox(message, "完了", wx.OK | wx.ICON_INFORMATION)
         else:
+            self.write_profile(profile, settings)
             end_time = time.time()
             execution_time = end_time - start_time
             wx.MessageBox(f"削除するVIAはありませんでした。\n処理時間: {execution_time:.2f}秒", 
                           "情報", wx.OK | wx.ICON_INFORMATION)
     
-    def _build_spatial_cache(self, board, selected_vias, min_clearance, check_components, check_nets):
-        """空間インデックスとキャッシュを構築"""
-        cache = {}
-        
-        # 部品の空間インデックス（シンプル版）
-        if check_components:
-            footprints_list = list(board.GetFootprints())
-            cache['footprints_list'] = footprints_list
-        
-        # トラックの空間インデックス（ネット別）
-        if check_nets:
-            tracks_by_net = defaultdict(lambda: SpatialIndex())
-            for track in board.GetTracks():
-                if track.Type() in [pcbnew.PCB_TRACE_T, pcbnew.PCB_ARC_T, pcbnew.PCB_VIA_T]:
-                    net_code = track.GetNetCode()
-                    if track.Type() == pcbnew.PCB_VIA_T:
-                        pos = track.GetPosition()
-                        tracks_by_net[net_code].add_item(pos.x, pos.y, track)
-                    else:
-                        # トラックの中点を使用
-                        start = track.GetStart()
-                        end = track.GetEnd()
-                        center_x = (start.x + end.x) // 2
-                        center_y = (start.y + end.y) // 2
-                        tracks_by_net[net_code].add_item(center_x, center_y, track)
-            cache['tracks_by_net'] = tracks_by_net
-        
-        return cache
+    def show_preview(self, board, settings, cache, selected_vias, records, reasons, thinning, execution_time):
+        """削除対象のVIAだけを選択状態にし、削除理由ごとの件数と位置の例を表示（基板は変更しない）"""
+        for item in board.GetTracks():
+            if item.IsSelected():
+                item.ClearSelected()
+        for via, reason in zip(selected_vias, reasons):
+            if reason:
+                via.SetSelected()
+        pcbnew.Refresh()
+        
+        removals = sum(1 for reason in reasons if reason)
+        details = []
+        for reason, label in REASON_LABELS.items():
+            positions = [(record.x / IU_PER_MM, record.y / IU_PER_MM)
+                         for record, via_reason in zip(records, reasons) if via_reason == reason]
+            if positions:
+                examples = ", ".join(f"({x:.2f}, {y:.2f})" for x, y in positions[:3])
+                details.append(f"{label}: {len(positions)}個  例: {examples}")
+        
+        message = f"削除対象のVIA: {removals} 個（選択状態にしました。基板は変更していません）\n"
+        if details:
+            message += "\n削除理由ごとの件数と位置 (mm):\n" + "\n".join(details) + "\n"
+        if thinning and thinning['removed']:
+            message += "\n" + thinning_text(thinning) + "\n"
+        if removals and cache is not None and save_verdicts(cache, board, settings, selected_vias, reasons) is not None:
+            message += "\n削除するには、基板を変更せずに再度実行して「プレビューを適用」を押してください。\n"
+        elif removals and cache is not None:
+            message += "\nキャッシュに保存できなかったため、この結果は「プレビューを適用」では使えません。\n"
+        elif removals:
+            message += "\nキャッシュが無効（use_cache）のため、この結果は「プレビューを適用」では使えません。\n"
+        message += f"\n処理時間: {execution_time:.2f}秒"
+        wx.MessageBox(message, "プレビュー", wx.OK | wx.ICON_INFORMATION)
     
-    def _get_board_info(self, board, check_board_edge, check_outside_board):
-        """基板情報を取得"""
-        if not (check_board_edge or check_outside_board):
-            return None
-        
-        board_outlines = []
-        board_bbox = None
-        
-        # 基板アウトライン取得
-        for drawing in board.GetDrawings():
-            if drawing.GetClass() == "PCB_SHAPE" and drawing.GetLayer() == pcbnew.Edge_Cuts:
-                board_outlines.append(drawing)
-        
-        # バウンディングボックス取得
-        if check_outside_board:
-            try:
-                if hasattr(board, "GetBoardEdgesBoundingBox"):
-                    board_bbox = board.GetBoardEdgesBoundingBox()
-                elif hasattr(board, "ComputeBoundingBox"):
-                    board_bbox = board.ComputeBoundingBox(True)
-            except:
-                board_bbox = None
-        
-        return {
-            'outlines': board_outlines,
-            'bbox': board_bbox
-        }
+    def apply_preview(self, board, cache):
+        """前回のプレビューの判定結果でVIAを削除（基板がプレビュー後に変わっていればチェックし直すよう促す）"""
+        start_time = time.time()
+        removals = load_verdicts(cache, board) if cache is not None else None
+        if removals is None:
+            wx.MessageBox("適用できるプレビューがありません。プレビュー後に基板が変更されたか、プレビューを実行していません。\n"
+                          "もう一度プレビューするか、OKでチェックと削除を行ってください。", "情報", wx.OK | wx.ICON_INFORMATION)
+            return
+        vias_to_remove = find_vias(board, removals)
+        if vias_to_remove:
+            remove_vias(board, vias_to_remove)
+            pcbnew.Refresh()
+        counts = count_reasons(removals[via.m_Uuid.AsString()] for via in vias_to_remove)
+        details = [f"{label}: {counts[reason]}個" for reason, label in REASON_LABELS.items() if counts[reason]]
+        message = f"プレビューの結果から {len(vias_to_remove)} 個のVIAを削除しました。\n"
+        if details:
+            message += "\n削除理由の詳細:\n" + "\n".join(details) + "\n"
+        message += f"\n処理時間: {time.time() - start_time:.2f}秒"
+        wx.MessageBox(message, "完了", wx.OK | wx.ICON_INFORMATION)
     
-    def _get_zone_info(self, board, check_zones):
-        """ゾーン情報を取得"""
-        if not check_zones:
+    def open_violations(self, settings):
+        """設定のviolation_path・heatmap_pathへの書き出しを開く（開けなければ書き出さずに続ける）"""
+        try:
+            return open_violation_writer(settings)
+        except OSError as e:
+            wx.MessageBox(f"違反レポートを開けませんでした。書き出さずにチェックします。\nエラー: {str(e)}", "エラー",
+                          wx.OK | wx.ICON_ERROR)
             return None
-        
-        zones = []
-        for zone in board.Zones():
-            zones.append(zone)
-        
-        return {'zones': zones}
     
-    def _check_via_fast(self, via, spatial_cache, board_info, zone_info, 
-                       min_clearance, board_edge_clearance, zone_clearance,
-                       check_components, check_nets, check_board_edge, 
-                       check_zones, check_outside_board):
-        """高速化されたVIAチェック"""
-        via_pos = via.GetPosition()
-        via_net = via.GetNetCode()
-        via_radius = via.GetWidth() // 2
-        
-        # 基板外チェック（最も高速）
-        if check_outside_board and board_info and board_info['bbox']:
-            if not board_info['bbox'].Contains(via_pos):
-                return "outside_board"
-        
-        # 部品との衝突チェック（シンプル版）
-        if check_components and 'footprints_list' in spatial_cache:
-            # 全部品をチェック（シンプルで確実）
-            for footprint in spatial_cache['footprints_list']:
-                bbox = footprint.GetBoundingBox()
-                if bbox.Contains(via_pos):
-                    return "component_collision"
-        
-        # 異なるネットとの衝突チェック（空間インデックス使用）
-        if check_nets and 'tracks_by_net' in spatial_cache:
-            tracks_by_net = spatial_cache['tracks_by_net']
-            search_radius = min_clearance + via_radius * 2  # 余裕を持った検索半径
-            
-            for net_code, track_index in tracks_by_net.items():
-                if net_code == via_net:
-                    continue
-                
-                nearby_tracks = track_index.get_nearby_items(via_pos.x, via_pos.y, search_radius)
-                
-                for track_x, track_y, track in nearby_tracks:
-                    if self._check_track_collision_fast(via, track, min_clearance):
-                        return "net_collision"
-        
-        # 基板エッジとの衝突チェック
-        if check_board_edge and board_info and board_info['outlines']:
-            clearance_needed = board_edge_clearance + via_radius
-            
-            for outline in board_info['outlines']:
-                if self._distance_to_outline_fast(via_pos, outline) < clearance_needed:
-                    return "board_edge_collision"
-        
-        # ゾーンとの衝突チェック
-        if check_zones and zone_info:
-            clearance_needed = zone_clearance + via_radius
-            
-            for zone in zone_info['zones']:
-                if zone.GetNetCode() == via_net:
-                    continue
-                
-                try:
-                    zone_poly = zone.Outline()
-                    if zone_poly.Distance(via_pos) < clearance_needed:
-                        return "zone_collision"
-                except AttributeError:
-                    pass
-        
-        return None  # 削除不要
-    
-    def _check_track_collision_fast(self, via, track, min_clearance):
-        """高速トラック衝突チェック"""
-        via_pos = via.GetPosition()
-        via_radius = via.GetWidth() // 2
-        
-        if track.Type() == pcbnew.PCB_VIA_T:
-            if track == via:
-                return False
-            
-            other_pos = track.GetPosition()
-            other_radius = track.GetWidth() // 2
-            clearance_needed = min_clearance + via_radius + other_radius
-            
-            # 距離の二乗で比較（sqrt計算を回避）
-            dx = via_pos.x - other_pos.x
-            dy = via_pos.y - other_pos.y
-            distance_squared = dx * dx + dy * dy
-            clearance_needed_squared = clearance_needed * clearance_needed
-            
-            return distance_squared < clearance_needed_squared
-        
-        elif track.Type() in [pcbnew.PCB_TRACE_T, pcbnew.PCB_ARC_T]:
-            clearance_needed = min_clearance + via_radius + track.GetWidth() // 2
-            return track.HitTest(via_pos, clearance_needed)
-        
-        return False
-    
-    def _distance_to_outline_fast(self, point, outline):
-        """高速アウトライン距離計算"""
-        if outline.GetShape() == pcbnew.SHAPE_T_SEGMENT:
-            return self._distance_point_to_segment_fast(point, outline.GetStart(), outline.GetEnd())
-        elif outline.GetShape() == pcbnew.SHAPE_T_CIRCLE:
-            center = outline.GetCenter()
-            radius = outline.GetRadius()
-            dx = point.x - center.x
-            dy = point.y - center.y
-            center_distance = math.sqrt(dx*dx + dy*dy)
-            return abs(center_distance - radius)
-        else:
-            # 他の形状は元の処理を使用
-            return self.distance_point_to_segment(point, outline.GetStart(), outline.GetEnd())
+    def close_violations(self, violations):
+        if violations is None:
+            return
+        try:
+            violations.close()
+        except OSError as e:
+            wx.MessageBox(f"ヒートマップの保存に失敗しました。\nエラー: {str(e)}", "エラー", wx.OK | wx.ICON_ERROR)
     
-    def _distance_point_to_segment_fast(self, point, segment_start, segment_end):
-        """高速化された点と線分の距離計算"""
-        segment_vec_x = segment_end.x - segment_start.x
-        segment_vec_y = segment_end.y - segment_start.y
-        
-        segment_length_squared = segment_vec_x * segment_vec_x + segment_vec_y * segment_vec_y
-        
-        if segment_length_squared == 0:
-            dx = point.x - segment_start.x
-            dy = point.y - segment_start.y
-            return math.sqrt(dx*dx + dy*dy)
-        
-        point_vec_x = point.x - segment_start.x
-        point_vec_y = point.y - segment_start.y
-        
-        dot_product = segment_vec_x * point_vec_x + segment_vec_y * point_vec_y
-        t = max(0, min(1, dot_product / segment_length_squared))
-        
-        projection_x = segment_start.x + segment_vec_x * t
-        projection_y = segment_start.y + segment_vec_y * t
-        
-        dx = point.x - projection_x
-        dy = point.y - projection_y
-        return math.sqrt(dx*dx + dy*dy)
+    def warn_cache_error(self, cache):
+        """キャッシュの読み書きに失敗していれば知らせる（チェックはキャッシュ無しで済ませている）"""
+        if cache is None or cache.error is None:
+            return
+        wx.MessageBox(f"前処理結果のキャッシュを読み書きできませんでした。キャッシュを使わずにチェックしました。\n"
+                      f"エラー: {str(cache.error)}", "警告", wx.OK | wx.ICON_WARNING)
+        cache.error = None
     
-    # 元のヘルパーメソッドも保持（互換性のため）
-    def distance_point_to_segment(self, point, segment_start, segment_end):
-        return self._distance_point_to_segment_fast(point, segment_start, segment_end)
+    def write_profile(self, profile, settings):
+        """計測結果を設定のprofile_pathへ書き出す"""
+        if profile is None:
+            return
+        try:
+            profile.write(settings['profile_path'])
+        except OSError as e:
+            wx.MessageBox(f"計測結果の保存に失敗しました。\nエラー: {str(e)}", "エラー", wx.OK | wx.ICON_ERROR)
     
-    def distance_point_to_arc(self, point, arc_center, arc_radius, start_angle_deg, angle_deg):
-        """元の円弧距離計算メソッド"""
-        dx = point.x - arc_center.x
-        dy = point.y - arc_center.y
-        center_to_point = math.sqrt(dx*dx + dy*dy)
-        
-        angle_to_point = math.atan2(dy, dx)
-        angle_to_point_deg = math.degrees(angle_to_point)
-        
-        start_angle_norm = start_angle_deg % 360
-        end_angle_norm = (start_angle_norm + angle_deg) % 360
-        
-        is_in_range = False
-        if start_angle_norm <= end_angle_norm:
-            is_in_range = start_angle_norm <= angle_to_point_deg <= end_angle_norm
-        else:
-            is_in_range = angle_to_point_deg >= start_angle_norm or angle_to_point_deg <= end_angle_norm
-        
-        if is_in_range:
-            return abs(center_to_point - arc_radius)
-        else:
-            start_x = arc_center.x + int(arc_radius * math.cos(math.radians(start_angle_norm)))
-            start_y = arc_center.y + int(arc_radius * math.sin(math.radians(start_angle_norm)))
-            
-            end_x = arc_center.x + int(arc_radius * math.cos(math.radians(end_angle_norm)))
-            end_y = arc_center.y + int(arc_radius * math.sin(math.radians(end_angle_norm)))
-            
-            dx1 = point.x - start_x
-            dy1 = point.y - start_y
-            dist_to_start = math.sqrt(dx1*dx1 + dy1*dy1)
-            
-            dx2 = point.x - end_x
-            dy2 = point.y - end_y
-            dist_to_end = math.sqrt(dx2*dx2 + dy2*dy2)
-            
-            return min(dist_to_start, dist_to_end)
-
 # プラグインの登録
 OptimizedViaCleaner().register()
\ No newline at end of file
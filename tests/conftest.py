@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""テスト共通: リポジトリ直下とbenchmarks（pcbnew_stub・合成基板・参照実装）をimportできるようにする
+
+via_cleaner_coreはimport時にpcbnewを探すので、どのテストよりも先にpcbnew_stubを登録しておく。
+"""
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, ROOT)
+
+import pcbnew_stub  # noqa: E402
+pcbnew_stub.install()
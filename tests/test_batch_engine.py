@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""ClearanceBatchEngineのNumPy版・純Python版と、元の実装のスカラー距離関数での総当たりの一致
+
+基準には元のViaChecker._distance_point_to_segment_fastをそのまま写したものを使う。
+円弧は細かい弦に分けて同じ関数で測る（弦と円弧のずれは0.2nm未満）。
+"""
+
+import math
+import random
+from collections import namedtuple
+
+import pytest
+
+from via_cleaner_core import ClearanceBatchEngine
+
+SIZE = 20000  # 20µm角に配置（nm）
+ARC_CHORDS = 512
+
+Point = namedtuple('Point', 'x y')
+
+
+def _distance_point_to_segment_fast(point, segment_start, segment_end):
+    """高速化された点と線分の距離計算（元のViaCheckerのメソッドの写し）"""
+    segment_vec_x = segment_end.x - segment_start.x
+    segment_vec_y = segment_end.y - segment_start.y
+    
+    segment_length_squared = segment_vec_x * segment_vec_x + segment_vec_y * segment_vec_y
+    
+    if segment_length_squared == 0:
+        dx = point.x - segment_start.x
+        dy = point.y - segment_start.y
+        return math.sqrt(dx*dx + dy*dy)
+    
+    point_vec_x = point.x - segment_start.x
+    point_vec_y = point.y - segment_start.y
+    
+    dot_product = segment_vec_x * point_vec_x + segment_vec_y * point_vec_y
+    t = max(0, min(1, dot_product / segment_length_squared))
+    
+    projection_x = segment_start.x + segment_vec_x * t
+    projection_y = segment_start.y + segment_vec_y * t
+    
+    dx = point.x - projection_x
+    dy = point.y - projection_y
+    return math.sqrt(dx*dx + dy*dy)
+
+
+def _random_items(rng, count):
+    """('segment'|'arc'|'via', 座標..., 線幅の半分)のリスト"""
+    items = []
+    for _ in range(count):
+        kind = rng.choice(('segment', 'segment', 'arc', 'via'))
+        half_width = rng.randint(50, 500)
+        if kind == 'via':
+            items.append(('via', rng.randrange(SIZE), rng.randrange(SIZE), half_width))
+        elif kind == 'segment':
+            items.append(('segment', rng.randrange(SIZE), rng.randrange(SIZE), rng.randrange(SIZE),
+                          rng.randrange(SIZE), half_width))
+        else:
+            cx, cy, radius = rng.randrange(SIZE), rng.randrange(SIZE), rng.randint(1000, 6000)
+            angles = sorted(rng.uniform(-math.pi, math.pi) for _ in range(3))
+            if rng.random() < 0.5:
+                angles.reverse()  # 時計回り
+            sx, mx, ex = (int(cx + radius * math.cos(a)) for a in angles)
+            sy, my, ey = (int(cy + radius * math.sin(a)) for a in angles)
+            items.append(('arc', sx, sy, mx, my, ex, ey, half_width))
+    return items
+
+
+def _build(items, use_numpy):
+    engine = ClearanceBatchEngine(use_numpy=use_numpy)
+    for item in items:
+        if item[0] == 'via':
+            engine.add_via(*item[1:], net=0)
+        elif item[0] == 'segment':
+            engine.add_segment(*item[1:], net=0)
+        else:
+            engine.add_arc(*item[1:], net=0)
+    return engine
+
+
+def _arc_chords(sx, sy, mx, my, ex, ey):
+    """3点を通る円弧を始点から終点までの弦の列にする（一直線なら始点と終点の線分）"""
+    denominator = 2.0 * (sx * (my - ey) + mx * (ey - sy) + ex * (sy - my))
+    if denominator == 0:
+        return [(Point(sx, sy), Point(ex, ey))]
+    s2, m2, e2 = sx * sx + sy * sy, mx * mx + my * my, ex * ex + ey * ey
+    cx = (s2 * (my - ey) + m2 * (ey - sy) + e2 * (sy - my)) / denominator
+    cy = (s2 * (ex - mx) + m2 * (sx - ex) + e2 * (mx - sx)) / denominator
+    radius = math.hypot(sx - cx, sy - cy)
+    start = math.atan2(sy - cy, sx - cx)
+    to_mid = (math.atan2(my - cy, mx - cx) - start) % (2 * math.pi)
+    to_end = (math.atan2(ey - cy, ex - cx) - start) % (2 * math.pi)
+    sweep = to_end if to_mid <= to_end else to_end - 2 * math.pi  # 中点を通る向き
+    points = [Point(sx, sy)]
+    points.extend(Point(cx + radius * math.cos(start + sweep * i / ARC_CHORDS),
+                        cy + radius * math.sin(start + sweep * i / ARC_CHORDS)) for i in range(1, ARC_CHORDS))
+    points.append(Point(ex, ey))
+    return list(zip(points, points[1:]))
+
+
+def _scalar_distance(item, point, chords):
+    if item[0] == 'via':
+        return _distance_point_to_segment_fast(point, Point(*item[1:3]), Point(*item[1:3]))
+    if item[0] == 'segment':
+        return _distance_point_to_segment_fast(point, Point(*item[1:3]), Point(*item[3:5]))
+    return min(_distance_point_to_segment_fast(point, start, end) for start, end in chords)
+
+
+def _brute_force(items, points, candidates, clearance):
+    chords = {index: _arc_chords(*item[1:7]) for index, item in enumerate(items) if item[0] == 'arc'}
+    result = []
+    for query, (px, py, radius) in enumerate(points):
+        found = -1
+        for position, index in enumerate(candidates[query]):
+            limit = clearance[query][position] if isinstance(clearance, list) else clearance
+            distance = _scalar_distance(items[index], Point(px, py), chords.get(index))
+            if distance < limit + radius + items[index][-1]:
+                found = index
+                break
+        result.append(found)
+    return result
+
+
+def _queries(rng, item_count, count=2000):
+    points = [(rng.randrange(SIZE), rng.randrange(SIZE), rng.randint(100, 400)) for _ in range(count)]
+    candidates = [rng.sample(range(item_count), rng.randint(0, 12)) for _ in range(count)]
+    return points, candidates
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_pure_python_matches_scalar(seed):
+    rng = random.Random(seed)
+    items = _random_items(rng, 300)
+    points, candidates = _queries(rng, len(items))
+    engine = _build(items, use_numpy=False)
+    assert engine.find_collisions(points, candidates, 1500) == _brute_force(items, points, candidates, 1500)
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_numpy_matches_pure_python_and_scalar(seed):
+    pytest.importorskip('numpy')
+    rng = random.Random(seed)
+    items = _random_items(rng, 300)
+    points, candidates = _queries(rng, len(items))
+    clearances = [[rng.randint(200, 2500) for _ in items_] for items_ in candidates]
+    for clearance in (1500, clearances):
+        expected = _brute_force(items, points, candidates, clearance)
+        assert _build(items, use_numpy=True).find_collisions(points, candidates, clearance) == expected
+        assert _build(items, use_numpy=False).find_collisions(points, candidates, clearance) == expected
+
+
+def test_numpy_blocks_keep_first_collision():
+    """候補ペアがBLOCK_SIZEを超えて複数ブロックに分かれても、VIAごとに候補順で最初の違反を返す"""
+    pytest.importorskip('numpy')
+    rng = random.Random(4)
+    items = _random_items(rng, 200)
+    points, candidates = _queries(rng, len(items), count=500)
+    engine = _build(items, use_numpy=True)
+    engine.BLOCK_SIZE = 37
+    assert engine.find_collisions(points, candidates, 2000) == _brute_force(items, points, candidates, 2000)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""前処理結果のディスクキャッシュ（書けない場所でもチェックを続け、前回の結果と同じ判定になり、
+合計サイズの上限を超えたら最後に使われたのが古いものから消す）"""
+
+import os
+
+from via_cleaner_core import DEFAULT_SETTINGS, GeometryCache, run_board_check
+from synthetic_board import board_vias, generate_board
+
+SETTINGS = dict(DEFAULT_SETTINGS, incremental=False)
+
+
+def test_unwritable_cache_directory_does_not_abort_check(tmp_path):
+    blocker = tmp_path / 'not_a_directory'
+    blocker.write_text('')
+    cache = GeometryCache(str(blocker / 'cache'))  # 親がファイルなのでmakedirsが失敗する
+    board = generate_board(vias=300, seed=5)
+    vias = board_vias(board)
+
+    expected = run_board_check(board, vias, SETTINGS)[2]
+    assert run_board_check(board, vias, SETTINGS, cache=cache)[2] == expected
+    assert isinstance(cache.error, OSError)
+    assert cache.load('missing') is None
+
+
+def test_cached_state_gives_same_verdicts(tmp_path):
+    cache = GeometryCache(str(tmp_path / 'cache'))
+    board = generate_board(vias=300, seed=5)
+    vias = board_vias(board)
+    first = run_board_check(board, vias, SETTINGS, cache=cache)[2]
+    assert cache.error is None
+    assert run_board_check(board, vias, SETTINGS, cache=cache)[2] == first
+
+
+def test_evicts_least_recently_used_entries_over_max_bytes(tmp_path):
+    directory = tmp_path / 'cache'
+    cache = GeometryCache(str(directory), max_bytes=25000)
+    value = os.urandom(10000)  # 圧縮しても1件が約10KB
+
+    def path(key):
+        return str(directory / (key + '.cache'))
+
+    # 更新日時を古い順に固定しながら書く（2件で上限に収まり、3件目で最も古いaを消す）
+    assert cache.store('a', value)
+    os.utime(path('a'), (1000, 1000))
+    assert cache.store('b', value)
+    os.utime(path('b'), (2000, 2000))
+    assert cache.store('c', value)
+    os.utime(path('c'), (3000, 3000))
+    assert not os.path.exists(path('a'))
+    assert cache.load('a') is None
+
+    # 読んだbは新しくなるので、次に消えるのは書いてから使っていないc
+    assert cache.load('b') == value
+    assert cache.store('d', value)
+    assert sorted(os.listdir(directory)) == ['b.cache', 'd.cache']
+    assert cache.load('d') == value
+    assert sum(os.path.getsize(path(key)) for key in 'bd') <= cache.max_bytes
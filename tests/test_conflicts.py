@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""選択VIA同士の衝突の解消（優先度 → 未決定の衝突相手が少ない順の貪欲法）"""
+
+import pytest
+
+from via_cleaner_core import DEFAULT_SETTINGS, ViaChecker
+from bench_conflicts import make_geometry
+
+SETTINGS = dict(DEFAULT_SETTINGS, check_components=False, check_board_edge=False, check_zones=False,
+                check_outside_board=False)
+
+
+def _reference_greedy(neighbors, priorities):
+    """毎回、未決定のVIAから(優先度, 未決定の衝突相手の数, 番号)が最小のものを残す（総当たり）"""
+    kept = {}
+    while len(kept) < len(neighbors):
+        node = min((node for node in neighbors if node not in kept),
+                   key=lambda node: (priorities[node],
+                                     sum(1 for other in neighbors[node] if other not in kept), node))
+        kept[node] = True
+        for other in neighbors[node]:
+            kept.setdefault(other, False)
+    return kept
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+@pytest.mark.parametrize('prefer_large', [False, True])
+def test_follows_fewest_undecided_neighbours_order(seed, prefer_large):
+    geometry = make_geometry(600, 0.6, 8, seed)
+    settings = dict(SETTINGS, conflict_prefer_large=prefer_large, conflict_priority_nets=['N3'])
+    vias = geometry.vias
+    reasons, summary = ViaChecker().resolve_conflicts(geometry, vias, [None] * len(vias), settings)
+
+    checker = ViaChecker()
+    checker._prepare_clearances(geometry, settings)
+    neighbors, drill_pairs = checker._conflict_graph(vias)
+    priorities = {node: (0 if vias[node].net == 3 else 1, -vias[node].radius if prefer_large else 0)
+                  for node in neighbors}
+    expected = _reference_greedy(neighbors, priorities)
+    assert {node for node, keep in expected.items() if not keep} == \
+        {node for node, reason in enumerate(reasons) if reason == 'via_conflict'}
+    assert summary['kept'] == sum(expected.values())
+
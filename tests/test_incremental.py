@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""差分チェック（incremental）とディスクキャッシュの組み合わせ
+
+一部だけを再チェックしたときの周辺だけの前処理が、基板全体の前処理結果としてキャッシュに
+残らないことを確かめる（残ると、次の全体チェックや別の選択のチェックの判定が狂う）。
+"""
+
+import pcbnew_stub as pcbnew
+
+from via_cleaner_core import DEFAULT_SETTINGS, GeometryCache, run_board_check
+from synthetic_board import board_vias, generate_board
+
+SETTINGS = dict(DEFAULT_SETTINGS, incremental=True)
+
+
+def _board():
+    board = generate_board(vias=3000, seed=2)
+    board.file_name = '/virtual/incremental.kicad_pcb'  # 差分チェックは基板ファイル名で前回の結果を探す
+    return board
+
+
+def _move_one_track(board):
+    track = next(item for item in board.GetTracks() if item.Type() == pcbnew.PCB_TRACE_T)
+    offset = pcbnew.FromMM(0.3)
+    track.start = pcbnew.VECTOR2I(track.start.x + offset, track.start.y)
+    track.end = pcbnew.VECTOR2I(track.end.x + offset, track.end.y)
+
+
+def _expected(board, vias):
+    return run_board_check(board, vias, dict(SETTINGS, incremental=False))[2]
+
+
+def test_full_check_after_incremental_uses_whole_board(tmp_path):
+    cache = GeometryCache(str(tmp_path / 'cache'))
+    board = _board()
+    vias = board_vias(board)
+    run_board_check(board, vias, SETTINGS, cache=cache)
+    _move_one_track(board)
+    assert run_board_check(board, vias, SETTINGS, cache=cache)[2] == _expected(board, vias)
+    # 変更の無い基板で全体チェック（前処理結果はキャッシュから読む）
+    assert run_board_check(board, vias, dict(SETTINGS, incremental=False), cache=cache)[2] == \
+        _expected(board, vias)
+
+
+def test_other_selection_after_incremental_edit(tmp_path):
+    cache = GeometryCache(str(tmp_path / 'cache'))
+    board = _board()
+    vias = board_vias(board)
+    run_board_check(board, vias[:1500], SETTINGS, cache=cache)
+    _move_one_track(board)
+    assert run_board_check(board, vias[:1500], SETTINGS, cache=cache)[2] == _expected(board, vias[:1500])
+    assert run_board_check(board, vias[1500:], SETTINGS, cache=cache)[2] == _expected(board, vias[1500:])
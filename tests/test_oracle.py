@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""合成基板でViaCheckerの結果を総当たりの参照実装（benchmarks/oracle.py）と照合する
+
+空間インデックス・一括計算・外形・ゾーンの塗りつぶし・ルールエリア・穴の間隔の各チェックと、
+VIA同士の衝突の解消をまとめて確かめる（参照実装は遅いので一部のVIAだけを照合する）。
+"""
+
+import random
+
+import pytest
+
+from via_cleaner_core import DEFAULT_SETTINGS, ViaChecker, copper_layers, extract_geometry, via_record
+from synthetic_board import board_vias, generate_board
+from oracle import conflict_violations, reference_reasons
+
+CASES = {
+    'default': {},
+    'precise': {'precise_components': True, 'use_zone_fills': True, 'check_keepouts': True},
+    'drills': {'check_drills': True, 'hole_to_hole': 0.4, 'precise_components': True},
+    'drills_only': {'check_drills': True, 'check_nets': False, 'check_components': False, 'check_zones': False},
+    'no_resolve': {'resolve_via_conflicts': False, 'check_drills': True, 'check_keepouts': True},
+    'net_classes': {'use_zone_fills': True},
+}
+NET_CLASSES = {'Default': 0.2, 'Power': 0.3, 'HV': 0.5}
+
+
+@pytest.fixture(scope='module')
+def board():
+    return generate_board(vias=1500, copper_layers=4, seed=11)
+
+
+@pytest.fixture(scope='module')
+def class_board():
+    return generate_board(vias=1500, copper_layers=4, seed=12, net_classes=NET_CLASSES)
+
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_matches_reference(case, board, class_board):
+    board = class_board if case == 'net_classes' else board
+    settings = dict(DEFAULT_SETTINGS, **CASES[case])
+    geometry = extract_geometry(board, settings)
+    copper = copper_layers(board)
+    records = [via_record(via, copper) for via in board_vias(board)]
+
+    checker = ViaChecker()
+    reasons = checker.check_vias(geometry, records, settings)
+    final, summary = checker.resolve_conflicts(geometry, records, reasons, settings)
+
+    indices = sorted(random.Random(case).sample(range(len(records)), 150))
+    expected = reference_reasons(geometry, [records[i] for i in indices], settings, records)
+    assert [reasons[i] for i in indices] == expected
+    assert conflict_violations(geometry, records, final, settings, indices) == (0, 0)
+    assert any(expected)  # 何も削除しない基板では照合にならない
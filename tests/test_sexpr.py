@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""via_cleaner_sexprの読み書き（fixtures/small.kicad_pcb）
+
+何も削除しなければ入力と同じバイト列、削除したVIAのノードだけが消えること、
+読んだ形状がpcbnew_stubで同じ基板を作ってextract_geometryで抜き出したものと一致すること、
+基板外・基板端で削除するVIAの原因が最も近いEdge.Cuts図形になることを確かめる。
+"""
+
+import os
+
+import pytest
+
+import pcbnew_stub as pcbnew
+from via_cleaner_core import DEFAULT_SETTINGS, ViaChecker, extract_geometry
+from via_cleaner_sexpr import SexprBoard
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'small.kicad_pcb')
+SETTINGS = dict(DEFAULT_SETTINGS, precise_components=True, use_zone_fills=True, check_keepouts=True,
+                check_drills=True)
+
+
+def _uuid(number):
+    return f"00000000-0000-0000-0000-{number:012d}"
+
+
+def _mm(x, y):
+    return pcbnew.VECTOR2I(pcbnew.FromMM(x), pcbnew.FromMM(y))
+
+
+def _rect(x0, y0, x1, y1):
+    return [(pcbnew.FromMM(x0), pcbnew.FromMM(y0)), (pcbnew.FromMM(x1), pcbnew.FromMM(y0)),
+            (pcbnew.FromMM(x1), pcbnew.FromMM(y1)), (pcbnew.FromMM(x0), pcbnew.FromMM(y1))]
+
+
+def fixture_board():
+    """fixtures/small.kicad_pcbと同じ内容のpcbnew_stubの基板"""
+    board = pcbnew.BOARD(4)
+    default = board.nets[0].GetNetClass()
+    for code, name in ((1, "GND"), (2, "SIG1"), (3, "SIG2")):
+        board.nets[code] = pcbnew.NETINFO_ITEM(code, name, default)
+    copper = board.copper_ids
+    in1, in2 = pcbnew.inner_layer(1), pcbnew.inner_layer(2)
+
+    pads = [pcbnew.PAD(_rect(17.88, 14.15, 19.58, 15.85), 1, copper, board, _uuid(304), drill=(1000000, 1000000)),
+            pcbnew.PAD(_rect(20.42, 13.8, 22.12, 16.2), 2, copper, board, _uuid(305), drill=(1000000, 1600000))]
+    board.Add(pcbnew.FOOTPRINT(_mm(20, 15), pads, _rect(17, 13, 23, 17), uuid=_uuid(301)))
+    board.Add(pcbnew.PCB_SHAPE(pcbnew.SHAPE_T_RECT, _mm(0, 0), _mm(40, 30), uuid=_uuid(401)))
+    board.Add(pcbnew.PCB_SHAPE(pcbnew.SHAPE_T_CIRCLE, _mm(36, 4), _mm(37.6, 4), radius=pcbnew.FromMM(1.6),
+                               uuid=_uuid(402)))
+    board.Add(pcbnew.PCB_TRACK(_mm(5, 5), _mm(35, 5), pcbnew.FromMM(0.25), 2, pcbnew.F_Cu, board, _uuid(201)))
+    board.Add(pcbnew.PCB_TRACK(_mm(5, 25), _mm(35, 10), pcbnew.FromMM(0.2), 3, pcbnew.B_Cu, board, _uuid(202)))
+    board.Add(pcbnew.PCB_ARC(_mm(10, 20), _mm(12, 18), _mm(14, 20), pcbnew.FromMM(0.2), 3, in1, board, _uuid(203)))
+    for number, (x, y), size, drill, net, bottom in (
+            (101, (10, 5.3), 0.6, 0.3, 3, pcbnew.B_Cu), (102, (30, 20), 0.6, 0.3, 1, pcbnew.B_Cu),
+            (103, (25, 22), 0.45, 0.2, 2, in1), (104, (38.5, 28.5), 0.6, 0.3, 1, pcbnew.B_Cu),
+            (105, (41, 10), 0.6, 0.3, 2, pcbnew.B_Cu), (106, (21.9, 15), 0.6, 0.3, 3, pcbnew.B_Cu),
+            (107, (4, 27.5), 0.6, 0.3, 1, pcbnew.B_Cu)):
+        board.Add(pcbnew.PCB_VIA(_mm(x, y), pcbnew.FromMM(size), net, pcbnew.F_Cu, bottom, pcbnew.FromMM(drill),
+                                 board, _uuid(number)))
+    board.Add(pcbnew.ZONE([(_rect(1, 1, 39, 29), [])], 1, [in2], board, _uuid(501), "GND plane",
+                          fills={in2: [(_rect(1.2, 1.2, 38.8, 28.8), [])]}))
+    board.Add(pcbnew.ZONE([(_rect(2, 26, 6, 29), [])], 0, [pcbnew.F_Cu, pcbnew.B_Cu], board, _uuid(502), "NoVia",
+                          rule_area=True, allow_vias=False))
+    return board
+
+
+def _top_level_span(text, uuid):
+    """uuidを含むトップレベルノードの行（次のトップレベルノードの直前まで）"""
+    position = text.index(f'"{uuid}"')
+    start = text.rfind('\n\t(', 0, position) + 1
+    ends = [end for end in (text.find('\n\t(', position), text.find('\n)', position)) if end >= 0]
+    return start, min(ends) + 1
+
+
+def test_write_without_removals_is_byte_identical(tmp_path):
+    board = SexprBoard(FIXTURE, SETTINGS)
+    out_path = str(tmp_path / 'out.kicad_pcb')
+    board.write(out_path, [])
+    board.close()
+    with open(FIXTURE, 'rb') as original, open(out_path, 'rb') as written:
+        assert written.read() == original.read()
+
+
+def test_write_drops_only_removed_via_nodes(tmp_path):
+    board = SexprBoard(FIXTURE, SETTINGS)
+    uuids = [via.uuid for via in board.geometry.vias]
+    removed = [uuids.index(_uuid(101)), uuids.index(_uuid(104))]  # 1行のVIAと複数行のVIA
+    out_path = str(tmp_path / 'out.kicad_pcb')
+    board.write(out_path, removed)
+    board.close()
+
+    with open(FIXTURE, encoding='utf-8') as f:
+        expected = f.read()
+    for uuid in (_uuid(101), _uuid(104)):
+        start, end = _top_level_span(expected, uuid)
+        expected = expected[:start] + expected[end:]
+    with open(out_path, encoding='utf-8') as f:
+        assert f.read() == expected
+
+    reread = SexprBoard(out_path, SETTINGS)
+    assert [via.uuid for via in reread.geometry.vias] == [uuid for i, uuid in enumerate(uuids) if i not in removed]
+    reread.close()
+
+
+def test_geometry_matches_extract_geometry():
+    board = SexprBoard(FIXTURE, SETTINGS)
+    expected = extract_geometry(fixture_board(), SETTINGS)
+    actual = board.geometry
+    board.close()
+
+    assert actual.copper_layers == expected.copper_layers
+    assert actual.net_names == expected.net_names
+    assert actual.vias == expected.vias
+    assert sorted(actual.tracks) == sorted(expected.tracks)
+    assert sorted(actual.holes) == sorted(expected.holes)
+    assert sorted(actual.outlines) == sorted(expected.outlines)
+    assert actual.board_bbox == expected.board_bbox
+    assert actual.zones == expected.zones
+    assert actual.keepouts == expected.keepouts
+
+    assert len(actual.footprints) == len(expected.footprints) == 1
+    footprint, reference = actual.footprints[0], expected.footprints[0]
+    assert footprint['uuid'] == reference['uuid']
+    assert footprint['bbox'] == reference['bbox']
+    assert footprint['courtyards'] == [[pytest.approx(point) for point in outline]
+                                       for outline in reference['courtyards']]
+    assert len(footprint['pads']) == len(reference['pads'])
+    for (net, outline, bbox, layers), (net_ref, outline_ref, bbox_ref, layers_ref) in zip(footprint['pads'],
+                                                                                          reference['pads']):
+        assert (net, layers) == (net_ref, layers_ref)
+        assert [tuple(point) for point in outline] == [pytest.approx(point, abs=1) for point in outline_ref]
+
+
+def test_same_verdicts_as_pcbnew_path():
+    board = SexprBoard(FIXTURE, SETTINGS)
+    geometry = board.geometry
+    board.close()
+    reference = extract_geometry(fixture_board(), SETTINGS)
+    reasons = ViaChecker().check_vias(geometry, geometry.vias, SETTINGS)
+    assert reasons == ViaChecker().check_vias(reference, reference.vias, SETTINGS)
+    verdicts = dict(zip((via.uuid for via in geometry.vias), reasons))
+    assert verdicts[_uuid(101)] == 'net_collision'
+    assert verdicts[_uuid(105)] == 'outside_board'
+    assert verdicts[_uuid(106)] == 'component_collision'
+    assert verdicts[_uuid(107)] == 'keepout_violation'
+    assert verdicts[_uuid(102)] is None
+
+
+def test_outline_culprit_is_nearest_edge_cuts_item():
+    board = SexprBoard(FIXTURE, SETTINGS)
+    geometry = board.geometry
+    board.close()
+    vias = {via.uuid: via for via in geometry.vias}
+    outside = vias[_uuid(105)]  # 外形の四角の右外
+    near_circle = vias[_uuid(102)]._replace(x=pcbnew.FromMM(36), y=pcbnew.FromMM(5.8))  # 円の穴の縁から0.2mm
+    checker = ViaChecker()
+    checker.prepare(geometry, SETTINGS)
+    reasons = checker.check_chunk([outside, near_circle])
+    assert reasons == ['outside_board', 'board_edge_collision']
+    details = checker.explain_chunk([outside, near_circle], reasons)
+    assert details[0][:2] == (_uuid(401), 'board_bbox')
+    assert details[1][:2] == (_uuid(402), 'outline')
+    assert details[1][2] == pytest.approx(pcbnew.FromMM(0.2) - near_circle.radius, abs=2)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""BoardSpatialIndexの外形ボックスでの登録（中点が遠い長い配線）とネット・層での除外"""
+
+from via_cleaner_core import BoardSpatialIndex
+
+MM = 1000000  # nm
+
+
+def _query_around(index, x, y, reach, **kwargs):
+    return index.query(x - reach, y - reach, x + reach, y + reach, **kwargs)
+
+
+def test_long_horizontal_trace_found_far_from_midpoint():
+    # 100mmの配線の中点(50, 0)から45mm離れた位置のVIA
+    index = BoardSpatialIndex()
+    index.add_segment(0, 0, 100 * MM, 0, int(0.1 * MM), 1, 'trace')
+    assert _query_around(index, 95 * MM, int(0.3 * MM), int(0.5 * MM)) == ['trace']
+    assert _query_around(index, 95 * MM, 2 * MM, int(0.5 * MM)) == []
+
+
+def test_diagonal_trace_registers_only_cells_along_it():
+    index = BoardSpatialIndex()
+    index.add_segment(0, 0, 80 * MM, 80 * MM, int(0.1 * MM), 1, 'diagonal')
+    # 中点(40, 40)から遠い線上の点の近くで見つかる
+    assert _query_around(index, 75 * MM, 75 * MM + int(0.2 * MM), int(0.5 * MM)) == ['diagonal']
+    # 外形ボックスの中でも線から離れたセルには登録しない（セル数は長さに比例）
+    assert _query_around(index, 75 * MM, 5 * MM, int(0.5 * MM)) == []
+    assert len(index.grid) <= 4 * 80
+
+
+def test_other_net_filtering():
+    index = BoardSpatialIndex()
+    index.add_segment(0, 0, 50 * MM, 0, int(0.1 * MM), 1, 'net1')
+    index.add_segment(0, 0, 50 * MM, 0, int(0.1 * MM), 2, 'net2')
+    index.add_item((40 * MM, -MM, 42 * MM, MM), 3, 'pad')
+    assert sorted(_query_around(index, 41 * MM, 0, int(0.5 * MM))) == ['net1', 'net2', 'pad']
+    assert sorted(_query_around(index, 41 * MM, 0, int(0.5 * MM), exclude_net=1)) == ['net2', 'pad']
+    assert _query_around(index, 10 * MM, 0, int(0.5 * MM), exclude_net=2) == ['net1']
+
+
+def test_layer_filtering():
+    index = BoardSpatialIndex()
+    index.add_segment(0, 0, 50 * MM, 0, int(0.1 * MM), 1, 'net1', layer_mask=0b01)
+    index.add_segment(0, 0, 50 * MM, 0, int(0.1 * MM), 2, 'net2', layer_mask=0b10)
+    index.add_item((40 * MM, -MM, 42 * MM, MM), 3, 'pad')  # 層が分からないアイテムは全層に掛かる
+    assert sorted(_query_around(index, 41 * MM, 0, int(0.5 * MM), layer_mask=0b01)) == ['net1', 'pad']
+    assert _query_around(index, 41 * MM, 0, int(0.5 * MM), exclude_net=2, layer_mask=0b10) == ['pad']
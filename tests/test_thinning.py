@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""スティッチングVIAの間引き（塗りつぶしの島ごとにVIAを残す）"""
+
+from via_cleaner_core import DEFAULT_SETTINGS, IU_PER_MM, BoardGeometry, ViaChecker, ViaRecord, extract_geometry
+from via_cleaner_sexpr import SexprBoard
+from test_sexpr import FIXTURE, fixture_board
+
+MM = IU_PER_MM
+LAYERS = ('F.Cu', 'B.Cu')
+SETTINGS = dict(DEFAULT_SETTINGS, thin_stitching=True, thinning_pitch=20.0)
+
+
+def _rectangle(x0, y0, x1, y1):
+    return [(x0 * MM, y0 * MM), (x1 * MM, y0 * MM), (x1 * MM, y1 * MM), (x0 * MM, y1 * MM)]
+
+
+def _geometry(fills):
+    """1つのGNDゾーン（外周は1つ）と、その中の3つのVIA。fillsがあれば塗りつぶしは左右2つの島"""
+    geometry = BoardGeometry()
+    geometry.copper_layers = list(LAYERS)
+    geometry.net_names = {1: "GND"}
+    zone = {'uuid': 'zone', 'name': 'GND', 'net': 1, 'layers': ('F.Cu',), 'polygons': [(_rectangle(0, 0, 10, 2), [])]}
+    if fills:
+        zone['fills'] = {'F.Cu': [(_rectangle(0, 0, 4, 2), []), (_rectangle(6, 0, 10, 2), [])]}
+    geometry.zones.append(zone)
+    for name, x in (('a1', 1), ('a2', 3), ('b1', 7)):
+        geometry.vias.append(ViaRecord(x * MM, MM, int(0.2 * MM), 1, name, LAYERS))
+    return geometry
+
+
+def _kept(geometry):
+    vias = geometry.vias
+    reasons, summary = ViaChecker().thin_vias(geometry, vias, [None] * len(vias), SETTINGS)
+    return {via.uuid for via, reason in zip(vias, reasons) if reason is None}, summary
+
+
+def test_each_fill_island_keeps_a_via():
+    kept, summary = _kept(_geometry(fills=True))
+    assert kept == {'a1', 'b1'}
+    assert summary['protected'] == 1
+
+
+def test_zone_without_fill_uses_outline():
+    kept, summary = _kept(_geometry(fills=False))
+    assert kept == {'a1'}
+    assert summary['protected'] == 0
+
+
+def test_thinning_reads_zone_fills():
+    settings = dict(DEFAULT_SETTINGS, thin_stitching=True)
+    zones = extract_geometry(fixture_board(), settings).zones
+    board = SexprBoard(FIXTURE, settings)
+    assert board.geometry.zones == zones
+    board.close()
+    assert 'fills' in zones[0] and zones[0]['fills']['In2.Cu']
@@ -0,0 +1,2854 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""VIAクリーナーのチェック処理（wxに依存しない部分）
+
+GUIプラグイン（kicad-via-cleaner.py）とコマンドライン実行の両方から使う。
+チェック処理は基板から抜き出した形状（BoardGeometry）だけを参照するため、
+pcbnew経由（extract_geometry）でも.kicad_pcbの直接読み込み（via_cleaner_sexpr）でも動く。
+"""
+
+import os
+import sys
+import csv
+import time
+import math
+import json
+import pickle
+import hashlib
+import zlib
+import heapq
+import argparse
+import fnmatch
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager, nullcontext
+
+try:
+    import pcbnew
+except ImportError:
+    pcbnew = None  # .kicad_pcbを直接読み込む場合はpcbnew無しで動く
+
+try:
+    import numpy as np  # 一括クリアランス計算用（無い場合は純Python版で計算）
+except ImportError:
+    np = None
+
+# KiCadの内部単位（nm）
+IU_PER_MM = 1000000
+
+# 設定ファイル（ダイアログが保存するものと同じ）
+SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'via_cleaner_settings.json')
+
+# 前処理結果のディスクキャッシュ（設定ファイルと同じ場所）
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'via_cleaner_cache')
+CACHE_VERSION = 12  # 形状・インデックスの形式を変えたら上げる
+
+DEFAULT_SETTINGS = {
+    'clearance': 0.2,
+    'board_edge_clearance': 0.3,
+    'zone_clearance': 0.2,
+    'check_components': True,
+    'check_nets': True,
+    'check_board_edge': True,
+    'check_zones': True,
+    'check_outside_board': True,
+    'check_keepouts': True,  # VIAを禁止したルールエリア（キープアウト）内のVIAを削除
+    'check_drills': True,  # VIAの穴と他のVIA・スルーホールパッドの穴の間隔をチェック
+    'hole_to_hole': 0.25,  # 穴の縁どうしの最小間隔 (mm)
+    'precise_components': False,
+    'workers': 1,
+    'profile_path': '',  # 空でなければステージごとの計測結果をここへ書き出す（.csvならCSV）
+    'violation_path': '',  # 空でなければVIAごとの判定と原因をここへ1件ずつ書き出す（.csvならCSV、それ以外はJSON Lines）
+    'heatmap_path': '',  # 空でなければ削除理由ごとの件数のヒートマップをここへ書き出す（JSON）
+    'heatmap_cell': 5.0,  # ヒートマップのセルの大きさ (mm)
+    'use_cache': True,
+    'cache_max_mb': 256,
+    'incremental': True,  # 前回の結果を覚えておき、変更箇所の近くのVIAだけを再チェック
+    'use_design_rules': True,  # ネットクラス・カスタムルールのクリアランスを使う（無いネットはclearance）
+    'use_zone_fills': False,  # ゾーンは外形ではなく塗りつぶし形状で判定（塗りつぶし済みのゾーンだけ）
+    'resolve_via_conflicts': True,  # 選択VIA同士が衝突するときは両方ではなく片方だけ削除する
+    'conflict_priority_nets': [],  # 衝突時に優先して残すネット名（先頭ほど優先）
+    'conflict_prefer_large': False,  # 衝突時に大きいVIAを優先して残す
+    'thin_stitching': False,  # チェックを通った1つのネットのVIAを間引く
+    'thinning_net': '',  # 間引くネット名（空なら選択VIAが最も多いネット）
+    'thinning_pitch': 1.0,  # 間引き後のVIAの最小間隔 (mm)
+    'thinning_density': 0  # 0より大きければ目標密度（VIA/cm^2）から間隔を決める
+}
+
+# 抽出する形状とインデックスを変える設定（キャッシュキーに含める）
+GEOMETRY_SETTING_KEYS = [
+    'check_components', 'check_nets', 'check_board_edge', 'check_zones', 'check_outside_board', 'check_keepouts',
+    'precise_components', 'thin_stitching', 'use_zone_fills', 'check_drills'
+]
+
+# 並列チェック: 分割タイルの大きさと、プロセスを使う最小VIA数
+PARALLEL_TILE_SIZE = 10 * IU_PER_MM
+PARALLEL_MIN_VIAS = 2000
+
+# 進捗を報告しながらチェックするとき: 1つの塊にかける目安の時間（秒）と最小のVIA数
+PROGRESS_INTERVAL = 0.1
+PROGRESS_MIN_CHUNK = 64
+
+# 削除理由（チェック順）
+REMOVAL_REASONS = [
+    "outside_board",
+    "keepout_violation",
+    "component_collision",
+    "net_collision",
+    "drill_collision",
+    "board_edge_collision",
+    "zone_collision",
+    "via_conflict",
+    "thinned"
+]
+
+class CheckCancelled(Exception):
+    """進捗の報告先がチェックの中断を求めた"""
+
+def report_progress(progress, done, total):
+    """progressがあればprogress(済み数, 全数)を呼び、Falseが返ればCheckCancelledを送出"""
+    if progress is not None and not progress(done, total):
+        raise CheckCancelled()
+
+def load_settings(path=SETTINGS_FILE):
+    """設定を読み込み（存在しない項目はデフォルト値）。読み込みエラーは呼び出し側で処理する"""
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            settings.update(json.load(f))
+    return settings
+
+def save_settings(settings, path=SETTINGS_FILE):
+    """設定を保存"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(settings, f, indent=2, ensure_ascii=False)
+
+class CheckProfile:
+    """ステージごとの処理時間とカウンタの記録（ViaCheckerに渡したときだけ計測する）"""
+    def __init__(self, use_cprofile=False):
+        self.stages = {}     # ステージ名 → [合計秒数, 回数]
+        self.counters = defaultdict(int)
+        self.cprofile = None
+        if use_cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+
+    @contextmanager
+    def stage(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = self.stages.setdefault(name, [0.0, 0])
+            record[0] += time.perf_counter() - start_time
+            record[1] += 1
+
+    def timed(self, name, function):
+        """関数の呼び出しごとの時間をステージnameに加算するラッパー"""
+        stages = self.stages
+        perf_counter = time.perf_counter
+
+        def wrapper(*args):
+            start_time = perf_counter()
+            result = function(*args)
+            record = stages.setdefault(name, [0.0, 0])
+            record[0] += perf_counter() - start_time
+            record[1] += 1
+            return result
+        return wrapper
+
+    def add(self, name, value=1):
+        self.counters[name] += value
+
+    def report(self):
+        return {
+            'stages': {name: {'seconds': seconds, 'calls': calls} for name, (seconds, calls) in self.stages.items()},
+            'counters': dict(self.counters)
+        }
+
+    def write(self, path):
+        """レポートを書き出す（拡張子が.csvならCSV、それ以外はJSON）"""
+        report = self.report()
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            if path.lower().endswith('.csv'):
+                writer = csv.writer(f)
+                writer.writerow(['kind', 'name', 'value', 'calls'])
+                for name, stage in report['stages'].items():
+                    writer.writerow(['stage', name, f"{stage['seconds']:.6f}", stage['calls']])
+                for name, value in sorted(report['counters'].items()):
+                    writer.writerow(['counter', name, value, ''])
+            else:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+    def write_cprofile(self, path):
+        """チェックループのcProfile結果をpstats形式で保存"""
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(path)
+
+def profile_stage(profile, name):
+    """profileがあればそのステージ、無ければ何もしないコンテキスト"""
+    return profile.stage(name) if profile is not None else nullcontext()
+
+# 違反レポートの列（距離はmm。原因・距離が無い・分からない場合は空）
+VIOLATION_FIELDS = ['uuid', 'x_mm', 'y_mm', 'net', 'reason', 'culprit', 'culprit_type', 'distance_mm', 'required_mm']
+
+class ViolationWriter:
+    """VIAごとの判定を出てきた順に1件ずつファイルへ書く（ViaCheckerに渡したときだけ書く）
+
+    拡張子が.csvならCSV、それ以外はJSON Lines。書いた行は保持しないので、選択VIAの数によらず
+    メモリは一定。distanceは銅箔（穴の間隔では穴、間引きではVIAの中心）どうしの距離で、重なれば負。
+    VIA同士の衝突の解消・間引きで削除したVIAは後からもう1行書くので、同じUUIDは後の行が優先。
+    heatmap_pathがあれば削除理由ごとにheatmap_cell（mm）角のセルの件数を数え、closeでJSONに書く。
+    """
+    def __init__(self, path, heatmap_path=None, heatmap_cell=5.0):
+        self.heatmap_path = heatmap_path
+        self.cell = max(1, int(heatmap_cell * IU_PER_MM))
+        self.heatmap = defaultdict(int)  # (削除理由, 列, 行) → 件数（セルの数だけ増える）
+        self.count = 0
+        self.file = open(path, 'w', encoding='utf-8', newline='') if path else None
+        self.csv = None
+        if self.file is not None and path.lower().endswith('.csv'):
+            self.csv = csv.writer(self.file)
+            self.csv.writerow(VIOLATION_FIELDS)
+
+    def write(self, via, reason, net_name, detail=None):
+        """1件書く（detailは(原因のUUID, 原因の種類, 距離, 必要な距離)、距離はnm）"""
+        self.count += 1
+        if reason and self.heatmap_path:
+            self.heatmap[(reason, via.x // self.cell, via.y // self.cell)] += 1
+        if self.file is None:
+            return
+        culprit, culprit_type, distance, required = detail or (None, None, None, None)
+        values = [via.uuid, via.x / IU_PER_MM, via.y / IU_PER_MM, net_name, reason, culprit, culprit_type,
+                  None if distance is None else round(distance / IU_PER_MM, 6),
+                  None if required is None else round(required / IU_PER_MM, 6)]
+        if self.csv is not None:
+            self.csv.writerow(['' if value is None else value for value in values])
+        else:
+            self.file.write(json.dumps(dict(zip(VIOLATION_FIELDS, values)), ensure_ascii=False) + '\n')
+
+    def heatmap_report(self):
+        """ヒートマップ（原点はセルの左上の角、gridsは削除理由 → 行ごとの件数のリスト）"""
+        if not self.heatmap:
+            return {'cell_mm': self.cell / IU_PER_MM, 'origin_mm': None, 'columns': 0, 'rows': 0,
+                    'totals': {}, 'grids': {}}
+        min_column = min(column for reason, column, row in self.heatmap)
+        min_row = min(row for reason, column, row in self.heatmap)
+        columns = max(column for reason, column, row in self.heatmap) - min_column + 1
+        rows = max(row for reason, column, row in self.heatmap) - min_row + 1
+        grids = {}
+        totals = {}
+        for (reason, column, row), count in self.heatmap.items():
+            if reason not in grids:
+                grids[reason] = [[0] * columns for _ in range(rows)]
+                totals[reason] = 0
+            grids[reason][row - min_row][column - min_column] += count
+            totals[reason] += count
+        order = {reason: position for position, reason in enumerate(REMOVAL_REASONS)}
+        return {'cell_mm': self.cell / IU_PER_MM,
+                'origin_mm': [min_column * self.cell / IU_PER_MM, min_row * self.cell / IU_PER_MM],
+                'columns': columns, 'rows': rows,
+                'totals': {reason: totals[reason] for reason in sorted(totals, key=order.get)},
+                'grids': {reason: grids[reason] for reason in sorted(grids, key=order.get)}}
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.heatmap_path:
+            with open(self.heatmap_path, 'w', encoding='utf-8') as f:
+                json.dump(self.heatmap_report(), f, ensure_ascii=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def open_violation_writer(settings):
+    """設定のviolation_path・heatmap_pathに書くViolationWriterを返す（どちらも空ならNone）"""
+    if not (settings.get('violation_path') or settings.get('heatmap_path')):
+        return None
+    return ViolationWriter(settings.get('violation_path'), settings.get('heatmap_path'),
+                           settings.get('heatmap_cell', 5.0))
+
+class GeometryCache:
+    """基板フィンガープリントをキーにした前処理結果のディスクキャッシュ
+
+    値はpickleをzlibで圧縮して1キー1ファイルで保存する。読み込んだファイルは
+    更新日時を新しくし、合計サイズがmax_bytesを超えたら古いものから削除する。
+    読み書きできない（書き込み禁止のディレクトリ、ディスクが一杯など）場合はキャッシュ無しと
+    同じに扱い、最後のエラーをerrorに残す。
+    """
+    def __init__(self, directory=CACHE_DIR, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.error = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.cache')
+
+    def load(self, key):
+        """キャッシュを読む（無い・壊れている・形式が古い場合はNone）"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                version, value = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            self.error = e
+            return None
+        except Exception:
+            self._remove(path)
+            return None
+        if version != CACHE_VERSION:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def store(self, key, value):
+        """キャッシュを書き、サイズ上限に収まるよう古いものを削除（書けなければFalse）"""
+        path = self._path(key)
+        temp_path = path + '.tmp'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                f.write(zlib.compress(pickle.dumps((CACHE_VERSION, value), pickle.HIGHEST_PROTOCOL), 1))
+            os.replace(temp_path, path)
+            self.evict(keep=path)
+        except OSError as e:
+            self.error = e
+            self._remove(temp_path)
+            return False
+        return True
+
+    def evict(self, keep=None):
+        """合計サイズがmax_bytes以下になるまで、最後に使われたのが古い順に削除"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                self._remove(path)
+                total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def open_cache(settings):
+    """設定に従ってGeometryCacheを返す（無効ならNone）"""
+    if not settings.get('use_cache'):
+        return None
+    return GeometryCache(max_bytes=int(settings.get('cache_max_mb', 256)) * 1024 * 1024)
+
+def _settings_digest(settings):
+    digest = hashlib.sha1()
+    digest.update(repr((CACHE_VERSION, [settings[key] for key in GEOMETRY_SETTING_KEYS])).encode('utf-8'))
+    return digest
+
+def board_fingerprint(board, settings):
+    """pcbnewの基板のフィンガープリント
+
+    アイテム数、各アイテムのUUIDと位置・大きさ・ネット、部品の最終編集時刻、
+    基板ファイルの更新日時から作る。チェックに関係するアイテムが変われば変わる。
+    保存していない編集も拾うためにアイテムごとに数回pcbnewを呼ぶので、キャッシュが使える場合でも
+    アイテム数に比例する時間は掛かる（形状の抽出とインデックスの作成よりは少ない）。
+    """
+    digest = _settings_digest(settings)
+
+    def feed(*values):
+        digest.update(repr(values).encode('utf-8'))
+
+    file_name = board.GetFileName()
+    feed(file_name)
+    if file_name and os.path.exists(file_name):
+        stat = os.stat(file_name)
+        feed(stat.st_mtime_ns, stat.st_size)
+        feed(design_rule_files(file_name))
+    net_classes = BoardGeometry()
+    _read_net_classes(board, net_classes)
+    feed(sorted(net_classes.net_classes.items()), sorted(net_classes.class_clearances.items()),
+         net_classes.min_clearance)
+
+    tracks = board.GetTracks()
+    footprints = board.GetFootprints()
+    drawings = board.GetDrawings()
+    zones = board.Zones()
+    feed(len(tracks), len(footprints), len(drawings), len(zones))
+    for track in tracks:
+        start = track.GetStart()
+        end = track.GetEnd()
+        feed(track.m_Uuid.AsString(), start.x, start.y, end.x, end.y, track.GetWidth(), track.GetNetCode(),
+             track.GetDrillValue() if track.Type() == pcbnew.PCB_VIA_T else 0)
+    for footprint in footprints:
+        position = footprint.GetPosition()
+        edit_time = footprint.GetLastEditTime() if hasattr(footprint, 'GetLastEditTime') else None
+        feed(footprint.m_Uuid.AsString(), position.x, position.y, footprint.GetOrientationDegrees(),
+             footprint.GetLayer(), edit_time)
+    for drawing in drawings:
+        if drawing.GetLayer() == pcbnew.Edge_Cuts:
+            bbox = drawing.GetBoundingBox()
+            feed(drawing.m_Uuid.AsString(), bbox.GetLeft(), bbox.GetTop(), bbox.GetRight(), bbox.GetBottom())
+    copper = copper_layers(board) if settings.get('use_zone_fills') or settings.get('thin_stitching') else ()
+    for zone in zones:
+        bbox = zone.GetBoundingBox()
+        feed(zone.m_Uuid.AsString(), zone.GetNetCode(), zone.Outline().TotalVertices(),
+             bbox.GetLeft(), bbox.GetTop(), bbox.GetRight(), bbox.GetBottom())
+        if copper and hasattr(zone, 'GetFilledPolysList') and zone.IsFilled():  # 再塗りつぶしで変わる
+            for layer_id, name in copper:
+                if zone.IsOnLayer(layer_id):
+                    fill = zone.GetFilledPolysList(layer_id)
+                    fill_box = fill.BBox()
+                    feed(name, fill.TotalVertices(), fill_box.GetLeft(), fill_box.GetTop(), fill_box.GetRight(),
+                         fill_box.GetBottom())
+    return digest.hexdigest()
+
+def file_fingerprint(path, settings):
+    """.kicad_pcbファイルのフィンガープリント（パス・更新日時・サイズ）"""
+    digest = _settings_digest(settings)
+    stat = os.stat(path)
+    digest.update(repr((os.path.abspath(path), stat.st_mtime_ns, stat.st_size,
+                        design_rule_files(path))).encode('utf-8'))
+    return digest.hexdigest()
+
+class SpatialIndex:
+    """空間インデックスによる高速近隣検索"""
+    def __init__(self, grid_size=1000000):  # 1mm単位のグリッド
+        self.grid_size = grid_size
+        self.grid = defaultdict(list)
+    
+    def add_item(self, x, y, item):
+        grid_x = x // self.grid_size
+        grid_y = y // self.grid_size
+        self.grid[(grid_x, grid_y)].append((x, y, item))
+    
+    def get_nearby_items(self, x, y, radius):
+        grid_x = x // self.grid_size
+        grid_y = y // self.grid_size
+        grid_radius = (radius // self.grid_size) + 1
+        
+        nearby_items = []
+        for gx in range(grid_x - grid_radius, grid_x + grid_radius + 1):
+            for gy in range(grid_y - grid_radius, grid_y + grid_radius + 1):
+                nearby_items.extend(self.grid.get((gx, gy), []))
+        
+        return nearby_items
+
+class BoardSpatialIndex:
+    """基板全体のバウンディングボックス対応空間インデックス（バケットグリッド）
+
+    アイテムは中点ではなく外形ボックスで登録する。長い線分はグリッド
+    サイズ程度の小ボックス列に分割して登録するため、斜めの長い配線でも
+    登録セル数は長さに比例するだけで済む。アイテムごとに銅箔層のビットマスクを
+    持たせると、検索時に指定した層に無いものを除ける。
+    """
+    def __init__(self, grid_size=1000000):  # 1mm単位のグリッド
+        self.grid_size = grid_size
+        self.grid = defaultdict(list)
+        self.boxes = []
+        self.nets = []
+        self.layer_masks = []
+        self.items = []
+        self.query_count = 0  # 計測用: 検索回数と訪問したセル数
+        self.cell_count = 0
+
+    def add_item(self, box, net, item, parts=None, layer_mask=-1):
+        """ボックス(x0, y0, x1, y1)でアイテムを登録（partsは登録セルを決める小ボックス列、-1は全層）"""
+        index = len(self.items)
+        self.boxes.append(box)
+        self.nets.append(net)
+        self.layer_masks.append(layer_mask)
+        self.items.append(item)
+
+        grid_size = self.grid_size
+        cells = set()
+        for x0, y0, x1, y1 in (parts or (box,)):
+            for gx in range(x0 // grid_size, x1 // grid_size + 1):
+                for gy in range(y0 // grid_size, y1 // grid_size + 1):
+                    cells.add((gx, gy))
+        for cell in cells:
+            self.grid[cell].append(index)
+        return index
+
+    def add_segment(self, x1, y1, x2, y2, half_width, net, item, layer_mask=-1):
+        """線分を太さ込みの外形で登録"""
+        box = (min(x1, x2) - half_width, min(y1, y2) - half_width,
+               max(x1, x2) + half_width, max(y1, y2) + half_width)
+        length = math.hypot(x2 - x1, y2 - y1)
+        pieces = int(length // self.grid_size) + 1
+        if pieces == 1:
+            return self.add_item(box, net, item, layer_mask=layer_mask)
+
+        # 長い線分はグリッドサイズ以下の区間に分割
+        parts = []
+        for i in range(pieces):
+            ax = x1 + (x2 - x1) * i // pieces
+            ay = y1 + (y2 - y1) * i // pieces
+            bx = x1 + (x2 - x1) * (i + 1) // pieces
+            by = y1 + (y2 - y1) * (i + 1) // pieces
+            parts.append((min(ax, bx) - half_width, min(ay, by) - half_width,
+                          max(ax, bx) + half_width, max(ay, by) + half_width))
+        return self.add_item(box, net, item, parts, layer_mask)
+
+    def query(self, x0, y0, x1, y1, exclude_net=None, layer_mask=-1):
+        """範囲と外形ボックスが重なるアイテムを返す（exclude_netのアイテムとlayer_maskの層に無いものは除外）"""
+        grid_size = self.grid_size
+        boxes = self.boxes
+        nets = self.nets
+        layer_masks = self.layer_masks
+        seen = set()
+        result = []
+        self.query_count += 1
+        self.cell_count += (x1 // grid_size - x0 // grid_size + 1) * (y1 // grid_size - y0 // grid_size + 1)
+        for gx in range(x0 // grid_size, x1 // grid_size + 1):
+            for gy in range(y0 // grid_size, y1 // grid_size + 1):
+                for index in self.grid.get((gx, gy), ()):
+                    if index in seen:
+                        continue
+                    seen.add(index)
+                    if exclude_net is not None and nets[index] == exclude_net:
+                        continue
+                    if layer_mask != -1 and not layer_masks[index] & layer_mask:
+                        continue
+                    bx0, by0, bx1, by1 = boxes[index]
+                    if bx0 <= x1 and bx1 >= x0 and by0 <= y1 and by1 >= y0:
+                        result.append(self.items[index])
+        return result
+
+def point_segment_distance(px, py, x1, y1, x2, y2):
+    """点と線分の距離（座標を直接受け取るスカラー版）"""
+    dx = x2 - x1
+    dy = y2 - y1
+    length_squared = dx * dx + dy * dy
+    if length_squared == 0:
+        return math.hypot(px - x1, py - y1)
+    t = max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length_squared))
+    return math.hypot(px - x1 - dx * t, py - y1 - dy * t)
+
+def arc_from_three_points(sx, sy, mx, my, ex, ey):
+    """始点・中点・終点から円弧の(中心x, 中心y, 半径, 開始角, 掃引角)を求める（一直線ならNone）"""
+    d = 2.0 * (sx * (my - ey) + mx * (ey - sy) + ex * (sy - my))
+    if d == 0:
+        return None
+    s2 = sx * sx + sy * sy
+    m2 = mx * mx + my * my
+    e2 = ex * ex + ey * ey
+    cx = (s2 * (my - ey) + m2 * (ey - sy) + e2 * (sy - my)) / d
+    cy = (s2 * (ex - mx) + m2 * (sx - ex) + e2 * (mx - sx)) / d
+    radius = math.hypot(sx - cx, sy - cy)
+
+    two_pi = 2.0 * math.pi
+    start_angle = math.atan2(sy - cy, sx - cx)
+    mid_sweep = (math.atan2(my - cy, mx - cx) - start_angle) % two_pi
+    end_sweep = (math.atan2(ey - cy, ex - cx) - start_angle) % two_pi
+    sweep = end_sweep if mid_sweep <= end_sweep else end_sweep - two_pi
+    return cx, cy, radius, start_angle, sweep
+
+def point_arc_distance(px, py, cx, cy, radius, start_angle, sweep, sx, sy, ex, ey):
+    """点と円弧の距離（掃引範囲内なら半径方向、範囲外なら近い端点まで）"""
+    direction = 1.0 if sweep >= 0 else -1.0
+    relative = ((math.atan2(py - cy, px - cx) - start_angle) * direction) % (2.0 * math.pi)
+    if relative <= abs(sweep):
+        return abs(math.hypot(px - cx, py - cy) - radius)
+    return min(math.hypot(px - sx, py - sy), math.hypot(px - ex, py - ey))
+
+def arc_bounding_box(cx, cy, radius, start_angle, sweep, sx, sy, ex, ey, half_width):
+    """円弧の外形ボックス（軸方向の極点を含む）"""
+    xs = [sx, ex]
+    ys = [sy, ey]
+    direction = 1.0 if sweep >= 0 else -1.0
+    for quadrant in range(4):
+        angle = quadrant * math.pi / 2
+        if ((angle - start_angle) * direction) % (2.0 * math.pi) <= abs(sweep):
+            xs.append(cx + radius * math.cos(angle))
+            ys.append(cy + radius * math.sin(angle))
+    return (int(math.floor(min(xs))) - half_width, int(math.floor(min(ys))) - half_width,
+            int(math.ceil(max(xs))) + half_width, int(math.ceil(max(ys))) + half_width)
+
+def poly_set_outlines(poly_set):
+    """SHAPE_POLY_SETの各外周を点列[(x, y), ...]のリストに変換"""
+    return [_line_chain_points(poly_set.Outline(i)) for i in range(poly_set.OutlineCount())]
+
+def poly_set_polygons(poly_set):
+    """SHAPE_POLY_SETを[(外周, [穴, ...]), ...]に変換"""
+    polygons = []
+    for i in range(poly_set.OutlineCount()):
+        holes = []
+        for j in range(poly_set.HoleCount(i)):
+            holes.append(_line_chain_points(poly_set.Hole(i, j)))
+        polygons.append((_line_chain_points(poly_set.Outline(i)), holes))
+    return polygons
+
+def _line_chain_points(chain):
+    points = []
+    for j in range(chain.PointCount()):
+        point = chain.CPoint(j)
+        points.append((point.x, point.y))
+    return points
+
+def polygon_bounding_box(points):
+    """点列の外形ボックス"""
+    xs = [x for x, y in points]
+    ys = [y for x, y in points]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def point_in_polygon(px, py, points):
+    """点が多角形の内側にあるか（レイキャスト法）"""
+    inside = False
+    x1, y1 = points[-1]
+    for x2, y2 in points:
+        if (y1 > py) != (y2 > py):
+            if px < x1 + (py - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+def point_polygon_distance(px, py, points):
+    """点と多角形の距離（内側なら0）"""
+    if point_in_polygon(px, py, points):
+        return 0.0
+    distance = float('inf')
+    x1, y1 = points[-1]
+    for x2, y2 in points:
+        distance = min(distance, point_segment_distance(px, py, x1, y1, x2, y2))
+        x1, y1 = x2, y2
+    return distance
+
+def point_poly_set_distance(px, py, polygons):
+    """点と穴あき多角形群の距離（塗りつぶし部分の内側なら0）"""
+    distance = float('inf')
+    for outline, holes in polygons:
+        if point_in_polygon(px, py, outline) and not any(point_in_polygon(px, py, hole) for hole in holes):
+            return 0.0
+        for ring in [outline] + holes:
+            x1, y1 = ring[-1]
+            for x2, y2 in ring:
+                distance = min(distance, point_segment_distance(px, py, x1, y1, x2, y2))
+                x1, y1 = x2, y2
+    return distance
+
+def bezier_points(x0, y0, x1, y1, x2, y2, x3, y3, count=16):
+    """3次ベジェ曲線を折れ線に分割"""
+    points = []
+    for i in range(count + 1):
+        t = i / count
+        u = 1.0 - t
+        points.append((u * u * u * x0 + 3 * u * u * t * x1 + 3 * u * t * t * x2 + t * t * t * x3,
+                       u * u * u * y0 + 3 * u * u * t * y1 + 3 * u * t * t * y2 + t * t * t * y3))
+    return points
+
+def polyline_primitives(points, closed=False, uuid=None):
+    """点列をEdge.Cuts外形の線分プリミティブ列に変換（uuidは元の図形のUUID）"""
+    points = [(int(round(x)), int(round(y))) for x, y in points]
+    if closed and len(points) > 2:
+        points.append(points[0])
+    return [('segment', x1, y1, x2, y2, uuid) for (x1, y1), (x2, y2) in zip(points[:-1], points[1:])
+            if (x1, y1) != (x2, y2)]
+
+class BoardOutline:
+    """Edge.Cuts外形（線分・円弧・円）の距離計算と内外判定（ゾーンの塗りつぶし形状にも使う）
+
+    外形は読み込み時に1回だけ線分と真の円弧に分解し、距離計算用には
+    グリッド索引を、内外判定用にはY方向に単調な区間を行ごとに登録する。
+    VIAごとの計算は近くの図形と同じ行の区間だけで済む。
+    """
+    def __init__(self, primitives, grid_size=1000000):  # 1mm単位のグリッド
+        self.grid_size = grid_size
+        self.index = BoardSpatialIndex(grid_size)
+        self.rows = defaultdict(list)  # 行番号 → 内外判定用の単調区間
+        endpoints = defaultdict(int)
+
+        def key(x, y):
+            return (int(round(x / 1000.0)), int(round(y / 1000.0)))  # 1um単位で端点を照合
+
+        for primitive in primitives:
+            if primitive[0] == 'circle':
+                _, cx, cy, radius, uuid = primitive
+                self._add_arc(cx, cy, radius, 0.0, 2.0 * math.pi, cx + radius, cy, cx + radius, cy, uuid)
+                continue
+            if primitive[0] == 'arc':
+                _, sx, sy, mx, my, ex, ey, uuid = primitive
+                arc = arc_from_three_points(sx, sy, mx, my, ex, ey)
+                if arc is not None:
+                    self._add_arc(*arc, sx, sy, ex, ey, uuid)
+                    endpoints[key(sx, sy)] += 1
+                    endpoints[key(ex, ey)] += 1
+                    continue
+                primitive = ('segment', sx, sy, ex, ey, uuid)  # 一直線の円弧
+            _, x1, y1, x2, y2, uuid = primitive
+            self._add_segment(x1, y1, x2, y2, uuid)
+            endpoints[key(x1, y1)] += 1
+            endpoints[key(x2, y2)] += 1
+
+        # 端点が全て偶数回使われていれば閉じた外形とみなす（開いた外形では内外判定しない）
+        self.closed = bool(self.index.items) and all(count % 2 == 0 for count in endpoints.values())
+
+    def __len__(self):
+        return len(self.index.items)
+
+    def _add_segment(self, x1, y1, x2, y2, uuid):
+        self.index.add_segment(x1, y1, x2, y2, 0, None, ('segment', x1, y1, x2, y2, uuid))
+        self._add_row_piece(y1, y2, ('segment', x1, y1, x2, y2))
+
+    def _add_arc(self, cx, cy, radius, start_angle, sweep, sx, sy, ex, ey, uuid):
+        item = ('arc', cx, cy, radius, start_angle, sweep, sx, sy, ex, ey, uuid)
+        box = arc_bounding_box(cx, cy, radius, start_angle, sweep, sx, sy, ex, ey, 0)
+        direction = 1.0 if sweep >= 0 else -1.0
+        length = abs(sweep)
+
+        # 登録セルは円弧に沿った小ボックス列（大きな円弧でも内側のセルには登録しない）
+        pieces = int(radius * length // self.grid_size) + 1
+        step = length / pieces
+        sagitta = int(math.ceil(radius * (1.0 - math.cos(step / 2)))) + 1
+        parts = []
+        for i in range(pieces):
+            a = start_angle + direction * step * i
+            b = start_angle + direction * step * (i + 1)
+            ax, ay = cx + radius * math.cos(a), cy + radius * math.sin(a)
+            bx, by = cx + radius * math.cos(b), cy + radius * math.sin(b)
+            parts.append((int(math.floor(min(ax, bx))) - sagitta, int(math.floor(min(ay, by))) - sagitta,
+                          int(math.ceil(max(ax, bx))) + sagitta, int(math.ceil(max(ay, by))) + sagitta))
+        self.index.add_item(box, None, item, parts)
+
+        # 上下の極点（角度π/2の奇数倍）で分け、Y方向に単調な区間として登録
+        first = ((math.pi / 2 - start_angle) * direction) % math.pi
+        breaks = [0.0]
+        t = first if first > 0 else math.pi
+        while t < length:
+            breaks.append(t)
+            t += math.pi
+        breaks.append(length)
+        for i in range(len(breaks) - 1):
+            ta, tb = breaks[i], breaks[i + 1]
+            ya = sy if i == 0 else cy + radius * math.sin(start_angle + direction * ta)
+            yb = ey if i == len(breaks) - 2 else cy + radius * math.sin(start_angle + direction * tb)
+            side = 1.0 if math.cos(start_angle + direction * (ta + tb) / 2) >= 0 else -1.0
+            self._add_row_piece(ya, yb, ('arc', ya, yb, cx, cy, radius, side))
+
+    def _add_row_piece(self, ya, yb, piece):
+        grid_size = self.grid_size
+        for row in range(int(min(ya, yb) // grid_size), int(max(ya, yb) // grid_size) + 1):
+            self.rows[row].append(piece)
+
+    def contains(self, px, py):
+        """点が外形の内側にあるか（右向きの半直線との交差回数の偶奇）"""
+        inside = False
+        for piece in self.rows.get(int(py // self.grid_size), ()):
+            if piece[0] == 'segment':
+                _, x1, y1, x2, y2 = piece
+                if (y1 > py) != (y2 > py) and px < x1 + (py - y1) * (x2 - x1) / (y2 - y1):
+                    inside = not inside
+            else:
+                _, ya, yb, cx, cy, radius, side = piece
+                if (ya > py) != (yb > py):
+                    dy = py - cy
+                    if px < cx + side * math.sqrt(max(0.0, radius * radius - dy * dy)):
+                        inside = not inside
+        return inside
+
+    def is_within(self, px, py, distance):
+        """外形までの距離がdistance未満か"""
+        for item in self.index.query(px - distance, py - distance, px + distance, py + distance):
+            if item[0] == 'segment':
+                if point_segment_distance(px, py, *item[1:-1]) < distance:
+                    return True
+            elif point_arc_distance(px, py, *item[1:-1]) < distance:
+                return True
+        return False
+
+    def nearest(self, px, py, distance=None):
+        """distance未満にある最も近い外形の(距離, 元の図形のUUID)（無ければNone）
+
+        distanceがNoneなら距離を限らず全ての図形から探す（削除理由の説明用）。
+        """
+        if distance is None:
+            items = self.index.items
+        else:
+            items = self.index.query(px - distance, py - distance, px + distance, py + distance)
+        nearest = None
+        for item in items:
+            if item[0] == 'segment':
+                value = point_segment_distance(px, py, *item[1:-1])
+            else:
+                value = point_arc_distance(px, py, *item[1:-1])
+            if (distance is None or value < distance) and (nearest is None or value < nearest[0]):
+                nearest = (value, item[-1])
+        return nearest
+
+class ClearanceBatchEngine:
+    """VIA・配線・円弧のクリアランスを候補ブロック単位で一括計算するエンジン
+
+    全アイテムを列（x1, y1, x2, y2, 線幅の半分, ネット, 円弧パラメータ）として
+    1回で読み込み、NumPyがあれば候補ペアをまとめてベクトル演算する。
+    VIAは長さ0の線分として扱う。NumPyが無い環境では同じ計算を純Pythonで行う。
+    """
+    KIND_SEGMENT = 0
+    KIND_ARC = 1
+    BLOCK_SIZE = 65536  # 一度に評価する候補ペア数の上限
+
+    def __init__(self, use_numpy=None):
+        self.use_numpy = (np is not None) if use_numpy is None else (use_numpy and np is not None)
+        self.kind = []
+        self.x1 = []
+        self.y1 = []
+        self.x2 = []
+        self.y2 = []
+        self.half_width = []
+        self.net = []
+        self.arc_cx = []
+        self.arc_cy = []
+        self.arc_radius = []
+        self.arc_start = []
+        self.arc_sweep = []
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.kind)
+
+    def _append(self, kind, x1, y1, x2, y2, half_width, net, arc=(0.0, 0.0, 0.0, 0.0, 0.0)):
+        self.kind.append(kind)
+        self.x1.append(x1)
+        self.y1.append(y1)
+        self.x2.append(x2)
+        self.y2.append(y2)
+        self.half_width.append(half_width)
+        self.net.append(net)
+        self.arc_cx.append(arc[0])
+        self.arc_cy.append(arc[1])
+        self.arc_radius.append(arc[2])
+        self.arc_start.append(arc[3])
+        self.arc_sweep.append(arc[4])
+        self._arrays = None
+        return len(self.kind) - 1
+
+    def add_via(self, x, y, radius, net):
+        return self._append(self.KIND_SEGMENT, x, y, x, y, radius, net)
+
+    def add_segment(self, x1, y1, x2, y2, half_width, net):
+        return self._append(self.KIND_SEGMENT, x1, y1, x2, y2, half_width, net)
+
+    def add_arc(self, sx, sy, mx, my, ex, ey, half_width, net):
+        arc = arc_from_three_points(sx, sy, mx, my, ex, ey)
+        if arc is None:
+            return self.add_segment(sx, sy, ex, ey, half_width, net)
+        return self._append(self.KIND_ARC, sx, sy, ex, ey, half_width, net, arc)
+
+    def bounding_box(self, index):
+        """アイテムの外形ボックス（線幅込み）"""
+        half_width = self.half_width[index]
+        x1, y1, x2, y2 = self.x1[index], self.y1[index], self.x2[index], self.y2[index]
+        if self.kind[index] == self.KIND_ARC:
+            return arc_bounding_box(self.arc_cx[index], self.arc_cy[index], self.arc_radius[index],
+                                    self.arc_start[index], self.arc_sweep[index],
+                                    x1, y1, x2, y2, half_width)
+        return (min(x1, x2) - half_width, min(y1, y2) - half_width,
+                max(x1, x2) + half_width, max(y1, y2) + half_width)
+
+    def distance(self, index, px, py):
+        """点とアイテム中心線の距離（スカラー版）"""
+        if self.kind[index] == self.KIND_ARC:
+            return point_arc_distance(px, py, self.arc_cx[index], self.arc_cy[index],
+                                      self.arc_radius[index], self.arc_start[index], self.arc_sweep[index],
+                                      self.x1[index], self.y1[index], self.x2[index], self.y2[index])
+        return point_segment_distance(px, py, self.x1[index], self.y1[index], self.x2[index], self.y2[index])
+
+    def find_collisions(self, points, candidates, clearance):
+        """各点(x, y, 半径)について、候補のうち最初にクリアランス違反となるアイテム番号を返す（無ければ-1）
+
+        clearanceは全ペア共通の値か、candidatesと同じ形の候補ごとの値のリスト。
+        """
+        result = [-1] * len(points)
+        if self.use_numpy:
+            self._find_collisions_numpy(points, candidates, clearance, result)
+        else:
+            per_item = isinstance(clearance, list)
+            for query, (px, py, radius) in enumerate(points):
+                for position, index in enumerate(candidates[query]):
+                    limit = clearance[query][position] if per_item else clearance
+                    if self.distance(index, px, py) < limit + radius + self.half_width[index]:
+                        result[query] = index
+                        break
+        return result
+
+    def _columns(self):
+        if self._arrays is None:
+            self._arrays = {
+                'kind': np.asarray(self.kind, dtype=np.int8),
+                'x1': np.asarray(self.x1, dtype=np.float64),
+                'y1': np.asarray(self.y1, dtype=np.float64),
+                'x2': np.asarray(self.x2, dtype=np.float64),
+                'y2': np.asarray(self.y2, dtype=np.float64),
+                'half_width': np.asarray(self.half_width, dtype=np.float64),
+                'arc_cx': np.asarray(self.arc_cx, dtype=np.float64),
+                'arc_cy': np.asarray(self.arc_cy, dtype=np.float64),
+                'arc_radius': np.asarray(self.arc_radius, dtype=np.float64),
+                'arc_start': np.asarray(self.arc_start, dtype=np.float64),
+                'arc_sweep': np.asarray(self.arc_sweep, dtype=np.float64),
+            }
+        return self._arrays
+
+    def _find_collisions_numpy(self, points, candidates, clearance, result):
+        per_item = isinstance(clearance, list)
+        query_ids = []
+        item_ids = []
+        limits = []
+        for query, items in enumerate(candidates):
+            if items:
+                query_ids.extend([query] * len(items))
+                item_ids.extend(items)
+                if per_item:
+                    limits.extend(clearance[query])
+            if len(item_ids) >= self.BLOCK_SIZE:
+                self._evaluate_block(points, query_ids, item_ids,
+                                     np.asarray(limits, dtype=np.float64) if per_item else clearance, result)
+                query_ids = []
+                item_ids = []
+                limits = []
+        if item_ids:
+            self._evaluate_block(points, query_ids, item_ids,
+                                 np.asarray(limits, dtype=np.float64) if per_item else clearance, result)
+
+    def _evaluate_block(self, points, query_ids, item_ids, clearance, result):
+        columns = self._columns()
+        queries = np.asarray(query_ids, dtype=np.int64)
+        items = np.asarray(item_ids, dtype=np.int64)
+        point_array = np.asarray(points, dtype=np.float64)
+        px = point_array[queries, 0]
+        py = point_array[queries, 1]
+        required = clearance + point_array[queries, 2] + columns['half_width'][items]
+
+        # 点と線分（VIAは長さ0の線分）
+        x1 = columns['x1'][items]
+        y1 = columns['y1'][items]
+        x2 = columns['x2'][items]
+        y2 = columns['y2'][items]
+        dx = x2 - x1
+        dy = y2 - y1
+        length_squared = dx * dx + dy * dy
+        t = ((px - x1) * dx + (py - y1) * dy) / np.where(length_squared == 0, 1.0, length_squared)
+        t = np.clip(t, 0.0, 1.0)
+        distance = np.hypot(px - x1 - dx * t, py - y1 - dy * t)
+
+        # 円弧は該当ペアだけ計算し直す
+        arc_mask = columns['kind'][items] == self.KIND_ARC
+        if arc_mask.any():
+            arc_items = items[arc_mask]
+            apx = px[arc_mask]
+            apy = py[arc_mask]
+            cx = columns['arc_cx'][arc_items]
+            cy = columns['arc_cy'][arc_items]
+            sweep = columns['arc_sweep'][arc_items]
+            direction = np.where(sweep >= 0, 1.0, -1.0)
+            relative = np.mod((np.arctan2(apy - cy, apx - cx) - columns['arc_start'][arc_items]) * direction,
+                              2.0 * np.pi)
+            radial = np.abs(np.hypot(apx - cx, apy - cy) - columns['arc_radius'][arc_items])
+            to_ends = np.minimum(np.hypot(apx - x1[arc_mask], apy - y1[arc_mask]),
+                                 np.hypot(apx - x2[arc_mask], apy - y2[arc_mask]))
+            distance[arc_mask] = np.where(relative <= np.abs(sweep), radial, to_ends)
+
+        hits = np.flatnonzero(distance < required)
+        if hits.size == 0:
+            return
+        # ペアはVIA順・候補順に並んでいるので、各VIAの最初の違反を採用
+        hit_queries, first = np.unique(queries[hits], return_index=True)
+        for query, item in zip(hit_queries.tolist(), items[hits[first]].tolist()):
+            if result[query] < 0:
+                result[query] = item
+
+
+
+class ClearanceResolver:
+    """VIAのネットと相手のネット・層・種別ごとのクリアランス（nm）を決めてメモ化する
+
+    KiCadと同じく、条件に合うカスタムルールのうちファイルの後ろにあるものを優先し、
+    無ければ両ネットのネットクラスのクリアランスの大きい方を使う（基板の最小クリアランスが下限）。
+    ネットクラスもルールも無ければ全ペアでdefault_clearance。結果は表に残すので、
+    チェックループでは1ペア1回の辞書引きで済む。
+    """
+    ITEM_TYPES = ('Via', 'Track', 'Arc', 'Pad')
+
+    def __init__(self, geometry, default_clearance, use_rules=True):
+        self.default_clearance = default_clearance
+        self.layer_names = list(geometry.copper_layers)
+        self.net_names = geometry.net_names
+        self.net_classes = geometry.net_classes if use_rules else {}
+        self.class_clearances = geometry.class_clearances if use_rules else {}
+        self.rules = geometry.clearance_rules if use_rules else []
+        self.floor = geometry.min_clearance if use_rules else 0
+        self.uniform = not self.class_clearances and not self.rules
+        # ルールがネット名を見なければ、ネットはネットクラスだけで区別すれば足りる
+        self.by_name = any(_condition_uses(rule['condition'], 'NetName') for rule in self.rules)
+        self.table = {}
+        self.reaches = {}
+        self.via_tables = {}
+        self._others = None
+
+    def clearance(self, net_a, net_b, layer_mask=-1, item_type='Track'):
+        """VIA（net_a）と相手（net_b・種別item_type）の間に必要なクリアランス。layer_maskは共通の層"""
+        key = (self._net_key(net_a), self._net_key(net_b), layer_mask, item_type)
+        value = self.table.get(key)
+        if value is None:
+            value = self.table[key] = self._resolve(*key)
+        return value
+
+    def _net_key(self, net):
+        return net if self.by_name else self.net_classes.get(net, 'Default')
+
+    def via_table(self, net, layer_mask, profiles):
+        """VIA（ネット・層マスク）から見た、相手のプロファイル番号 → クリアランスの表
+
+        profilesは番号 → (相手ネット, 相手の層マスク, 種別)。表は引かれたときに埋まる。
+        """
+        key = (self._net_key(net), layer_mask)
+        table = self.via_tables.get(key)
+        if table is None:
+            table = self.via_tables[key] = _ViaClearanceTable(self, net, layer_mask, profiles)
+        return table
+
+    def reach(self, net, layer_mask=-1):
+        """このネットのVIAに掛かりうる最大のクリアランス（空間検索の範囲用）"""
+        if self.uniform:
+            return max(self.default_clearance, self.floor)
+        key = (net, layer_mask)
+        value = self.reaches.get(key)
+        if value is None:
+            if self._others is None:
+                self._others = self._representative_nets()
+            value = self.reaches[key] = max(self.clearance(net, other, layer_mask, item_type)
+                                            for other in self._others for item_type in self.ITEM_TYPES)
+        return value
+
+    def _representative_nets(self):
+        """クリアランスが違いうる相手ネットの代表（ルールがネット名を見るなら全ネット）"""
+        if self.by_name:
+            return list(self.net_names) or [0]
+        others = {}
+        for net in self.net_names:
+            others.setdefault(self.net_classes.get(net, 'Default'), net)
+        others.setdefault('Default', 0)
+        return list(others.values())
+
+    def _resolve(self, key_a, key_b, layer_mask, item_type):
+        if self.uniform:
+            return max(self.default_clearance, self.floor)
+        if layer_mask == -1:
+            layers = self.layer_names
+        else:
+            layers = [name for bit, name in enumerate(self.layer_names) if layer_mask >> bit & 1]
+        a = self._properties(key_a, 'Via')
+        b = self._properties(key_b, item_type)
+        return max(self._resolve_layer(a, b, layer) for layer in (layers or [None]))
+
+    def _resolve_layer(self, a, b, layer):
+        for rule in reversed(self.rules):
+            if not _rule_layer_matches(rule['layer'], layer):
+                continue
+            if _condition_matches(rule['condition'], a, b) or _condition_matches(rule['condition'], b, a):
+                return max(rule['clearance'], self.floor)
+        return max(self._class_clearance(a['NetClass']), self._class_clearance(b['NetClass']), self.floor)
+
+    def _class_clearance(self, net_class):
+        """ネットクラス（'HV,Default'のような複合名も可）のクリアランス"""
+        values = [self.class_clearances[name] for name in net_class.split(',') if name in self.class_clearances]
+        if values:
+            return max(values)
+        return self.class_clearances.get('Default', self.default_clearance)
+
+    def _properties(self, key, item_type):
+        """_net_keyの値からルールの条件式で見る属性を作る"""
+        if not self.by_name:
+            return {'NetClass': key, 'NetName': '', 'Type': item_type}
+        return {'NetClass': self.net_classes.get(key, 'Default'), 'NetName': self.net_names.get(key, ''),
+                'Type': item_type}
+
+class _ViaClearanceTable(dict):
+    """ClearanceResolver.via_tableの表（無い番号は引いたときに求める）"""
+    def __init__(self, resolver, net, layer_mask, profiles):
+        super().__init__()
+        self.resolver = resolver
+        self.net = net
+        self.layer_mask = layer_mask
+        self.profiles = profiles
+
+    def __missing__(self, profile):
+        other_net, other_mask, item_type = self.profiles[profile]
+        value = self[profile] = self.resolver.clearance(self.net, other_net, self.layer_mask & other_mask, item_type)
+        return value
+
+def _rule_layer_matches(rule_layer, layer):
+    if rule_layer is None or layer is None:
+        return True
+    if rule_layer == 'outer':
+        return layer in ('F.Cu', 'B.Cu')
+    if rule_layer == 'inner':
+        return layer not in ('F.Cu', 'B.Cu')
+    return rule_layer == layer
+
+def _condition_matches(condition, a, b):
+    """via_cleaner_rules.parse_conditionの木をA=a, B=bで評価"""
+    op = condition[0]
+    if op == 'const':
+        return condition[1]
+    if op == 'not':
+        return not _condition_matches(condition[1], a, b)
+    if op == 'and':
+        return _condition_matches(condition[1], a, b) and _condition_matches(condition[2], a, b)
+    if op == 'or':
+        return _condition_matches(condition[1], a, b) or _condition_matches(condition[2], a, b)
+    item = a if condition[1] == 'A' else b
+    if op == 'has':
+        return condition[2] in item['NetClass'].split(',')
+    name, pattern = condition[2], condition[3]
+    value = item[name]
+    if name == 'Type':
+        matched = fnmatch.fnmatchcase(value.lower(), pattern.lower())
+    else:
+        matched = fnmatch.fnmatchcase(value, pattern)
+    return matched if op == 'eq' else not matched
+
+def _condition_uses(condition, name):
+    if condition[0] in ('and', 'or'):
+        return _condition_uses(condition[1], name) or _condition_uses(condition[2], name)
+    if condition[0] == 'not':
+        return _condition_uses(condition[1], name)
+    return condition[0] in ('eq', 'ne') and condition[2] == name
+
+# 抽出した形状レコード（pcbnew非依存・pickle可能）
+ViaRecord = namedtuple('ViaRecord', 'x y radius net uuid layers drill_radius',
+                       defaults=(0,))  # layersは貫通する銅箔層名のタプル、drill_radiusは穴の半径（不明なら0）
+HoleRecord = namedtuple('HoleRecord', 'x1 y1 x2 y2 radius uuid layers')  # パッドの穴（長穴は両端の中心を結ぶ線分）
+TrackRecord = namedtuple('TrackRecord', 'kind x1 y1 x2 y2 mx my half_width net uuid layer')  # kindは'segment'/'arc'
+
+class BoardGeometry:
+    """チェックに必要な形状だけを抜き出した基板データ
+
+    pcbnew経由（extract_geometry）と.kicad_pcbの直接読み込み（via_cleaner_sexpr）の
+    どちらも同じ形で作り、チェック処理はこれだけを参照する。
+    """
+    def __init__(self):
+        self.vias = []          # ViaRecord
+        self.tracks = []        # TrackRecord（配線・円弧）
+        self.footprints = []    # {'uuid', 'bbox': (x0, y0, x1, y1), 'courtyards': [点列],
+                                #  'pads': [(net, 点列, bbox, 銅箔層名のタプル)]}
+        self.outlines = []      # Edge.Cuts図形 ('segment', x1, y1, x2, y2, uuid) /
+                                # ('arc', sx, sy, mx, my, ex, ey, uuid) / ('circle', cx, cy, r, uuid)
+                                # （uuidは分解する前の図形のUUID）
+        self.board_bbox = None  # Edge.Cutsの外形ボックス (x0, y0, x1, y1)
+        self.zones = []         # {'uuid', 'name', 'net': net, 'layers': (層名, ...),
+                                #  'polygons': [(外周, [穴, ...]), ...],
+                                #  'fills': {層名: [(外周, [穴, ...]), ...]}（use_zone_fills・thin_stitchingで
+                                #           塗りつぶし済みのときだけ。ゾーンのチェックはuse_zone_fillsのときだけ使う）}
+        self.holes = []         # スルーホールパッドの穴 HoleRecord（VIAの穴はViaRecord.drill_radius）
+        self.keepouts = []      # VIAを禁止したルールエリア {'uuid', 'name', 'layers': (層名, ...),
+                                #  'polygons': [(外周, [穴, ...]), ...]}（VIAを禁止しないルールエリアは含めない）
+        self.net_names = {}     # ネットコード → ネット名
+        self.copper_layers = [] # 銅箔層名（積層順）
+        self.net_classes = {}   # ネットコード → ネットクラス名（複数なら'HV,Default'）
+        self.class_clearances = {}  # ネットクラス名 → クリアランス
+        self.clearance_rules = []   # カスタムルール（via_cleaner_rules.read_custom_rules）
+        self.min_clearance = 0      # 基板の最小クリアランス
+
+def copper_layers(board):
+    """有効な銅箔層を積層順に[(層ID, 層名), ...]で返す"""
+    try:
+        layer_ids = list(board.GetEnabledLayers().CuStack())
+    except AttributeError:
+        layer_ids = [pcbnew.F_Cu, pcbnew.B_Cu]  # 旧APIでは外層だけ
+    return [(layer_id, board.GetLayerName(layer_id)) for layer_id in layer_ids]
+
+def via_record(via, copper=()):
+    """pcbnewのVIAをViaRecordに変換（copperはcopper_layers()の結果）
+
+    貫通する層はTopLayer/BottomLayerの間の銅箔層として1回だけ求める（ブラインド・
+    ベリッド・マイクロVIAは一部の層だけになる）。
+    """
+    pos = via.GetPosition()
+    layer_ids = [layer_id for layer_id, name in copper]
+    try:
+        top, bottom = via.TopLayer(), via.BottomLayer()
+    except AttributeError:
+        top = bottom = None
+    if top in layer_ids and bottom in layer_ids:
+        first, last = sorted((layer_ids.index(top), layer_ids.index(bottom)))
+        layers = tuple(name for layer_id, name in copper[first:last + 1])
+    else:
+        layers = tuple(name for layer_id, name in copper if via.IsOnLayer(layer_id))
+    return ViaRecord(pos.x, pos.y, via.GetWidth() // 2, via.GetNetCode(), via.m_Uuid.AsString(), layers,
+                     via.GetDrillValue() // 2)
+
+def _item_layers(item, copper):
+    """ゾーン・パッドが乗る銅箔層名のタプル"""
+    try:
+        layer_ids = set(item.GetLayerSet().CuStack())
+    except AttributeError:
+        layer_ids = {item.GetLayer()}
+    return tuple(name for layer_id, name in copper if layer_id in layer_ids)
+
+def _zone_fills(zone, copper):
+    """ゾーンの塗りつぶし形状 {層名: [(外周, [穴, ...]), ...]}（塗りつぶされていなければNone）"""
+    if not (hasattr(zone, 'GetFilledPolysList') and zone.IsFilled()):
+        return None
+    layers = _item_layers(zone, copper)
+    return {name: poly_set_polygons(zone.GetFilledPolysList(layer_id)) for layer_id, name in copper if name in layers}
+
+def extract_geometry(board, settings):
+    """pcbnewの基板から、有効なチェックに必要な形状だけを1回のSWIG走査で抜き出す"""
+    geometry = BoardGeometry()
+    
+    for net_code, net in board.GetNetsByNetcode().items():
+        geometry.net_names[net_code] = net.GetNetname()
+    copper = copper_layers(board)
+    geometry.copper_layers = [name for layer_id, name in copper]
+    layer_names = dict(copper)
+    if settings['check_nets'] or settings['check_components']:
+        _read_net_classes(board, geometry)
+        load_design_rules(geometry, board.GetFileName())
+    
+    # 間引きにも他ネットのVIAとゾーンを、穴の間隔のチェックにもVIAを使う（配線は使わない）
+    thinning = settings.get('thin_stitching', False)
+    check_drills = settings.get('check_drills', False)
+    if settings['check_nets'] or thinning or check_drills:
+        for track in board.GetTracks():
+            track_type = track.Type()
+            if track_type == pcbnew.PCB_VIA_T:
+                geometry.vias.append(via_record(track, copper))
+            elif not settings['check_nets']:
+                continue
+            elif track_type == pcbnew.PCB_TRACE_T:
+                start = track.GetStart()
+                end = track.GetEnd()
+                geometry.tracks.append(TrackRecord('segment', start.x, start.y, end.x, end.y, 0, 0,
+                                                   track.GetWidth() // 2, track.GetNetCode(),
+                                                   track.m_Uuid.AsString(), layer_names.get(track.GetLayer())))
+            elif track_type == pcbnew.PCB_ARC_T:
+                start = track.GetStart()
+                mid = track.GetMid()
+                end = track.GetEnd()
+                geometry.tracks.append(TrackRecord('arc', start.x, start.y, end.x, end.y, mid.x, mid.y,
+                                                   track.GetWidth() // 2, track.GetNetCode(),
+                                                   track.m_Uuid.AsString(), layer_names.get(track.GetLayer())))
+    
+    # 部品の外形ボックスは1回だけ取得してキャッシュ
+    if settings['check_components']:
+        for footprint in board.GetFootprints():
+            bbox = footprint.GetBoundingBox()
+            record = {
+                'uuid': footprint.m_Uuid.AsString(),
+                'bbox': (bbox.GetLeft(), bbox.GetTop(), bbox.GetRight(), bbox.GetBottom()),
+                'courtyards': [],
+                'pads': []
+            }
+            if settings['precise_components']:
+                _add_footprint_shapes(footprint, record, copper)
+            geometry.footprints.append(record)
+    
+    # 穴の間隔のチェック用にスルーホールパッドの穴
+    if check_drills:
+        for footprint in board.GetFootprints():
+            for pad in footprint.Pads():
+                hole = _pad_hole(pad, copper)
+                if hole is not None:
+                    geometry.holes.append(hole)
+    
+    if settings['check_board_edge'] or settings['check_outside_board']:
+        for drawing in board.GetDrawings():
+            if drawing.GetClass() == "PCB_SHAPE" and drawing.GetLayer() == pcbnew.Edge_Cuts:
+                geometry.outlines.extend(_outline_primitives(drawing))
+        try:
+            if hasattr(board, "GetBoardEdgesBoundingBox"):
+                bbox = board.GetBoardEdgesBoundingBox()
+            else:
+                bbox = board.ComputeBoundingBox(True)
+            geometry.board_bbox = (bbox.GetLeft(), bbox.GetTop(), bbox.GetRight(), bbox.GetBottom())
+        except Exception:
+            geometry.board_bbox = None
+    
+    check_keepouts = settings.get('check_keepouts', False)
+    if settings['check_zones'] or thinning or check_keepouts:
+        for zone in board.Zones():
+            if hasattr(zone, 'GetIsRuleArea') and zone.GetIsRuleArea():  # ルールエリアは銅箔ではない
+                if check_keepouts and zone.GetDoNotAllowVias():
+                    geometry.keepouts.append({
+                        'uuid': zone.m_Uuid.AsString(),
+                        'name': zone.GetZoneName() if hasattr(zone, 'GetZoneName') else "",
+                        'layers': _item_layers(zone, copper),
+                        'polygons': poly_set_polygons(zone.Outline())
+                    })
+                continue
+            if not (settings['check_zones'] or thinning):
+                continue
+            record = {
+                'uuid': zone.m_Uuid.AsString(),
+                'name': zone.GetZoneName() if hasattr(zone, 'GetZoneName') else "",
+                'net': zone.GetNetCode(),
+                'layers': _item_layers(zone, copper),
+                'polygons': poly_set_polygons(zone.Outline())
+            }
+            if settings.get('use_zone_fills') or thinning:  # 間引きは塗りつぶしの島ごとにVIAを残す
+                fills = _zone_fills(zone, copper)
+                if fills is not None:
+                    record['fills'] = fills
+            geometry.zones.append(record)
+    
+    return geometry
+
+def _read_net_classes(board, geometry):
+    """pcbnewのネットクラスと基板の最小クリアランスを読む（APIが無ければload_design_rulesに任せる）"""
+    try:
+        for net_code, net in board.GetNetsByNetcode().items():
+            net_class = net.GetNetClass()
+            name = net_class.GetName()
+            geometry.net_classes[net_code] = name
+            if name not in geometry.class_clearances:
+                geometry.class_clearances[name] = net_class.GetClearance()
+        geometry.min_clearance = board.GetDesignSettings().m_MinClearance
+    except AttributeError:
+        geometry.net_classes = {}
+        geometry.class_clearances = {}
+
+def load_design_rules(geometry, board_path):
+    """基板ファイルの隣の.kicad_pro・.kicad_druからネットクラスとカスタムルールを読む
+
+    pcbnewから読めたネットクラスはそのまま使う（未保存の変更を含むため）。
+    """
+    if not board_path:
+        return
+    from via_cleaner_rules import read_custom_rules, read_net_classes
+    if not geometry.class_clearances:
+        geometry.net_classes, geometry.class_clearances, geometry.min_clearance = read_net_classes(
+            board_path, geometry.net_names)
+    geometry.clearance_rules = read_custom_rules(board_path)
+
+def design_rule_files(board_path):
+    """クリアランスに関わるプロジェクトファイルの(パス, 更新日時, サイズ)（フィンガープリント用）"""
+    stats = []
+    for extension in ('.kicad_pro', '.kicad_dru'):
+        path = os.path.splitext(board_path)[0] + extension
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stats.append((path, stat.st_mtime_ns, stat.st_size))
+    return stats
+
+def _outline_primitives(drawing):
+    """Edge.CutsのPCB_SHAPEを線分・円弧・円のプリミティブ列に変換（各プリミティブに図形のUUIDを付ける）"""
+    uuid = drawing.m_Uuid.AsString()
+    shape = drawing.GetShape()
+    start = drawing.GetStart()
+    end = drawing.GetEnd()
+    if shape == pcbnew.SHAPE_T_CIRCLE:
+        center = drawing.GetCenter()
+        return [('circle', center.x, center.y, drawing.GetRadius(), uuid)]
+    if shape == pcbnew.SHAPE_T_ARC:
+        mid = drawing.GetArcMid()
+        return [('arc', start.x, start.y, mid.x, mid.y, end.x, end.y, uuid)]
+    if shape == pcbnew.SHAPE_T_RECT:
+        return polyline_primitives([(start.x, start.y), (end.x, start.y), (end.x, end.y), (start.x, end.y)],
+                                   closed=True, uuid=uuid)
+    if shape == pcbnew.SHAPE_T_POLY:
+        primitives = []
+        for outline in poly_set_outlines(drawing.GetPolyShape()):
+            primitives.extend(polyline_primitives(outline, closed=True, uuid=uuid))
+        return primitives
+    if shape == pcbnew.SHAPE_T_BEZIER:
+        c1 = drawing.GetBezierC1()
+        c2 = drawing.GetBezierC2()
+        return polyline_primitives(bezier_points(start.x, start.y, c1.x, c1.y, c2.x, c2.y, end.x, end.y),
+                                   uuid=uuid)
+    return [('segment', start.x, start.y, end.x, end.y, uuid)]
+
+def _add_footprint_shapes(footprint, record, copper):
+    """部品のコートヤードとパッド形状を点列としてキャッシュ（精密判定用）"""
+    try:
+        if hasattr(footprint, "BuildCourtyardCaches"):
+            footprint.BuildCourtyardCaches()
+        for layer in (pcbnew.F_CrtYd, pcbnew.B_CrtYd):
+            record['courtyards'].extend(outline for outline in poly_set_outlines(footprint.GetCourtyard(layer))
+                                        if len(outline) >= 3)
+    except (AttributeError, TypeError):
+        pass  # コートヤードAPIが無い場合はパッドだけで判定
+    
+    for pad in footprint.Pads():
+        try:
+            try:
+                poly_set = pad.GetEffectivePolygon(pad.GetPrincipalLayer(), pcbnew.ERROR_INSIDE)
+            except TypeError:
+                poly_set = pad.GetEffectivePolygon(pcbnew.ERROR_INSIDE)  # 旧API
+            outlines = poly_set_outlines(poly_set)
+        except AttributeError:
+            bbox = pad.GetBoundingBox()
+            outlines = [[(bbox.GetLeft(), bbox.GetTop()), (bbox.GetRight(), bbox.GetTop()),
+                         (bbox.GetRight(), bbox.GetBottom()), (bbox.GetLeft(), bbox.GetBottom())]]
+        for outline in outlines:
+            if outline:
+                record['pads'].append((pad.GetNetCode(), outline, polygon_bounding_box(outline),
+                                       _item_layers(pad, copper)))
+
+def _pad_hole(pad, copper):
+    """パッドの穴をHoleRecordにする（穴が無ければNone）。長穴はパッドの向きに回した線分にする"""
+    size = pad.GetDrillSize()
+    if size.x <= 0 or size.y <= 0:
+        return None
+    pos = pad.GetPosition()
+    radius = min(size.x, size.y) // 2
+    half_length = abs(size.x - size.y) / 2.0
+    dx, dy = (half_length, 0.0) if size.x >= size.y else (0.0, half_length)
+    if half_length:
+        try:
+            angle = pad.GetOrientation().AsRadians()
+        except AttributeError:
+            angle = math.radians(pad.GetOrientationDegrees())  # 旧API
+        # KiCadの回転（Y軸下向き、正の角度で画面上反時計回り）
+        dx, dy = dx * math.cos(angle) + dy * math.sin(angle), -dx * math.sin(angle) + dy * math.cos(angle)
+    dx, dy = int(round(dx)), int(round(dy))
+    return HoleRecord(pos.x - dx, pos.y - dy, pos.x + dx, pos.y + dy, radius, pad.m_Uuid.AsString(),
+                      _item_layers(pad, copper))
+
+class ViaChecker:
+    """選択VIAのチェックパイプライン（profileを渡すとステージごとの時間とカウンタを記録）
+
+    violations（ViolationWriter）を渡すと、VIAごとの判定と削除の原因を塊ごとに書き出す。
+    """
+    def __init__(self, profile=None, violations=None):
+        self.profile = profile
+        self.violations = violations
+        self.net_names = {}
+        self.spatial_cache = None
+        self.excluded_rows = frozenset()
+    
+    def check_vias(self, geometry, selected_vias, settings, prepared=None, selection=None, progress=None):
+        """選択VIA（ViaRecordのリスト）をチェックし、VIAごとの削除理由（削除不要ならNone）のリストを返す
+
+        preparedにprepared_state()の結果（ディスクキャッシュから読んだもの）を渡すと前処理を省略する。
+        resolve_via_conflictsが有効なら、選択VIA同士の衝突はここでは見ずにresolve_conflictsで解消する。
+        selectionはその対象の選択VIA全体（省略時はselected_vias。一部だけを再チェックする場合に渡す）。
+        progressを渡すと塊ごとにprogress(チェック済みの数, 全数)を呼び、Falseが返ればCheckCancelledを送出する。
+        violationsがあれば、判定は塊ごとに原因と一緒に書き出す（全VIAの原因を同時には持たない）。
+        """
+        self.net_names = geometry.net_names
+        self.excluded_rows = self._selected_rows(geometry, selected_vias if selection is None else selection,
+                                                 settings)
+        workers = settings.get('workers', 1)
+        if workers > 1 and len(selected_vias) >= PARALLEL_MIN_VIAS:
+            with profile_stage(self.profile, 'parallel_check'):
+                return check_vias_parallel(geometry, selected_vias, settings, workers, self, prepared, progress)
+        report_progress(progress, 0, len(selected_vias))
+        self.prepare(geometry, settings, prepared)
+        if progress is None and self.violations is None:
+            return self.check_chunk(selected_vias)
+        return self._check_with_progress(selected_vias, progress)
+    
+    def _check_with_progress(self, vias, progress):
+        """1回の処理がPROGRESS_INTERVAL秒程度になるよう塊の大きさを調整しながらチェックし、塊ごとに進捗を報告
+
+        violationsがあれば塊ごとに判定を書き出す。
+        """
+        reasons = []
+        size = PROGRESS_MIN_CHUNK
+        while len(reasons) < len(vias):
+            report_progress(progress, len(reasons), len(vias))
+            start_time = time.perf_counter()
+            chunk = vias[len(reasons):len(reasons) + size]
+            chunk_reasons = self.check_chunk(chunk)
+            if self.violations is not None:
+                self.write_violations(chunk, chunk_reasons, self.explain_chunk(chunk, chunk_reasons))
+            reasons.extend(chunk_reasons)
+            elapsed = time.perf_counter() - start_time
+            size = max(PROGRESS_MIN_CHUNK, min(size * 4, int(size * PROGRESS_INTERVAL / max(elapsed, 1e-6))))
+        report_progress(progress, len(vias), len(vias))
+        return reasons
+    
+    def _selected_rows(self, geometry, selection, settings):
+        """ネット衝突・穴の間隔の相手から外す、選択VIAのエンジン行番号（どちらのエンジンも行番号はgeometry.viasの順）"""
+        if not (settings.get('resolve_via_conflicts') and (settings['check_nets'] or settings.get('check_drills'))):
+            return frozenset()
+        uuids = {via.uuid for via in selection}
+        return frozenset(row for row, via in enumerate(geometry.vias) if via.uuid in uuids)
+    
+    def prepare(self, geometry, settings, prepared=None):
+        """チェックの前処理（空間インデックス等の構築）。以降のcheck_chunkは読み取りのみ"""
+        profile = self.profile
+        self.settings = settings
+        self._prepare_clearances(geometry, settings)
+        self.board_edge_clearance = int(settings['board_edge_clearance'] * IU_PER_MM)
+        self.zone_clearance = int(settings['zone_clearance'] * IU_PER_MM)
+        
+        if prepared is not None:
+            spatial_cache, self.board_info, self.zone_info, self.keepout_info = prepared
+            self.spatial_cache = dict(spatial_cache)
+        else:
+            # 高速化のための前処理
+            with profile_stage(profile, 'build_spatial_cache'):
+                self.spatial_cache = self._build_spatial_cache(geometry, self.min_clearance,
+                                                               settings['check_components'], settings['check_nets'],
+                                                               settings.get('check_drills', False))
+            with profile_stage(profile, 'get_board_info'):
+                self.board_info = self._get_board_info(geometry, settings['check_board_edge'],
+                                                       settings['check_outside_board'])
+            with profile_stage(profile, 'get_zone_info'):
+                self.zone_info = self._get_zone_info(geometry, settings['check_zones'],
+                                                     settings.get('use_zone_fills', False))
+            with profile_stage(profile, 'get_keepout_info'):
+                self.keepout_info = self._get_keepout_info(geometry, settings.get('check_keepouts', False))
+        
+        # 有効なチェックをチェック順に並べる
+        checks = [
+            ('outside_board', settings['check_outside_board'] and self.board_info is not None,
+             self._check_outside_board),
+            ('keepout_violation', self.keepout_info is not None, self._check_keepouts),
+            ('component_collision', 'footprint_index' in self.spatial_cache, self._check_components),
+            ('net_collision', 'track_engine' in self.spatial_cache, self._check_nets),
+            ('drill_collision', 'drill_engine' in self.spatial_cache, self._check_drills),
+            ('board_edge_collision', settings['check_board_edge'] and self.board_info is not None
+             and self.board_info['outline'] is not None, self._check_board_edge),
+            ('zone_collision', self.zone_info is not None, self._check_zones),
+        ]
+        self.checks = [(reason, profile.timed(reason, check) if profile else check)
+                       for reason, enabled, check in checks if enabled]
+    
+    def _prepare_clearances(self, geometry, settings):
+        """ネット間クリアランスの表と銅箔層のビット割り当て（インデックスを使わない処理でも必要）"""
+        self.min_clearance = int(settings['clearance'] * IU_PER_MM)
+        self.layer_bits = {layer: 1 << bit for bit, layer in enumerate(geometry.copper_layers)}
+        self.layer_masks = {}
+        self.clearances = ClearanceResolver(geometry, self.min_clearance, settings.get('use_design_rules', True))
+        self.hole_to_hole = int(settings.get('hole_to_hole', 0) * IU_PER_MM) if settings.get('check_drills') else None
+    
+    def _layer_mask(self, layers):
+        """銅箔層名のタプルをビットマスクにする（層が分からなければ全層を表す-1）"""
+        mask = self.layer_masks.get(layers)
+        if mask is None:
+            if layers and all(layer in self.layer_bits for layer in layers):
+                mask = 0
+                for layer in layers:
+                    mask |= self.layer_bits[layer]
+            else:
+                mask = -1
+            self.layer_masks[layers] = mask
+        return mask
+    
+    def prepared_state(self):
+        """prepareで作った空間インデックス類（VIAの選択に依存しない部分。ディスクキャッシュ用）"""
+        if self.spatial_cache is None:
+            return None  # 並列チェックでワーカーだけがprepareした場合
+        spatial_cache = {key: value for key, value in self.spatial_cache.items()
+                         if key not in ('net_collisions', 'drill_collisions')}
+        return spatial_cache, self.board_info, self.zone_info, self.keepout_info
+    
+    def check_chunk(self, vias):
+        """prepare済みの状態でVIAの一部をチェック（結果は分割の仕方に依存しない）"""
+        profile = self.profile
+        spatial_cache = self.spatial_cache
+        if 'track_engine' in spatial_cache:
+            with profile_stage(profile, 'net_collision_batch'):
+                spatial_cache['net_collisions'] = self._find_net_collisions(
+                    vias, spatial_cache['track_engine'], spatial_cache['track_index'], self.min_clearance)
+        if 'drill_engine' in spatial_cache:
+            with profile_stage(profile, 'drill_collision_batch'):
+                spatial_cache['drill_collisions'] = self._find_drill_collisions(vias)
+        
+        with profile_stage(profile, 'check_loop'):
+            if profile is not None and profile.cprofile is not None:
+                profile.cprofile.enable()
+            reasons = [self._check_via_fast(via, via_index) for via_index, via in enumerate(vias)]
+            if profile is not None and profile.cprofile is not None:
+                profile.cprofile.disable()
+        
+        if profile is not None:
+            profile.add('vias', len(vias))
+            for reason in REMOVAL_REASONS:
+                profile.add(reason + '.hits', sum(1 for r in reasons if r == reason))
+            self._record_index_counters(profile)
+        return reasons
+    
+    def _record_index_counters(self, profile):
+        """各空間インデックスの検索回数と訪問セル数を記録"""
+        indexes = []
+        if 'footprint_index' in self.spatial_cache:
+            indexes.append(('footprint', self.spatial_cache['footprint_index']))
+        if 'track_index' in self.spatial_cache:
+            indexes.append(('track', self.spatial_cache['track_index']))
+        if 'drill_index' in self.spatial_cache:
+            indexes.append(('drill', self.spatial_cache['drill_index']))
+        if self.board_info is not None and self.board_info['outline'] is not None:
+            indexes.append(('outline', self.board_info['outline'].index))
+        if self.zone_info is not None:
+            indexes.extend(('zone.' + layer, index) for layer, index in sorted(self.zone_info['indexes'].items()))
+        if self.keepout_info is not None:
+            indexes.extend(('keepout.' + layer, index) for layer, index in sorted(self.keepout_info['indexes'].items()))
+        for name, index in indexes:
+            profile.add(f'index.{name}.queries', index.query_count)
+            profile.add(f'index.{name}.cells', index.cell_count)
+            index.query_count = index.cell_count = 0
+    
+    def _build_spatial_cache(self, geometry, min_clearance, check_components, check_nets, check_drills=False):
+        """空間インデックスとキャッシュを構築"""
+        cache = {'via_rows': len(geometry.vias)}  # エンジンの先頭からこの数の行がVIA
+        
+        # 部品の空間インデックス
+        if check_components:
+            footprint_index = BoardSpatialIndex()
+            for record in geometry.footprints:
+                footprint_index.add_item(record['bbox'], None, record)
+            cache['footprint_index'] = footprint_index
+        
+        # トラック・VIAを一括計算エンジンへ読み込み、基板全体で1つの空間インデックスに
+        # 外形ボックスと銅箔層のビットマスクで登録する（インデックスの中身はエンジンの行番号）
+        # 行ごとに(ネット, 層マスク, 種別)のプロファイル番号を持たせ、ネットペアごとの
+        # クリアランスはVIA側の表をこの番号で引く
+        if check_nets:
+            engine = ClearanceBatchEngine()
+            track_index = BoardSpatialIndex()
+            profiles = {}
+            row_profiles = []
+            row_uuids = [via.uuid for via in geometry.vias] + [track.uuid for track in geometry.tracks]
+            for via in geometry.vias:
+                row = engine.add_via(via.x, via.y, via.radius, via.net)
+                layer_mask = self._layer_mask(via.layers)
+                track_index.add_item(engine.bounding_box(row), via.net, row, layer_mask=layer_mask)
+                row_profiles.append(profiles.setdefault((via.net, layer_mask, 'Via'), len(profiles)))
+            for track in geometry.tracks:
+                layer_mask = self._layer_mask((track.layer,) if track.layer else ())
+                if track.kind == 'arc':
+                    row = engine.add_arc(track.x1, track.y1, track.mx, track.my, track.x2, track.y2,
+                                         track.half_width, track.net)
+                    track_index.add_item(engine.bounding_box(row), track.net, row, layer_mask=layer_mask)
+                    item_type = 'Arc'
+                else:
+                    row = engine.add_segment(track.x1, track.y1, track.x2, track.y2, track.half_width, track.net)
+                    track_index.add_segment(track.x1, track.y1, track.x2, track.y2, track.half_width,
+                                            track.net, row, layer_mask)
+                    item_type = 'Track'
+                row_profiles.append(profiles.setdefault((track.net, layer_mask, item_type), len(profiles)))
+            cache['track_engine'] = engine
+            cache['track_index'] = track_index
+            cache['row_profiles'] = row_profiles
+            cache['profiles'] = list(profiles)
+            cache['row_uuids'] = row_uuids
+        
+        # VIAとパッドの穴も1回だけエンジンへ読み込み、穴の外形ボックスで登録する（ネットは問わない）
+        # VIAの行番号はgeometry.viasの順（穴の大きさが分からないVIAは行だけ取って登録しない）
+        if check_drills:
+            engine = ClearanceBatchEngine()
+            drill_index = BoardSpatialIndex()
+            hole_uuids = []
+            for via in geometry.vias:
+                x, y, drill_radius = via.x, via.y, via.drill_radius
+                row = engine.add_via(x, y, drill_radius, None)
+                if drill_radius > 0:
+                    drill_index.add_item((x - drill_radius, y - drill_radius, x + drill_radius, y + drill_radius),
+                                         None, row, layer_mask=self._layer_mask(via.layers))
+                hole_uuids.append(via.uuid)
+            for hole in geometry.holes:
+                row = engine.add_segment(hole.x1, hole.y1, hole.x2, hole.y2, hole.radius, None)
+                drill_index.add_segment(hole.x1, hole.y1, hole.x2, hole.y2, hole.radius, None, row,
+                                        self._layer_mask(hole.layers))
+                hole_uuids.append(hole.uuid)
+            cache['drill_engine'] = engine
+            cache['drill_index'] = drill_index
+            cache['hole_uuids'] = hole_uuids
+        
+        return cache
+    
+    def _get_board_info(self, geometry, check_board_edge, check_outside_board):
+        """基板情報を取得"""
+        if not (check_board_edge or check_outside_board):
+            return None
+        
+        # 外形は1回だけ線分・円弧に分解して索引化
+        outline = BoardOutline(geometry.outlines) if geometry.outlines else None
+        return {
+            'outline': outline,
+            'bbox': geometry.board_bbox if check_outside_board else None
+        }
+    
+    def _get_zone_info(self, geometry, check_zones, use_fills=False):
+        """ゾーン情報を取得（外形ボックスで銅箔層ごとの空間インデックスに(ゾーン, 塗りつぶし)を登録）
+
+        use_fillsで塗りつぶし形状があるゾーンは、層ごとの塗りつぶしの外周・穴を線分に分けて
+        BoardOutline（グリッド索引と行ごとの内外判定）にしておく。無ければ塗りつぶしはNoneで外形で判定する。
+        """
+        if not check_zones:
+            return None
+        
+        indexes = {}
+        for zone in geometry.zones:
+            fills = zone.get('fills') if use_fills else None
+            if fills is None:
+                bbox = _zone_bbox(zone)
+                if bbox is None:
+                    continue
+                item = (zone, None)
+                shapes = [(layer, bbox, item) for layer in zone['layers']]
+            else:
+                shapes = []
+                for layer in zone['layers']:
+                    rings = [ring for outline, holes in fills.get(layer, ()) for ring in [outline] + holes if ring]
+                    if not rings:
+                        continue  # この層には銅箔が無い
+                    primitives = [primitive for ring in rings
+                                  for primitive in polyline_primitives(ring, True, zone['uuid'])]
+                    boxes = [polygon_bounding_box(ring) for ring in rings]
+                    bbox = (min(box[0] for box in boxes), min(box[1] for box in boxes),
+                            max(box[2] for box in boxes), max(box[3] for box in boxes))
+                    shapes.append((layer, bbox, (zone, BoardOutline(primitives))))
+            for layer, bbox, item in shapes:
+                if layer not in indexes:
+                    indexes[layer] = BoardSpatialIndex()
+                indexes[layer].add_item(bbox, zone['net'], item)
+        return {'indexes': indexes}
+    
+    def _get_keepout_info(self, geometry, check_keepouts):
+        """VIA禁止のルールエリアを外形ボックスで銅箔層ごとの空間インデックスに登録（無ければNone）"""
+        if not (check_keepouts and geometry.keepouts):
+            return None
+        
+        indexes = {}
+        for keepout in geometry.keepouts:
+            bbox = _zone_bbox(keepout)
+            if bbox is None:
+                continue
+            for layer in keepout['layers']:
+                if layer not in indexes:
+                    indexes[layer] = BoardSpatialIndex()
+                indexes[layer].add_item(bbox, None, keepout)
+        return {'indexes': indexes}
+    
+    def _check_via_fast(self, via, via_index):
+        """高速化されたVIAチェック（最初に該当した削除理由、削除不要ならNone）"""
+        for reason, check in self.checks:
+            if check(via, via_index):
+                return reason
+        return None  # 削除不要
+    
+    def _check_outside_board(self, via, via_index):
+        """基板外チェック（外形ボックスで弾いてから、閉じた外形なら切り欠き・穴も含めて判定）"""
+        board_info = self.board_info
+        if board_info['bbox']:
+            x0, y0, x1, y1 = board_info['bbox']
+            if not (x0 <= via.x <= x1 and y0 <= via.y <= y1):
+                return True
+        outline = board_info['outline']
+        return outline is not None and outline.closed and not outline.contains(via.x, via.y)
+    
+    def _check_keepouts(self, via, via_index):
+        """VIA禁止のルールエリアとの重なりチェック（VIAが貫通する層のエリアだけ。ネットは問わない）"""
+        return self._find_keepout(via) is not None
+    
+    def _find_keepout(self, via):
+        """VIAが重なるVIA禁止のルールエリアとVIAの中心からの距離（無ければNone）"""
+        indexes = self.keepout_info['indexes']
+        checked = set()
+        for layer in (via.layers or indexes):
+            if layer not in indexes:
+                continue
+            for keepout in indexes[layer].query(via.x - via.radius, via.y - via.radius,
+                                                via.x + via.radius + 1, via.y + via.radius + 1):
+                if id(keepout) in checked:
+                    continue
+                checked.add(id(keepout))
+                if self.profile is not None:
+                    self.profile.add('keepout_violation.candidates')
+                distance = point_poly_set_distance(via.x, via.y, keepout['polygons'])
+                if distance < via.radius:
+                    return keepout, distance
+        return None
+    
+    def _check_components(self, via, via_index):
+        """部品との衝突チェック（外形ボックスが重なる部品だけを候補にする）"""
+        return self._find_component(via) is not None
+    
+    def _find_component(self, via):
+        """VIAが衝突する部品と_footprint_collisionの結果（無ければNone）"""
+        reach = self.clearances.reach(via.net, self._layer_mask(via.layers)) + via.radius
+        candidates = self.spatial_cache['footprint_index'].query(via.x - reach, via.y - reach,
+                                                                 via.x + reach, via.y + reach)
+        if self.profile is not None:
+            self.profile.add('component_collision.candidates', len(candidates))
+        for footprint in candidates:
+            collision = self._footprint_collision(via, footprint)
+            if collision is not None:
+                return footprint, collision
+        return None
+    
+    def _check_nets(self, via, via_index):
+        """異なるネットとの衝突チェック（前処理で一括計算した結果を参照）"""
+        return self.spatial_cache['net_collisions'][via_index] >= 0
+    
+    def _check_drills(self, via, via_index):
+        """他の穴との間隔チェック（前処理で一括計算した結果を参照）"""
+        return self.spatial_cache['drill_collisions'][via_index] >= 0
+    
+    def _check_board_edge(self, via, via_index):
+        """基板エッジとの衝突チェック"""
+        return self.board_info['outline'].is_within(via.x, via.y, self.board_edge_clearance + via.radius)
+    
+    def _check_zones(self, via, via_index):
+        """ゾーンとの衝突チェック"""
+        return self._find_zone(via) is not None
+    
+    def _find_zone(self, via):
+        """VIAが衝突するゾーンとVIAの中心からの距離（無ければNone）"""
+        clearance_needed = self.zone_clearance + via.radius
+        x0 = int(via.x - clearance_needed)
+        y0 = int(via.y - clearance_needed)
+        x1 = int(via.x + clearance_needed) + 1
+        y1 = int(via.y + clearance_needed) + 1
+        
+        # VIAが貫通する層のゾーンのうち、外形ボックスが重なる他ネットのものだけを厳密に計算
+        indexes = self.zone_info['indexes']
+        checked = set()
+        for layer in (via.layers or indexes):
+            if layer not in indexes:
+                continue
+            for item in indexes[layer].query(x0, y0, x1, y1, exclude_net=via.net):
+                if id(item) in checked:
+                    continue
+                checked.add(id(item))
+                if self.profile is not None:
+                    self.profile.add('zone_collision.candidates')
+                zone, fill = item
+                if fill is None:
+                    distance = point_poly_set_distance(via.x, via.y, zone['polygons'])
+                    if distance < clearance_needed:
+                        return zone, distance
+                elif fill.contains(via.x, via.y):
+                    return zone, 0.0
+                else:
+                    nearest = fill.nearest(via.x, via.y, clearance_needed)
+                    if nearest is not None:
+                        return zone, nearest[0]
+        return None
+    
+    def _footprint_collision(self, via, footprint):
+        """部品との衝突判定（形状が無ければ従来どおり外形ボックスで判定）
+
+        衝突すれば(種類, VIAの縁からの距離, 必要な距離)、しなければNone。外形ボックス・コートヤードの内側は距離なし。
+        """
+        courtyards = footprint['courtyards']
+        pads = footprint['pads']
+        if not courtyards and not pads:
+            x0, y0, x1, y1 = footprint['bbox']
+            return ('footprint', None, None) if x0 <= via.x <= x1 and y0 <= via.y <= y1 else None
+        
+        for outline in courtyards:
+            if point_in_polygon(via.x, via.y, outline):
+                return 'courtyard', None, None
+        
+        via_mask = self._layer_mask(via.layers)
+        for pad_net, outline, (x0, y0, x1, y1), pad_layers in pads:
+            if pad_net == via.net and pad_net != 0:
+                continue  # 同じネットのパッド上のVIAは許容
+            layer_mask = via_mask & self._layer_mask(pad_layers)
+            if not layer_mask:
+                continue  # VIAが届かない層のパッド（ベリッドVIAと表面実装パッドなど）
+            clearance = self.clearances.clearance(via.net, pad_net, layer_mask, 'Pad')
+            reach = clearance + via.radius
+            if via.x < x0 - reach or via.x > x1 + reach or via.y < y0 - reach or via.y > y1 + reach:
+                continue
+            distance = point_polygon_distance(via.x, via.y, outline)
+            if distance < reach:
+                return 'pad', distance - via.radius, clearance
+        return None
+    
+    def _find_net_collisions(self, selected_vias, engine, track_index, min_clearance):
+        """選択VIAごとに、異なるネットで最初に衝突するアイテムの行番号を一括で求める（無ければ-1）
+
+        ネットクラス・カスタムルールがあれば、候補ごとのクリアランスをClearanceResolverの表から引き、
+        検索範囲はそのVIAに掛かりうる最大のクリアランスまで広げる。
+        """
+        resolver = self.clearances
+        row_profiles = self.spatial_cache['row_profiles']
+        profiles = self.spatial_cache['profiles']
+        excluded_rows = self.excluded_rows
+        points = []
+        candidates = []
+        clearances = None if resolver.uniform else []
+        if clearances is None:
+            min_clearance = resolver.reach(None)  # 全ペア共通（基板の最小クリアランスを下限に）
+        for via in selected_vias:
+            # 登録ボックスは線幅込みなので、VIA半径+クリアランスの範囲と重なり、
+            # VIAが貫通する層にある他ネットだけが候補
+            via_mask = self._layer_mask(via.layers)
+            reach = (min_clearance if clearances is None else resolver.reach(via.net, via_mask)) + via.radius
+            points.append((via.x, via.y, via.radius))
+            rows = track_index.query(via.x - reach, via.y - reach, via.x + reach, via.y + reach,
+                                     exclude_net=via.net, layer_mask=via_mask)
+            if excluded_rows:
+                rows = [row for row in rows if row not in excluded_rows]
+            candidates.append(rows)
+            if clearances is not None:
+                table = resolver.via_table(via.net, via_mask, profiles)
+                clearances.append([table[row_profiles[row]] for row in rows])
+        if self.profile is not None:
+            self.profile.add('net_collision.candidates', sum(len(items) for items in candidates))
+        return engine.find_collisions(points, candidates, min_clearance if clearances is None else clearances)
+    
+    def _find_drill_collisions(self, selected_vias):
+        """選択VIAごとに、穴の縁どうしがhole_to_holeより近い最初の穴の行番号を一括で求める（無ければ-1）
+
+        VIAが貫通する層に掛かる穴だけが相手で、ネットは問わない。穴の大きさが分からないVIAは調べない。
+        """
+        engine = self.spatial_cache['drill_engine']
+        drill_index = self.spatial_cache['drill_index']
+        hole_uuids = self.spatial_cache['hole_uuids']
+        excluded_rows = self.excluded_rows
+        hole_to_hole = self.hole_to_hole
+        points = []
+        candidates = []
+        for via in selected_vias:
+            points.append((via.x, via.y, via.drill_radius))
+            if via.drill_radius <= 0:
+                candidates.append([])
+                continue
+            reach = hole_to_hole + via.drill_radius
+            rows = drill_index.query(via.x - reach, via.y - reach, via.x + reach, via.y + reach,
+                                     layer_mask=self._layer_mask(via.layers))
+            candidates.append([row for row in rows if row not in excluded_rows and hole_uuids[row] != via.uuid])
+        if self.profile is not None:
+            self.profile.add('drill_collision.candidates', sum(len(items) for items in candidates))
+        return engine.find_collisions(points, candidates, hole_to_hole)
+    
+    def explain_chunk(self, vias, reasons):
+        """check_chunkの直後に、削除するVIAごとの原因(UUID, 種類, 距離, 必要な距離)を求める（削除しなければNone）
+
+        チェック本体は真偽だけを返して速さを保ち、原因は削除するVIAについてだけ同じインデックスで求め直す。
+        距離はnmで、分からない値（基板外、部品の外形ボックス・コートヤードの内側など）はNone。
+        """
+        explainers = {
+            'outside_board': self._explain_outside_board,
+            'keepout_violation': self._explain_keepout,
+            'component_collision': self._explain_component,
+            'net_collision': self._explain_net,
+            'drill_collision': self._explain_drill,
+            'board_edge_collision': self._explain_board_edge,
+            'zone_collision': self._explain_zone,
+        }
+        return [explainers[reason](via, via_index) if reason else None
+                for via_index, (via, reason) in enumerate(zip(vias, reasons))]
+    
+    def write_violations(self, vias, reasons, details=None):
+        """判定をviolationsへ1件ずつ書く（detailsはexplain_chunkの結果）"""
+        net_names = self.net_names
+        for index, (via, reason) in enumerate(zip(vias, reasons)):
+            self.violations.write(via, reason, net_names.get(via.net, ""), details[index] if details else None)
+    
+    def _explain_outside_board(self, via, via_index):
+        outline = self.board_info['outline']
+        nearest = outline.nearest(via.x, via.y) if outline is not None else None
+        culprit = nearest[1] if nearest else None  # 最も近いEdge.Cuts図形
+        bbox = self.board_info['bbox']
+        if bbox and not (bbox[0] <= via.x <= bbox[2] and bbox[1] <= via.y <= bbox[3]):
+            return culprit, 'board_bbox', None, None
+        return culprit, 'outline', None, None
+    
+    def _explain_keepout(self, via, via_index):
+        keepout, distance = self._find_keepout(via)
+        return keepout['uuid'], 'keepout', distance - via.radius, 0
+    
+    def _explain_component(self, via, via_index):
+        footprint, (kind, distance, required) = self._find_component(via)
+        return footprint['uuid'], kind, distance, required
+    
+    def _explain_net(self, via, via_index):
+        spatial_cache = self.spatial_cache
+        engine = spatial_cache['track_engine']
+        row = spatial_cache['net_collisions'][via_index]
+        if row < spatial_cache['via_rows']:
+            kind = 'via'
+        else:
+            kind = 'arc' if engine.kind[row] == engine.KIND_ARC else 'track'
+        resolver = self.clearances
+        if resolver.uniform:
+            required = resolver.reach(None)
+        else:
+            table = resolver.via_table(via.net, self._layer_mask(via.layers), spatial_cache['profiles'])
+            required = table[spatial_cache['row_profiles'][row]]
+        distance = engine.distance(row, via.x, via.y) - via.radius - engine.half_width[row]
+        return spatial_cache['row_uuids'][row], kind, distance, required
+    
+    def _explain_drill(self, via, via_index):
+        spatial_cache = self.spatial_cache
+        engine = spatial_cache['drill_engine']
+        row = spatial_cache['drill_collisions'][via_index]
+        distance = engine.distance(row, via.x, via.y) - via.drill_radius - engine.half_width[row]
+        kind = 'via_hole' if row < spatial_cache['via_rows'] else 'pad_hole'
+        return spatial_cache['hole_uuids'][row], kind, distance, self.hole_to_hole
+    
+    def _explain_board_edge(self, via, via_index):
+        distance, uuid = self.board_info['outline'].nearest(via.x, via.y, self.board_edge_clearance + via.radius)
+        return uuid, 'outline', distance - via.radius, self.board_edge_clearance
+    
+    def _explain_zone(self, via, via_index):
+        zone, distance = self._find_zone(via)
+        return zone['uuid'], 'zone', distance - via.radius, self.zone_clearance
+    
+    def resolve_conflicts(self, geometry, selected_vias, reasons, settings):
+        """チェックを通った選択VIA同士の衝突を解消し、(削除理由のリスト, 集計)を返す
+
+        衝突するVIAのペアを辺とするグラフを作り、残すVIAが互いに衝突しないように貪欲法で選ぶ
+        （優先ネット → 大きさ（conflict_prefer_large） → 未決定の衝突相手が少ない順）。
+        check_drillsなら穴の間隔が足りないペア（同じネットも含む）も辺にする。
+        残さなかったVIAの削除理由は'via_conflict'（穴の間隔だけの衝突なら'drill_collision'）。
+        集計は{'pairs', 'conflicting', 'removed', 'kept'}で、conflictingは両方削除していた場合の削除数、
+        keptはそれに比べて残せた数。無効ならreasonsのままでNone。
+        """
+        check_nets = settings['check_nets']
+        if not (settings.get('resolve_via_conflicts') and (check_nets or settings.get('check_drills'))):
+            return reasons, None
+        with profile_stage(self.profile, 'resolve_conflicts'):
+            self._prepare_clearances(geometry, settings)
+            indices = [index for index, reason in enumerate(reasons) if reason is None]
+            vias = [selected_vias[index] for index in indices]
+            neighbors, drill_pairs = self._conflict_graph(vias, check_nets)
+            
+            priority_nets = {name: rank for rank, name in enumerate(settings.get('conflict_priority_nets') or [])}
+            prefer_large = settings.get('conflict_prefer_large', False)
+            degree = {node: len(adjacent) for node, adjacent in neighbors.items()}
+            priorities = {}
+            for node in neighbors:
+                via = vias[node]
+                rank = priority_nets.get(geometry.net_names.get(via.net, ""), len(priority_nets))
+                priorities[node] = (rank, -via.radius if prefer_large else 0)
+            heap = [(priorities[node], degree[node], node) for node in neighbors]
+            heapq.heapify(heap)
+            
+            # 残すVIAを1つ決めるたびに衝突相手を削除し、その相手の未決定の隣接VIAの次数を減らす
+            # （次数が減るたびに新しい項目を積み、古い次数の項目は取り出したときに捨てる）
+            kept = {}
+            removed_by = {}
+            while heap:
+                priority, node_degree, node = heapq.heappop(heap)
+                if node in kept or node_degree != degree[node]:
+                    continue
+                kept[node] = True
+                for other in neighbors[node]:
+                    if other in kept:
+                        continue
+                    kept[other] = False
+                    removed_by[other] = node
+                    for next_node in neighbors[other]:
+                        if next_node not in kept:
+                            degree[next_node] -= 1
+                            heapq.heappush(heap, (priorities[next_node], degree[next_node], next_node))
+            
+            reasons = list(reasons)
+            for node, keep in kept.items():
+                if not keep:
+                    pair = (min(node, removed_by[node]), max(node, removed_by[node]))
+                    reasons[indices[node]] = 'drill_collision' if pair in drill_pairs else 'via_conflict'
+                    if self.violations is not None:
+                        self._write_conflict(geometry, vias[node], vias[removed_by[node]], reasons[indices[node]])
+        
+        removed = sum(1 for keep in kept.values() if not keep)
+        summary = {'pairs': sum(map(len, neighbors.values())) // 2,
+                   'conflicting': len(neighbors), 'removed': removed, 'kept': len(neighbors) - removed}
+        if self.profile is not None:
+            for name, value in summary.items():
+                self.profile.add('via_conflict.' + name, value)
+        return reasons, summary
+    
+    def _write_conflict(self, geometry, via, other, reason):
+        """VIA同士の衝突の解消で削除したVIAを、残した相手のVIAを原因として書く"""
+        distance = math.hypot(via.x - other.x, via.y - other.y)
+        if reason == 'drill_collision':
+            detail = (other.uuid, 'via_hole', distance - via.drill_radius - other.drill_radius, self.hole_to_hole)
+        else:
+            shared = self._layer_mask(via.layers) & self._layer_mask(other.layers)
+            detail = (other.uuid, 'via', distance - via.radius - other.radius,
+                      self.clearances.clearance(via.net, other.net, shared, 'Via'))
+        self.violations.write(via, reason, geometry.net_names.get(via.net, ""), detail)
+    
+    def _conflict_graph(self, vias, check_nets=True):
+        """VIA同士の衝突グラフ（衝突相手のあるVIAだけ、番号 → 衝突相手の番号のリスト）と、
+        穴の間隔だけで衝突するペア(小さい番号, 大きい番号)の集合を返す
+
+        check_netsなら他ネットとのクリアランス、hole_to_holeがあれば穴の間隔で衝突を判定する。
+        セルの大きさを最大の相互作用距離にしたグリッドに入れ、隣り合うセルの組だけを調べる。
+        """
+        if not vias:
+            return {}, set()
+        resolver = self.clearances
+        hole_to_hole = self.hole_to_hole
+        masks = [self._layer_mask(via.layers) for via in vias]
+        cell = 1
+        if check_nets:
+            max_radius = max(via.radius for via in vias)
+            cell = max(resolver.reach(via.net, mask) + via.radius for via, mask in zip(vias, masks)) + max_radius
+        if hole_to_hole is not None:
+            cell = max(cell, hole_to_hole + 2 * max(via.drill_radius for via in vias))
+        cell = max(int(cell), 1)
+        grid = defaultdict(list)
+        for node, via in enumerate(vias):
+            grid[(via.x // cell, via.y // cell)].append(node)
+        
+        limit = cell * cell
+        required = {}  # (ネット, ネット, 共通の層マスク) → クリアランス
+        neighbors = defaultdict(list)
+        drill_pairs = set()
+        for (cx, cy), members in grid.items():
+            for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):  # 各セルの組を1回ずつ
+                others = grid.get((cx + dx, cy + dy))
+                if not others:
+                    continue
+                for position, a in enumerate(members):
+                    x, y, radius, net = vias[a][:4]
+                    drill_radius = vias[a].drill_radius
+                    for b in (members[position + 1:] if dx == 0 and dy == 0 else others):
+                        via_b = vias[b]
+                        distance_squared = (x - via_b.x) ** 2 + (y - via_b.y) ** 2
+                        if distance_squared >= limit:
+                            continue
+                        shared = masks[a] & masks[b]
+                        if not shared:
+                            continue
+                        distance = math.sqrt(distance_squared)
+                        collides = False
+                        if check_nets and net != via_b.net:
+                            key = (net, via_b.net, shared)
+                            clearance = required.get(key)
+                            if clearance is None:
+                                clearance = required[key] = resolver.clearance(net, via_b.net, shared, 'Via')
+                            collides = distance < clearance + radius + via_b.radius
+                        if (not collides and hole_to_hole is not None and drill_radius > 0 and via_b.drill_radius > 0
+                                and distance < hole_to_hole + drill_radius + via_b.drill_radius):
+                            collides = True
+                            drill_pairs.add((min(a, b), max(a, b)))
+                        if collides:
+                            neighbors[a].append(b)
+                            neighbors[b].append(a)
+        return neighbors, drill_pairs
+
+    def thin_vias(self, geometry, selected_vias, reasons, settings):
+        """スティッチングVIAの間引き: チェックを通った1つのネットの選択VIAを最小間隔まで減らし、(削除理由のリスト, 集計)を返す
+
+        間隔はthinning_pitch（thinning_densityがあれば目標密度の正方格子の間隔）。優先順にVIAを調べ、
+        間隔内に残したVIAが無ければ残す（SpatialIndexを使ったポアソンディスク・サンプリング）。他ネットのVIA
+        （信号の層移動で、リターン電流が近くのVIAを通る）に近いものほど優先し、それ以外は座標順。
+        最後に、同じネットのゾーンの島（塗りつぶしの外周ごと。塗りつぶしが無ければゾーンの外周ごと・層ごと）で
+        繋がるVIAが無くなったものは、最も優先度の高いVIAを戻す。
+        残さなかったVIAの削除理由は'thinned'。集計は{'net', 'pitch', 'candidates', 'removed', 'kept', 'protected',
+        'zones': [{'uuid', 'name', 'removed'}], 'outside_zones'}（pitchはmm）。無効ならreasonsのままでNone。
+        """
+        if not settings.get('thin_stitching'):
+            return reasons, None
+        density = settings.get('thinning_density') or 0
+        pitch = int(10 * IU_PER_MM / math.sqrt(density)) if density > 0 else int(settings['thinning_pitch'] * IU_PER_MM)
+        net = self._thinning_net(geometry, selected_vias, reasons, settings.get('thinning_net'))
+        if net is None or pitch <= 0:
+            return reasons, None
+
+        with profile_stage(self.profile, 'thin_vias'):
+            indices = [index for index, (via, reason) in enumerate(zip(selected_vias, reasons))
+                       if reason is None and via.net == net]
+            vias = [selected_vias[index] for index in indices]
+            removed_uuids = {via.uuid for via, reason in zip(selected_vias, reasons) if reason}
+
+            # 優先順: 間隔内の最も近い他ネットのVIAまでの距離 → 座標
+            signals = SpatialIndex(pitch + 1)
+            for via in geometry.vias:
+                if via.net != net and via.net != 0 and via.uuid not in removed_uuids:
+                    signals.add_item(via.x, via.y, None)
+            keys = []
+            for via in vias:
+                nearest = pitch
+                for x, y, item in signals.get_nearby_items(via.x, via.y, pitch):
+                    nearest = min(nearest, math.hypot(x - via.x, y - via.y))
+                keys.append((nearest, via.y, via.x))
+            order = sorted(range(len(vias)), key=keys.__getitem__)
+            rank = {node: position for position, node in enumerate(order)}
+
+            kept = SpatialIndex(pitch + 1)
+            limit = pitch * pitch
+            keep = [False] * len(vias)
+            blocked_by = {}  # 残さなかったVIA → 間隔内にあった残したVIA
+            for node in order:
+                via = vias[node]
+                for x, y, item in kept.get_nearby_items(via.x, via.y, pitch):
+                    if (x - via.x) ** 2 + (y - via.y) ** 2 < limit:
+                        blocked_by[node] = item
+                        break
+                else:
+                    keep[node] = True
+                    kept.add_item(via.x, via.y, node)
+
+            # 島ごとに、繋がるVIA（間引き対象外の同じネットのVIAを含む）が残っていなければ1つ戻す
+            islands, via_zones = self._thinning_islands(geometry, net, vias, removed_uuids)
+            protected = 0
+            for members, fixed in islands:
+                if fixed or not members or any(keep[node] for node in members):
+                    continue
+                node = min(members, key=rank.__getitem__)
+                keep[node] = True
+                protected += 1
+
+            reasons = list(reasons)
+            zone_counts = {}
+            for node, index in enumerate(indices):
+                if not keep[node]:
+                    reasons[index] = 'thinned'
+                    zone = via_zones.get(node)
+                    zone_counts[zone] = zone_counts.get(zone, 0) + 1
+                    if self.violations is not None:  # 距離は中心どうし
+                        via, other = vias[node], vias[blocked_by[node]]
+                        self.violations.write(via, 'thinned', geometry.net_names.get(via.net, ""),
+                                              (other.uuid, 'via', math.hypot(via.x - other.x, via.y - other.y), pitch))
+
+        removed = sum(zone_counts.values())
+        summary = {'net': geometry.net_names.get(net, ""), 'pitch': pitch / IU_PER_MM, 'candidates': len(vias),
+                   'removed': removed, 'kept': len(vias) - removed, 'protected': protected,
+                   'zones': [{'uuid': zone['uuid'], 'name': zone.get('name', ""), 'removed': zone_counts.get(number, 0)}
+                             for number, zone in enumerate(geometry.zones) if zone['net'] == net],
+                   'outside_zones': zone_counts.get(None, 0)}
+        if self.profile is not None:
+            for name in ('candidates', 'removed', 'protected'):
+                self.profile.add('thinned.' + name, summary[name])
+        return reasons, summary
+
+    def _thinning_net(self, geometry, selected_vias, reasons, net_name):
+        """間引くネットのコード（名前が無ければチェックを通った選択VIAが最も多いネット。無ければNone）"""
+        if net_name:
+            return next((code for code, name in geometry.net_names.items() if name == net_name), None)
+        counts = defaultdict(int)
+        for via, reason in zip(selected_vias, reasons):
+            if reason is None and via.net != 0:
+                counts[via.net] += 1
+        return max(counts, key=counts.__getitem__) if counts else None
+
+    def _thinning_islands(self, geometry, net, vias, removed_uuids):
+        """ネットのゾーンの島ごとの([間引き対象VIAの番号], 対象外の同じネットのVIAがあるか)のリストと、
+        間引き対象VIAの番号 → 最初に含まれるゾーンの番号を返す
+
+        島は層ごとの塗りつぶし形状の外周ごと（塗りつぶしが無いゾーンはゾーンの外周ごと・層ごと）。
+        ゾーンの番号はゾーンの外周で決める。
+        """
+        candidates = {via.uuid: node for node, via in enumerate(vias)}
+        net_vias = [via for via in geometry.vias
+                    if via.net == net and via.uuid not in removed_uuids and via.uuid not in candidates]
+        net_vias.extend(vias)
+
+        def inside(outline, holes):
+            x0, y0, x1, y1 = polygon_bounding_box(outline)
+            return [via for via in net_vias
+                    if x0 <= via.x <= x1 and y0 <= via.y <= y1 and point_in_polygon(via.x, via.y, outline)
+                    and not any(point_in_polygon(via.x, via.y, hole) for hole in holes)]
+
+        islands = []
+        via_zones = {}
+        for number, zone in enumerate(geometry.zones):
+            if zone['net'] != net:
+                continue
+            fills = zone.get('fills')
+            for outline, holes in zone['polygons']:
+                if not outline:
+                    continue
+                zone_vias = inside(outline, holes)
+                for via in zone_vias:
+                    node = candidates.get(via.uuid)
+                    if node is not None:
+                        via_zones.setdefault(node, number)
+                if fills is None:
+                    islands.extend(self._island_members(zone_vias, layer, candidates) for layer in zone['layers'])
+            for layer, polygons in (fills or {}).items():
+                for outline, holes in polygons:
+                    if outline:
+                        islands.append(self._island_members(inside(outline, holes), layer, candidates))
+        return islands, via_zones
+
+    def _island_members(self, island_vias, layer, candidates):
+        """島に含まれるVIAのうちlayerに届くものの([間引き対象VIAの番号], 対象外のVIAがあるか)"""
+        members = []
+        fixed = False
+        for via in island_vias:
+            if via.layers and layer not in via.layers:
+                continue
+            node = candidates.get(via.uuid)
+            if node is None:
+                fixed = True
+            else:
+                members.append(node)
+        return members, fixed
+
+    def _distance_point_to_segment_fast(self, point, segment_start, segment_end):
+        """高速化された点と線分の距離計算"""
+        segment_vec_x = segment_end.x - segment_start.x
+        segment_vec_y = segment_end.y - segment_start.y
+        
+        segment_length_squared = segment_vec_x * segment_vec_x + segment_vec_y * segment_vec_y
+        
+        if segment_length_squared == 0:
+            dx = point.x - segment_start.x
+            dy = point.y - segment_start.y
+            return math.sqrt(dx*dx + dy*dy)
+        
+        point_vec_x = point.x - segment_start.x
+        point_vec_y = point.y - segment_start.y
+        
+        dot_product = segment_vec_x * point_vec_x + segment_vec_y * point_vec_y
+        t = max(0, min(1, dot_product / segment_length_squared))
+        
+        projection_x = segment_start.x + segment_vec_x * t
+        projection_y = segment_start.y + segment_vec_y * t
+        
+        dx = point.x - projection_x
+        dy = point.y - projection_y
+        return math.sqrt(dx*dx + dy*dy)
+    
+    # 元のヘルパーメソッドも保持（互換性のため）
+    def distance_point_to_segment(self, point, segment_start, segment_end):
+        return self._distance_point_to_segment_fast(point, segment_start, segment_end)
+    
+    def distance_point_to_arc(self, point, arc_center, arc_radius, start_angle_deg, angle_deg):
+        """元の円弧距離計算メソッド"""
+        dx = point.x - arc_center.x
+        dy = point.y - arc_center.y
+        center_to_point = math.sqrt(dx*dx + dy*dy)
+        
+        angle_to_point = math.atan2(dy, dx)
+        angle_to_point_deg = math.degrees(angle_to_point)
+        
+        start_angle_norm = start_angle_deg % 360
+        end_angle_norm = (start_angle_norm + angle_deg) % 360
+        
+        is_in_range = False
+        if start_angle_norm <= end_angle_norm:
+            is_in_range = start_angle_norm <= angle_to_point_deg <= end_angle_norm
+        else:
+            is_in_range = angle_to_point_deg >= start_angle_norm or angle_to_point_deg <= end_angle_norm
+        
+        if is_in_range:
+            return abs(center_to_point - arc_radius)
+        else:
+            start_x = arc_center.x + int(arc_radius * math.cos(math.radians(start_angle_norm)))
+            start_y = arc_center.y + int(arc_radius * math.sin(math.radians(start_angle_norm)))
+            
+            end_x = arc_center.x + int(arc_radius * math.cos(math.radians(end_angle_norm)))
+            end_y = arc_center.y + int(arc_radius * math.sin(math.radians(end_angle_norm)))
+            
+            dx1 = point.x - start_x
+            dy1 = point.y - start_y
+            dist_to_start = math.sqrt(dx1*dx1 + dy1*dy1)
+            
+            dx2 = point.x - end_x
+            dy2 = point.y - end_y
+            dist_to_end = math.sqrt(dx2*dx2 + dy2*dy2)
+            
+            return min(dist_to_start, dist_to_end)
+
+
+_worker_checker = None  # ワーカープロセスごとのprepare済みViaChecker
+
+def _init_worker(geometry, settings, excluded_rows=frozenset()):
+    global _worker_checker
+    _worker_checker = ViaChecker()
+    _worker_checker.excluded_rows = excluded_rows
+    _worker_checker.prepare(geometry, settings)
+
+def _check_tile_chunk(task):
+    indices, vias, explain = task
+    reasons = _worker_checker.check_chunk(vias)
+    return indices, reasons, _worker_checker.explain_chunk(vias, reasons) if explain else None
+
+def partition_vias(vias, chunk_count, tile_size=PARALLEL_TILE_SIZE):
+    """VIAを空間タイル単位でまとめ、ほぼ同じ数ずつchunk_count個程度の塊に分ける（インデックスのリスト）"""
+    tiles = defaultdict(list)
+    for index, via in enumerate(vias):
+        tiles[(via.x // tile_size, via.y // tile_size)].append(index)
+    
+    target = max(1, -(-len(vias) // chunk_count))
+    chunks = []
+    current = []
+    for key in sorted(tiles):
+        current.extend(tiles[key])
+        if len(current) >= target:
+            chunks.append(current)
+            current = []
+    if current:
+        chunks.append(current)
+    return chunks
+
+def check_vias_parallel(geometry, selected_vias, settings, workers, checker=None, prepared=None, progress=None):
+    """選択VIAを空間タイルに分けてプロセスプールでチェックし、元の順に結果をまとめる
+
+    forkが使える環境では親プロセスで1回だけprepare（checkerがあればそれを使う）し、
+    ワーカーはその状態をコピーオンライトで共有する。それ以外（spawn）では各ワーカーが形状を
+    受け取ってprepareする。結果はVIAの元の順に戻すのでワーカー数に依存しない。
+    progressは塊が終わるたびに呼び、中断を求められたらプールを止めてCheckCancelledを送出する。
+    checkerにviolationsがあれば、ワーカーは原因も求めて返し、親プロセスが塊の届いた順に書き出す。
+    """
+    import multiprocessing
+    global _worker_checker
+    
+    worker_settings = dict(settings, workers=1)
+    chunks = partition_vias(selected_vias, workers * 4)
+    explain = checker is not None and checker.violations is not None
+    tasks = [(indices, [selected_vias[i] for i in indices], explain) for indices in chunks]
+    
+    if multiprocessing.get_start_method() == 'fork':
+        _worker_checker = checker or ViaChecker()
+        _worker_checker.prepare(geometry, worker_settings, prepared)
+        pool = multiprocessing.Pool(workers)
+    else:
+        excluded_rows = checker.excluded_rows if checker is not None else frozenset()
+        pool = multiprocessing.Pool(workers, _init_worker, (geometry, worker_settings, excluded_rows))
+    
+    reasons = [None] * len(selected_vias)
+    try:
+        with pool:
+            done = 0
+            report_progress(progress, done, len(selected_vias))
+            for indices, chunk_reasons, details in pool.imap_unordered(_check_tile_chunk, tasks):
+                for index, reason in zip(indices, chunk_reasons):
+                    reasons[index] = reason
+                if explain:
+                    checker.write_violations([selected_vias[i] for i in indices], chunk_reasons, details)
+                done += len(indices)
+                report_progress(progress, done, len(selected_vias))
+    finally:
+        _worker_checker = None
+    return reasons
+
+def item_snapshot(geometry):
+    """差分検出用に、基板上のアイテムをUUID → 形状の対応で保存できる形にする
+
+    VIA・配線・パッドの穴は形状レコードをそのまま（タプル）、部品・ゾーン・ルールエリアは(外形ボックス, レコード)で持つ。
+    """
+    return {
+        'vias': {via.uuid: tuple(via) for via in geometry.vias},
+        'tracks': {track.uuid: tuple(track) for track in geometry.tracks},
+        'holes': {hole.uuid: tuple(hole) for hole in geometry.holes},
+        'footprints': {footprint['uuid']: (footprint['bbox'], footprint) for footprint in geometry.footprints},
+        'zones': {zone['uuid']: (_zone_bbox(zone), zone) for zone in geometry.zones},
+        'keepouts': {keepout['uuid']: (_zone_bbox(keepout), keepout) for keepout in geometry.keepouts},
+    }
+
+def _zone_bbox(zone):
+    """ゾーンの全外周をまとめた外形ボックス（外周が無ければNone）"""
+    boxes = [polygon_bounding_box(outline) for outline, holes in zone['polygons'] if outline]
+    if not boxes:
+        return None
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+def _via_bbox(via):
+    x, y, radius = via[0], via[1], via[2]
+    return (x - radius, y - radius, x + radius, y + radius)
+
+def _track_bbox(track):
+    """配線・円弧の外形ボックス（幅込み）"""
+    kind, x1, y1, x2, y2, mx, my, half_width = track[:8]
+    if kind == 'arc':
+        arc = arc_from_three_points(x1, y1, mx, my, x2, y2)
+        if arc is not None:
+            return arc_bounding_box(*arc, x1, y1, x2, y2, half_width)
+    return (min(x1, x2) - half_width, min(y1, y2) - half_width,
+            max(x1, x2) + half_width, max(y1, y2) + half_width)
+
+def _hole_bbox(hole):
+    x1, y1, x2, y2, radius = hole[:5]
+    return (min(x1, x2) - radius, min(y1, y2) - radius, max(x1, x2) + radius, max(y1, y2) + radius)
+
+def changed_boxes(previous, current):
+    """前回と今回のitem_snapshotを比べ、追加・移動・削除されたアイテムの外形ボックスを返す（移動は前後両方）"""
+    boxes = []
+    for kind, bbox_of in (('vias', _via_bbox), ('tracks', _track_bbox), ('holes', _hole_bbox),
+                          ('footprints', lambda entry: entry[0]), ('zones', lambda entry: entry[0]),
+                          ('keepouts', lambda entry: entry[0])):
+        old_items = previous[kind]
+        new_items = current[kind]
+        for uuid, entry in new_items.items():
+            old = old_items.get(uuid)
+            if old != entry:
+                boxes.append(bbox_of(entry))
+                if old is not None:
+                    boxes.append(bbox_of(old))
+        boxes.extend(bbox_of(entry) for uuid, entry in old_items.items() if uuid not in new_items)
+    return [box for box in boxes if box is not None]
+
+def local_geometry(geometry, boxes):
+    """boxesのどれかと外形ボックスが重なるアイテムだけを残したBoardGeometry（外形・ネット名等はそのまま）"""
+    area = BoardSpatialIndex()
+    for box in boxes:
+        area.add_item(box, None, box)
+    
+    def near(box):
+        return box is not None and bool(area.query(*box))
+    
+    local = BoardGeometry()
+    local.vias = [via for via in geometry.vias if near(_via_bbox(via))]
+    local.tracks = [track for track in geometry.tracks if near(_track_bbox(track))]
+    local.holes = [hole for hole in geometry.holes if near(_hole_bbox(hole))]
+    local.footprints = [footprint for footprint in geometry.footprints if near(footprint['bbox'])]
+    local.zones = [zone for zone in geometry.zones if near(_zone_bbox(zone))]
+    local.keepouts = [keepout for keepout in geometry.keepouts if near(_zone_bbox(keepout))]
+    local.outlines = geometry.outlines
+    local.board_bbox = geometry.board_bbox
+    local.net_names = geometry.net_names
+    local.copper_layers = geometry.copper_layers
+    local.net_classes = geometry.net_classes
+    local.class_clearances = geometry.class_clearances
+    local.clearance_rules = geometry.clearance_rules
+    local.min_clearance = geometry.min_clearance
+    return local
+
+def _recheck_key(identity, settings):
+    """前回結果の保存キー（基板とチェック設定ごと）"""
+    keys = GEOMETRY_SETTING_KEYS + ['clearance', 'board_edge_clearance', 'zone_clearance', 'use_design_rules',
+                                    'resolve_via_conflicts', 'hole_to_hole']
+    digest = hashlib.sha1()
+    digest.update(repr((identity, [settings[key] for key in keys])).encode('utf-8'))
+    return 'recheck-' + digest.hexdigest()
+
+def check_vias_incremental(checker, geometry, selected_vias, settings, cache, identity, prepared=None, progress=None):
+    """前回の結果を使い、変更されたアイテムの近くのVIAだけを再チェックする
+
+    前回チェックしたときのアイテム（UUIDと形状）と今回を比べ、追加・移動・削除された
+    アイテムの外形ボックスがクリアランス範囲に掛かるVIAと、前回の結果が無いVIAだけをチェックし直す。
+    選択から外れた・加わったVIAも変更として扱う（選択VIA同士の衝突は相手から外すため）。
+    基板外形やネットクラス・ルールが変わった場合は全VIAをチェックする。再チェックが一部だけなら、その周辺の
+    アイテムだけで前処理するので、かかる時間は変更の大きさにほぼ比例する（その前処理はcheckerには残さないので、
+    checker.prepared_state()は全体を前処理した場合だけ返る）。
+    選択VIA同士の衝突の解消と間引きは含まない（結果に対して呼び出し側でresolve_conflicts・thin_viasする）。
+    progressは再チェックするVIAについてだけ報告する（中断した場合は前回の結果を更新しない）。
+    """
+    profile = checker.profile
+    key = _recheck_key(identity, settings)
+    with profile_stage(profile, 'recheck_diff'):
+        snapshot = item_snapshot(geometry)
+        previous = cache.load(key)
+        clearances = [int(settings['clearance'] * IU_PER_MM), int(settings['board_edge_clearance'] * IU_PER_MM),
+                      int(settings['zone_clearance'] * IU_PER_MM)]
+        if settings.get('use_design_rules', True):  # ネットクラス・ルールの方が広いことがある
+            clearances.extend(geometry.class_clearances.values())
+            clearances.extend(rule['clearance'] for rule in geometry.clearance_rules)
+            clearances.append(geometry.min_clearance)
+        if settings.get('check_drills'):  # 穴はVIAの銅箔より内側なので間隔だけ広げれば足りる
+            clearances.append(int(settings['hole_to_hole'] * IU_PER_MM))
+        reach = max(clearances) + 1
+        design_rules = (geometry.net_classes, geometry.class_clearances, geometry.clearance_rules,
+                        geometry.min_clearance)
+        selection = {via.uuid for via in selected_vias}
+        if (previous is not None and previous['outlines'] == geometry.outlines
+                and previous['design_rules'] == design_rules):
+            results = previous['results']
+            dirty = BoardSpatialIndex()
+            boxes = changed_boxes(previous['items'], snapshot)
+            vias = snapshot['vias']
+            boxes.extend(_via_bbox(vias[uuid]) for uuid in selection ^ previous['selection'] if uuid in vias)
+            for box in boxes:
+                dirty.add_item(box, None, box)
+            targets = [index for index, via in enumerate(selected_vias)
+                       if via.uuid not in results or dirty.query(via.x - via.radius - reach, via.y - via.radius - reach,
+                                                                 via.x + via.radius + reach, via.y + via.radius + reach)]
+        else:
+            results = {}
+            targets = list(range(len(selected_vias)))
+    
+    reasons = [results.get(via.uuid) for via in selected_vias]
+    if profile is not None:
+        profile.add('recheck.reused', len(selected_vias) - len(targets))
+        profile.add('recheck.checked', len(targets))
+    if targets:
+        target_vias = [selected_vias[index] for index in targets]
+        target_geometry = geometry
+        target_checker = checker
+        if prepared is None and len(targets) < len(selected_vias):
+            with profile_stage(profile, 'local_geometry'):
+                target_geometry = local_geometry(geometry, [(via.x - via.radius - reach, via.y - via.radius - reach,
+                                                             via.x + via.radius + reach, via.y + via.radius + reach)
+                                                            for via in target_vias])
+            # 周辺だけの前処理は基板全体のディスクキャッシュに残せないので、checkerとは別に行う
+            target_checker = ViaChecker(profile)
+        for index, reason in zip(targets, target_checker.check_vias(target_geometry, target_vias, settings, prepared,
+                                                                    selected_vias, progress)):
+            reasons[index] = reason
+    
+    vias = snapshot['vias']
+    results = {uuid: reason for uuid, reason in results.items() if uuid in vias}  # 削除されたVIAは忘れる
+    results.update((via.uuid, reason) for via, reason in zip(selected_vias, reasons))
+    with profile_stage(profile, 'recheck_store'):
+        cache.store(key, {'outlines': geometry.outlines, 'design_rules': design_rules, 'items': snapshot,
+                          'selection': selection, 'results': results})
+    return reasons
+
+def count_reasons(reasons):
+    """削除理由ごとの件数"""
+    counts = dict.fromkeys(REMOVAL_REASONS, 0)
+    for reason in reasons:
+        if reason:
+            counts[reason] += 1
+    return counts
+
+def check_board(board, selected_vias, settings, profile=None, cache=None):
+    """pcbnewの基板と選択VIAをチェックし、VIAごとの削除理由のリストを返す"""
+    geometry, records, reasons, conflicts, thinning = run_board_check(board, selected_vias, settings, profile, cache)
+    return reasons
+
+def run_board_check(board, selected_vias, settings, profile=None, cache=None, progress=None, violations=None):
+    """pcbnewの基板をチェックし、(形状, 選択VIAのViaRecord, 削除理由, VIA同士の衝突の集計, 間引きの集計)を返す
+
+    cacheがあれば基板のフィンガープリントで前処理結果を探し、あれば形状の抽出と
+    インデックスの構築を省略する。無ければ構築した結果を保存する。
+    progressはViaChecker.check_viasと同じ（中断されるとCheckCancelled。基板は変更しない）。
+    violations（ViolationWriter）があれば全VIAの判定を書くため、差分チェックはせずに全部チェックする。
+    """
+    key = None
+    entry = None
+    if cache is not None:
+        with profile_stage(profile, 'fingerprint'):
+            key = board_fingerprint(board, settings)
+        with profile_stage(profile, 'cache_load'):
+            entry = cache.load(key)
+    
+    if entry is not None:
+        geometry, prepared = entry
+    else:
+        report_progress(progress, 0, len(selected_vias))
+        with profile_stage(profile, 'extract_geometry'):
+            geometry = extract_geometry(board, settings)
+        prepared = None
+    copper = copper_layers(board)
+    records = [via_record(via, copper) for via in selected_vias]
+    
+    checker = ViaChecker(profile, violations)
+    identity = board.GetFileName()
+    if cache is not None and settings.get('incremental') and identity and violations is None:
+        reasons = check_vias_incremental(checker, geometry, records, settings, cache, identity, prepared, progress)
+    else:
+        reasons = checker.check_vias(geometry, records, settings, prepared, progress=progress)
+    if key is not None and entry is None and checker.prepared_state() is not None:
+        with profile_stage(profile, 'cache_store'):
+            cache.store(key, (geometry, checker.prepared_state()))
+    reasons, conflicts = checker.resolve_conflicts(geometry, records, reasons, settings)
+    reasons, thinning = checker.thin_vias(geometry, records, reasons, settings)
+    return geometry, records, reasons, conflicts, thinning
+
+def _verdict_key(identity):
+    digest = hashlib.sha1()
+    digest.update(repr(identity).encode('utf-8'))
+    return 'verdicts-' + digest.hexdigest()
+
+def save_verdicts(cache, board, settings, selected_vias, reasons):
+    """プレビューの判定結果（削除するVIAのUUID → 削除理由）を基板のフィンガープリントと一緒に保存
+
+    保存した判定結果を返す（キャッシュに書けなければNone）。
+    """
+    removals = {via.m_Uuid.AsString(): reason for via, reason in zip(selected_vias, reasons) if reason}
+    if not cache.store(_verdict_key(board.GetFileName()), {
+            'settings': settings, 'fingerprint': board_fingerprint(board, settings), 'removals': removals}):
+        return None
+    return removals
+
+def load_verdicts(cache, board):
+    """save_verdictsで保存した判定結果（UUID → 削除理由）。無いか、保存後に基板が変わっていればNone"""
+    entry = cache.load(_verdict_key(board.GetFileName()))
+    if entry is None or board_fingerprint(board, entry['settings']) != entry['fingerprint']:
+        return None
+    return entry['removals']
+
+def find_vias(board, uuids):
+    """UUIDの集合に含まれる基板上のVIA（基板の順）"""
+    return [item for item in board.GetTracks()
+            if item.Type() == pcbnew.PCB_VIA_T and item.m_Uuid.AsString() in uuids]
+
+def remove_vias(board, vias):
+    """VIAを基板から1つずつ削除
+
+    プラグインから呼んだ場合は、KiCadがアクションプラグインの実行前後の差分を
+    1回の元に戻す操作として記録する。BOARD_COMMITはエディタのフレームかツールが必要で、
+    プラグインのpcbnewモジュールからは作れないので使わない。
+    """
+    for via in vias:
+        board.Remove(via)
+
+def select_vias(board, net_names=None, group_names=None):
+    """ネット名・グループ名でVIAを選ぶ（どちらも指定しなければ全VIA）"""
+    group_uuids = None
+    if group_names:
+        group_uuids = set()
+        for group in board.Groups():
+            if group.GetName() in group_names:
+                _collect_group_uuids(group, group_uuids)
+    
+    vias = []
+    for item in board.GetTracks():
+        if item.Type() != pcbnew.PCB_VIA_T:
+            continue
+        if net_names or group_names:
+            in_net = bool(net_names) and item.GetNetname() in net_names
+            in_group = group_uuids is not None and item.m_Uuid.AsString() in group_uuids
+            if not (in_net or in_group):
+                continue
+        vias.append(item)
+    return vias
+
+def _collect_group_uuids(group, uuids):
+    """グループ（入れ子を含む）に属するアイテムのUUIDを集める"""
+    for item in group.GetItems():
+        if item.Type() == pcbnew.PCB_GROUP_T:
+            _collect_group_uuids(item.Cast(), uuids)
+        else:
+            uuids.add(item.m_Uuid.AsString())
+
+def build_report(selected_vias, reasons, settings, execution_time, net_names, conflicts=None, thinning=None):
+    """機械可読なレポート（dict）を作成（conflictsはresolve_conflicts、thinningはthin_viasの集計）"""
+    removed = []
+    for via, reason in zip(selected_vias, reasons):
+        if reason:
+            removed.append({
+                'uuid': via.uuid,
+                'x_mm': via.x / IU_PER_MM,
+                'y_mm': via.y / IU_PER_MM,
+                'net': net_names.get(via.net, ""),
+                'reason': reason
+            })
+    return {
+        'settings': settings,
+        'selected_count': len(selected_vias),
+        'removed_count': len(removed),
+        'reasons': count_reasons(reasons),
+        'via_conflicts': conflicts,
+        'thinning': thinning,
+        'execution_time': execution_time,
+        'removed_vias': removed
+    }
+
+def main(argv=None):
+    """コマンドライン実行: .kicad_pcbをGUI無しでクリーンアップ"""
+    parser = argparse.ArgumentParser(
+        description="選択したVIAから衝突や不適切なクリアランスのものを削除します（GUI無し）")
+    parser.add_argument('--in', dest='input_path', required=True, help='入力 .kicad_pcb')
+    parser.add_argument('--out', dest='output_path', help='出力 .kicad_pcb（省略時はチェックのみ）')
+    parser.add_argument('--settings', default=SETTINGS_FILE, help='設定ファイル (via_cleaner_settings.json)')
+    parser.add_argument('--net', dest='nets', action='append', help='対象ネット名（複数指定可）')
+    parser.add_argument('--group', dest='groups', action='append', help='対象グループ名（複数指定可）')
+    parser.add_argument('--report', help='レポートの出力先（JSON、"-"で標準出力）')
+    parser.add_argument('--engine', choices=['auto', 'pcbnew', 'sexpr'], default='auto',
+                        help='読み込み方法（sexprはpcbnewを使わずファイルを直接読み書き。autoはpcbnewがあればpcbnew）')
+    parser.add_argument('--workers', type=int, help='並列チェックのプロセス数（省略時は設定ファイルの値）')
+    parser.add_argument('--profile', help='ステージごとの処理時間とカウンタの出力先（.csvならCSV、それ以外はJSON）')
+    parser.add_argument('--cprofile', help='チェックループのcProfile結果の出力先（pstats形式）')
+    parser.add_argument('--no-cache', action='store_true', help='前処理結果のディスクキャッシュを使わない')
+    parser.add_argument('--full', action='store_true', help='前回の結果を使わず全VIAをチェックし直す')
+    parser.add_argument('--violations', help='VIAごとの判定と原因の出力先（.csvならCSV、それ以外はJSON Lines）')
+    parser.add_argument('--heatmap', help='削除理由ごとの件数のヒートマップの出力先（JSON）')
+    parser.add_argument('--heatmap-cell', type=float, help='ヒートマップのセルの大きさ (mm)')
+    args = parser.parse_args(argv)
+    
+    settings = load_settings(args.settings)
+    if args.full:
+        settings['incremental'] = False
+    if args.workers is not None:
+        settings['workers'] = args.workers
+    if args.violations is not None:
+        settings['violation_path'] = args.violations
+    if args.heatmap is not None:
+        settings['heatmap_path'] = args.heatmap
+    if args.heatmap_cell is not None:
+        settings['heatmap_cell'] = args.heatmap_cell
+    profile_path = args.profile or settings.get('profile_path')
+    profile = CheckProfile(use_cprofile=bool(args.cprofile)) if profile_path or args.cprofile else None
+    cache = None if args.no_cache else open_cache(settings)
+    engine = args.engine
+    if engine == 'auto':
+        engine = 'pcbnew' if pcbnew is not None else 'sexpr'
+    
+    start_time = time.time()
+    violations = open_violation_writer(settings)
+    try:
+        if engine == 'sexpr':
+            from via_cleaner_sexpr import SexprBoard
+            key = None
+            entry = None
+            if cache is not None:
+                key = file_fingerprint(args.input_path, settings)
+                with profile_stage(profile, 'cache_load'):
+                    entry = cache.load(key)
+            with profile_stage(profile, 'load'):
+                board = SexprBoard(args.input_path, settings, entry[0] if entry else None)
+                geometry = board.geometry
+                selected_indices = board.select_vias(args.nets, args.groups)
+                selected_vias = [geometry.vias[i] for i in selected_indices]
+            checker = ViaChecker(profile, violations)
+            prepared = entry[1] if entry else None
+            if cache is not None and settings.get('incremental') and violations is None:
+                reasons = check_vias_incremental(checker, geometry, selected_vias, settings, cache,
+                                                 os.path.abspath(args.input_path), prepared)
+            else:
+                reasons = checker.check_vias(geometry, selected_vias, settings, prepared)
+            if key is not None and entry is None and checker.prepared_state() is not None:
+                with profile_stage(profile, 'cache_store'):
+                    cache.store(key, (board.state(), checker.prepared_state()))
+            reasons, conflicts = checker.resolve_conflicts(geometry, selected_vias, reasons, settings)
+            reasons, thinning = checker.thin_vias(geometry, selected_vias, reasons, settings)
+            with profile_stage(profile, 'write'):
+                if args.output_path:
+                    board.write(args.output_path, [i for i, reason in zip(selected_indices, reasons) if reason])
+                board.close()
+        else:
+            with profile_stage(profile, 'load'):
+                board = pcbnew.LoadBoard(args.input_path)
+                via_items = select_vias(board, args.nets, args.groups)
+            geometry, selected_vias, reasons, conflicts, thinning = run_board_check(
+                board, via_items, settings, profile, cache, violations=violations)
+            with profile_stage(profile, 'remove'):
+                remove_vias(board, [via for via, reason in zip(via_items, reasons) if reason])
+            with profile_stage(profile, 'write'):
+                if args.output_path:
+                    pcbnew.SaveBoard(args.output_path, board)
+    finally:
+        if violations is not None:
+            violations.close()
+    execution_time = time.time() - start_time
+    
+    if profile is not None:
+        if profile_path:
+            profile.write(profile_path)
+        if args.cprofile:
+            profile.write_cprofile(args.cprofile)
+    
+    report = build_report(selected_vias, reasons, settings, execution_time, geometry.net_names, conflicts, thinning)
+    report['input'] = args.input_path
+    report['output'] = args.output_path
+    report['engine'] = engine
+    
+    if args.report == '-':
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write('\n')
+    elif args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    
+    print(f"{report['removed_count']} / {report['selected_count']} 個のVIAを削除しました "
+          f"({execution_time:.2f}秒)", file=sys.stderr)
+    if cache is not None and cache.error is not None:
+        print(f"キャッシュを使えませんでした: {cache.error}", file=sys.stderr)
+    if conflicts and conflicts['conflicting']:
+        print(f"VIA同士の衝突: {conflicts['conflicting']} 個中 {conflicts['kept']} 個を残しました", file=sys.stderr)
+    if thinning:
+        print(f"間引き: {thinning['net']} の {thinning['candidates']} 個中 {thinning['removed']} 個を削除しました "
+              f"(間隔 {thinning['pitch']:.3f}mm、島を残すために戻した数: {thinning['protected']})", file=sys.stderr)
+        for zone in thinning['zones']:
+            if zone['removed']:
+                print(f"  ゾーン {zone['name'] or zone['uuid']}: {zone['removed']} 個", file=sys.stderr)
+        if thinning['outside_zones']:
+            print(f"  ゾーン外: {thinning['outside_zones']} 個", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""ネットクラスとカスタムルールの読み込み（pcbnew不要）
+
+基板ファイルと同じ名前の.kicad_pro（ネットクラスのクリアランスと割り当て、
+基板の最小クリアランス）と.kicad_dru（カスタムルール）を読み、BoardGeometryの
+net_classes / class_clearances / clearance_rules / min_clearanceに入れる。
+ネットペアごとのクリアランスの決定はvia_cleaner_core.ClearanceResolverで行う。
+
+カスタムルールの条件式はネットクラス・ネット名・アイテム種別の比較と
+hasNetclass()、&& / || / ! と括弧だけに対応し、それ以外を含むルールは無視する。
+"""
+
+import os
+import re
+import json
+import fnmatch
+
+from via_cleaner_core import IU_PER_MM
+from via_cleaner_sexpr import TEXT_TOKEN_RE, SexprError, _build_tree
+
+# 条件式のトークン: 文字列、演算子、括弧、識別子（A.NetClassなど）
+CONDITION_TOKEN_RE = re.compile(r"\s*('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|&&|\|\||==|!=|!|\(|\)|[\w.]+)")
+CONDITION_PROPERTIES = {'NetClass', 'NetName', 'Type'}
+UNIT_SCALE = {'mm': IU_PER_MM, 'mil': IU_PER_MM * 0.0254, 'in': IU_PER_MM * 25.4, 'um': IU_PER_MM / 1000}
+
+def _project_path(board_path, extension):
+    return os.path.splitext(board_path)[0] + extension
+
+def read_net_classes(board_path, net_names):
+    """.kicad_proからネットクラスを読む
+
+    (ネットコード → クラス名, クラス名 → クリアランス(nm), 基板の最小クリアランス(nm))を返す。
+    ファイルが無ければ全部空。
+    """
+    path = _project_path(board_path, '.kicad_pro')
+    if not os.path.exists(path):
+        return {}, {}, 0
+    with open(path, 'r', encoding='utf-8') as f:
+        project = json.load(f)
+
+    net_settings = project.get('net_settings', {})
+    class_clearances = {}
+    for net_class in net_settings.get('classes', []):
+        if 'name' in net_class and net_class.get('clearance') is not None:
+            class_clearances[net_class['name']] = int(round(net_class['clearance'] * IU_PER_MM))
+
+    assignments = net_settings.get('netclass_assignments') or {}
+    patterns = [(entry.get('pattern', ''), entry.get('netclass', 'Default'))
+                for entry in net_settings.get('netclass_patterns') or []]
+    net_classes = {}
+    for net_code, name in net_names.items():
+        assigned = assignments.get(name)
+        if isinstance(assigned, list):  # KiCad 8以降は複数クラスのリスト
+            assigned = ','.join(assigned) if assigned else None
+        if assigned is None:
+            matched = [net_class for pattern, net_class in patterns if fnmatch.fnmatchcase(name, pattern)]
+            assigned = ','.join(matched) if matched else None
+        if assigned is not None:
+            net_classes[net_code] = assigned
+
+    rules = project.get('board', {}).get('design_settings', {}).get('rules', {})
+    min_clearance = int(round((rules.get('min_clearance') or 0) * IU_PER_MM))
+    return net_classes, class_clearances, min_clearance
+
+def read_custom_rules(board_path):
+    """.kicad_druからクリアランスのカスタムルールを読む（ファイル内の順。後のものが優先）
+
+    各ルールは{'name', 'clearance': nm, 'layer': 層名/'outer'/'inner'/None, 'condition': 条件式の木}。
+    """
+    path = _project_path(board_path, '.kicad_dru')
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        tree = _build_tree(['('] + TEXT_TOKEN_RE.findall(text) + [')'])
+    except (IndexError, SexprError):
+        return []
+
+    rules = []
+    for node in tree:
+        if not isinstance(node, list) or not node or node[0] != 'rule':
+            continue
+        clearance = None
+        layer = None
+        condition = ('const', True)
+        for child in node[2:]:
+            if not isinstance(child, list) or not child:
+                continue
+            if child[0] == 'constraint' and len(child) > 1 and child[1] == 'clearance':
+                for limit in child[2:]:
+                    if isinstance(limit, list) and len(limit) > 1 and limit[0] == 'min':
+                        clearance = _parse_length(limit[1])
+            elif child[0] == 'layer' and len(child) > 1:
+                layer = child[1]
+            elif child[0] == 'condition' and len(child) > 1:
+                condition = parse_condition(child[1])
+        if clearance is not None and condition is not None:
+            rules.append({'name': node[1] if len(node) > 1 else '', 'clearance': clearance,
+                          'layer': layer, 'condition': condition})
+    return rules
+
+def _parse_length(text):
+    """'0.5mm'・'20mil'・'0.2'（mm）をnmにする（読めなければNone）"""
+    match = re.match(r'^([-+]?[\d.]+)\s*([a-z]*)$', text.strip())
+    if not match:
+        return None
+    unit = match.group(2) or 'mm'
+    if unit not in UNIT_SCALE:
+        return None
+    return int(round(float(match.group(1)) * UNIT_SCALE[unit]))
+
+def parse_condition(text):
+    """条件式を('or', a, b) / ('and', a, b) / ('not', a) / ('eq', 'A', 'NetClass', 値) /
+    ('ne', ...) / ('has', 'A', クラス名) / ('const', True)の木にする（対応外の式ならNone）
+    """
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = CONDITION_TOKEN_RE.match(text, position)
+        if match is None:
+            return None
+        tokens.append(match.group(1))
+        position = match.end()
+        while position < len(text) and text[position].isspace():
+            position += 1
+    try:
+        tree, rest = _parse_or(tokens)
+    except (IndexError, ValueError):
+        return None
+    return tree if not rest else None
+
+def _parse_or(tokens):
+    left, tokens = _parse_and(tokens)
+    while tokens and tokens[0] == '||':
+        right, tokens = _parse_and(tokens[1:])
+        left = ('or', left, right)
+    return left, tokens
+
+def _parse_and(tokens):
+    left, tokens = _parse_term(tokens)
+    while tokens and tokens[0] == '&&':
+        right, tokens = _parse_term(tokens[1:])
+        left = ('and', left, right)
+    return left, tokens
+
+def _parse_term(tokens):
+    token = tokens[0]
+    if token == '!':
+        term, tokens = _parse_term(tokens[1:])
+        return ('not', term), tokens
+    if token == '(':
+        term, tokens = _parse_or(tokens[1:])
+        if tokens[0] != ')':
+            raise ValueError(token)
+        return term, tokens[1:]
+
+    item, _, name = token.partition('.')
+    if item not in ('A', 'B'):
+        raise ValueError(token)
+    if name == 'hasNetclass' and tokens[1] == '(' and tokens[3] == ')':
+        return ('has', item, _string(tokens[2])), tokens[4:]
+    if name in CONDITION_PROPERTIES and tokens[1] in ('==', '!='):
+        return ('eq' if tokens[1] == '==' else 'ne', item, name, _string(tokens[2])), tokens[3:]
+    raise ValueError(token)
+
+def _string(token):
+    if len(token) < 2 or token[0] not in '\'"' or token[-1] != token[0]:
+        raise ValueError(token)
+    return token[1:-1]
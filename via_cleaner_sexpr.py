@@ -0,0 +1,691 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""".kicad_pcbのストリーミング読み書き（pcbnew不要）
+
+ファイルをmmapで開いてトークンを順に読み、チェックに必要なオブジェクト
+（VIA・配線・円弧・ゾーン外形・Edge.Cuts図形・部品）だけを木にして
+BoardGeometryへ変換する。それ以外のノードは木を作らずに読み飛ばすので、
+メモリ使用量は基板全体ではなく抽出した形状の大きさで決まる。
+
+書き出しは元ファイルのバイト列をそのままコピーし、削除するVIAの範囲だけを
+落とす。何も削除しなければ入力と同一のファイルになる。
+"""
+
+import os
+import re
+import math
+import mmap
+
+from via_cleaner_core import (IU_PER_MM, BoardGeometry, HoleRecord, TrackRecord, ViaRecord, arc_bounding_box,
+                              arc_from_three_points, bezier_points, load_design_rules, polygon_bounding_box,
+                              polyline_primitives)
+
+# トークン: 括弧、文字列、その他のアトム
+TOKEN_RE = re.compile(rb'[()]|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+TEXT_TOKEN_RE = re.compile(r'[()]|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+# ノード終端の検索用（括弧と文字列だけを拾う）
+SKIP_RE = re.compile(rb'[()]|"(?:[^"\\]|\\.)*"')
+# 入れ子3段までのノードを一度に読み飛ばす（'('の直後から対応する')'まで）
+_STRING = rb'"(?:[^"\\]|\\.)*"'
+_NODE_BODY = rb'(?:[^()"]|' + _STRING + rb')*'
+for _ in range(3):
+    _NODE_BODY = rb'(?:[^()"]|' + _STRING + rb'|\(' + _NODE_BODY + rb'\))*'
+SHALLOW_NODE_RE = re.compile(_NODE_BODY + rb'\)')
+# 入れ子の無い子ノード (key args...)
+FIELD_RE = re.compile(r'\((\w+)\s+([^()]*)\)')
+
+# 木を作るトップレベルノード
+WANTED_NODES = {
+    'layers', 'net', 'group', 'via', 'segment', 'arc', 'zone', 'footprint',
+    'gr_line', 'gr_arc', 'gr_circle', 'gr_rect', 'gr_poly', 'gr_curve'
+}
+# 子ノードだけを拾えば足りる、数の多いノード
+FLAT_NODES = {'via', 'segment', 'arc'}
+
+COPY_CHUNK_SIZE = 1 << 20  # 書き出し時のコピー単位
+
+class SexprError(Exception):
+    """S式の構文エラー"""
+
+def _unquote(token):
+    return token[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+
+def _build_tree(tokens):
+    """トークン列（1ノード分）を入れ子のリストにする。文字列は引用符を外す"""
+    stack = [[]]
+    for token in tokens:
+        if token == '(':
+            node = []
+            stack[-1].append(node)
+            stack.append(node)
+        elif token == ')':
+            stack.pop()
+        elif token[0] == '"':
+            stack[-1].append(_unquote(token))
+        else:
+            stack[-1].append(token)
+    return stack[0][0]
+
+def _flat_node(keyword, text):
+    """入れ子の無い子ノードだけを拾って[keyword, [key, args...], ...]にする
+
+    via/segment/arcは数が多いので木を作らずに済ませる。入れ子の中の同名ノード
+    （padstack内のsizeなど）は後ろに並ぶので、_childは本体の値を返す。
+    """
+    node = [keyword]
+    for key, args in FIELD_RE.findall(text):
+        if '"' in args:
+            node.append([key] + [_unquote(token) if token[0] == '"' else token
+                                 for token in TEXT_TOKEN_RE.findall(args)])
+        else:
+            node.append([key] + args.split())
+    return node
+
+def _node_end(buffer, position):
+    """'('の直後から対応する')'までを読み飛ばし、終了位置を返す"""
+    match = SHALLOW_NODE_RE.match(buffer, position)
+    if match is not None:
+        return match.end()
+    depth = 1
+    for match in SKIP_RE.finditer(buffer, position):
+        token = match.group()
+        if token == b'(':
+            depth += 1
+        elif token == b')':
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    raise SexprError("ファイルが途中で終わっています")
+
+def iter_top_level(buffer):
+    """(kicad_pcb ...)直下のノードを順に返す: (キーワード, ノードまたはNone, 開始位置, 終了位置)
+
+    ノードの範囲は括弧だけを追って求め、WANTED_NODESのノードだけをまとめて
+    トークン化して木にする。それ以外はNoneを返す。
+    """
+    first = TOKEN_RE.search(buffer)
+    second = TOKEN_RE.search(buffer, first.end()) if first else None
+    if first is None or first.group() != b'(' or second is None or second.group() != b'kicad_pcb':
+        raise SexprError("kicad_pcbファイルではありません")
+
+    position = second.end()
+    while True:
+        match = TOKEN_RE.search(buffer, position)
+        if match is None:
+            raise SexprError("ファイルが途中で終わっています")
+        token = match.group()
+        if token == b')':
+            return
+        if token != b'(':
+            position = match.end()  # トップレベルのアトム（通常は無い）
+            continue
+
+        start = match.start()
+        keyword_match = TOKEN_RE.search(buffer, match.end())
+        if keyword_match is None:
+            raise SexprError("ファイルが途中で終わっています")
+        keyword = keyword_match.group().decode('utf-8')
+        end = _node_end(buffer, keyword_match.end())
+        node = None
+        if keyword in FLAT_NODES:
+            node = _flat_node(keyword, buffer[keyword_match.end():end].decode('utf-8'))
+        elif keyword in WANTED_NODES:
+            node = _build_tree(TEXT_TOKEN_RE.findall(buffer[start:end].decode('utf-8')))
+        yield keyword, node, start, end
+        position = end
+
+def _child(node, key):
+    for child in node[1:]:
+        if isinstance(child, list) and child and child[0] == key:
+            return child
+    return None
+
+def _children(node, key):
+    return [child for child in node[1:] if isinstance(child, list) and child and child[0] == key]
+
+def _iu(value):
+    return int(round(float(value) * IU_PER_MM))
+
+def _point(node, key):
+    child = _child(node, key)
+    if child is None:
+        return None
+    return _iu(child[1]), _iu(child[2])
+
+def _layer(node):
+    child = _child(node, 'layer')
+    return child[1] if child and len(child) > 1 else None
+
+def _uuid(node):
+    child = _child(node, 'uuid') or _child(node, 'tstamp')
+    return child[1] if child and len(child) > 1 else ""
+
+def _pts(node):
+    pts = _child(node, 'pts')
+    if pts is None:
+        return []
+    return [(_iu(xy[1]), _iu(xy[2])) for xy in _children(pts, 'xy')]
+
+def _copper_order(name):
+    """銅箔層の積層順（F.Cu, In1.Cu, In2.Cu, ..., B.Cu）"""
+    if name == 'F.Cu':
+        return 0
+    if name == 'B.Cu':
+        return 1000
+    try:
+        return int(name[2:-3])
+    except ValueError:
+        return 999
+
+def _pts_primitives(node, uuid=None):
+    """(pts (xy ...) (arc ...) ...) を閉じた外形のプリミティブ列にする（uuidは図形のUUID）"""
+    pts = _child(node, 'pts')
+    if pts is None:
+        return []
+    items = []  # (始点, 終点, 円弧プリミティブまたはNone)
+    for child in pts[1:]:
+        if not isinstance(child, list) or not child:
+            continue
+        if child[0] == 'xy':
+            point = (_iu(child[1]), _iu(child[2]))
+            items.append((point, point, None))
+        elif child[0] == 'arc':
+            (sx, sy), (mx, my), (ex, ey) = _point(child, 'start'), _point(child, 'mid'), _point(child, 'end')
+            items.append(((sx, sy), (ex, ey), ('arc', sx, sy, mx, my, ex, ey, uuid)))
+    if len(items) < 2:
+        return []
+
+    primitives = []
+    for (_, end, arc), (start, _, _) in zip(items, items[1:] + items[:1]):
+        if arc is not None:
+            primitives.append(arc)
+        if end != start:
+            primitives.append(('segment', end[0], end[1], start[0], start[1], uuid))
+    return primitives
+
+def _primitive_extent(primitive):
+    """外形プリミティブの外形ボックスの2隅"""
+    if primitive[0] == 'circle':
+        _, cx, cy, radius, _ = primitive
+        return [(cx - radius, cy - radius), (cx + radius, cy + radius)]
+    if primitive[0] == 'arc':
+        _, sx, sy, mx, my, ex, ey, _ = primitive
+        arc = arc_from_three_points(sx, sy, mx, my, ex, ey)
+        if arc is not None:
+            x0, y0, x1, y1 = arc_bounding_box(*arc, sx, sy, ex, ey, 0)
+            return [(x0, y0), (x1, y1)]
+        return [(sx, sy), (ex, ey)]
+    _, x1, y1, x2, y2, _ = primitive
+    return [(x1, y1), (x2, y2)]
+
+def _rotate(x, y, angle_deg):
+    """KiCadの回転（Y軸下向き、正の角度で画面上反時計回り）"""
+    if not angle_deg:
+        return x, y
+    angle = math.radians(angle_deg)
+    cos_a = math.cos(angle)
+    sin_a = math.sin(angle)
+    return x * cos_a + y * sin_a, -x * sin_a + y * cos_a
+
+def _circle_points(cx, cy, radius, count=32):
+    return [(cx + radius * math.cos(2 * math.pi * i / count), cy + radius * math.sin(2 * math.pi * i / count))
+            for i in range(count)]
+
+def _arc_points(sx, sy, mx, my, ex, ey, count=8):
+    """円弧を折れ線に分割（一直線なら始点・終点）"""
+    arc = arc_from_three_points(sx, sy, mx, my, ex, ey)
+    if arc is None:
+        return [(sx, sy), (ex, ey)]
+    cx, cy, radius, start_angle, sweep = arc
+    return [(cx + radius * math.cos(start_angle + sweep * i / count),
+             cy + radius * math.sin(start_angle + sweep * i / count)) for i in range(count + 1)]
+
+def _pad_outline(shape, width, height, rratio):
+    """パッド形状をパッド座標系の多角形に変換"""
+    half_w = width / 2.0
+    half_h = height / 2.0
+    if shape == 'circle':
+        return _circle_points(0.0, 0.0, half_w)
+    if shape in ('oval', 'roundrect'):
+        radius = min(half_w, half_h) if shape == 'oval' else min(half_w, half_h) * 2 * rratio
+        if radius <= 0:
+            return [(-half_w, -half_h), (half_w, -half_h), (half_w, half_h), (-half_w, half_h)]
+        points = []
+        corners = [(half_w - radius, half_h - radius, 0), (-half_w + radius, half_h - radius, 90),
+                   (-half_w + radius, -half_h + radius, 180), (half_w - radius, -half_h + radius, 270)]
+        for cx, cy, start in corners:
+            for i in range(5):
+                angle = math.radians(start + 90 * i / 4)
+                points.append((cx + radius * math.cos(angle), cy + radius * math.sin(angle)))
+        return points
+    # rect・trapezoid・chamfered・customはパッドサイズの矩形で近似
+    return [(-half_w, -half_h), (half_w, -half_h), (half_w, half_h), (-half_w, half_h)]
+
+def _chain_loops(segments):
+    """線分を端点でつないで閉じた点列にする（コートヤードのfp_line・fp_arc用）"""
+    def key(point):
+        return (int(round(point[0] / 1000.0)), int(round(point[1] / 1000.0)))  # 1um単位で端点を照合
+
+    adjacency = {}
+    for index, (start, end) in enumerate(segments):
+        adjacency.setdefault(key(start), []).append(index)
+        adjacency.setdefault(key(end), []).append(index)
+
+    used = set()
+    loops = []
+    for first in range(len(segments)):
+        if first in used:
+            continue
+        used.add(first)
+        start, end = segments[first]
+        loop = [start]
+        current = end
+        while key(current) != key(start):
+            next_index = next((i for i in adjacency.get(key(current), ()) if i not in used), None)
+            if next_index is None:
+                break
+            used.add(next_index)
+            a, b = segments[next_index]
+            loop.append(current)
+            current = b if key(a) == key(current) else a
+        else:
+            if len(loop) >= 3:
+                loops.append(loop)
+    return loops
+
+def _pad_hole(drill, px, py, angle_deg, uuid, layers):
+    """パッドの(drill 直径) / (drill oval 幅 高さ)をHoleRecordにする（穴が無ければNone）"""
+    values = [value for value in drill[1:] if isinstance(value, str) and value != 'oval']
+    if not values:
+        return None
+    width = _iu(values[0])
+    height = _iu(values[1]) if len(values) > 1 else width
+    if width <= 0 or height <= 0:
+        return None
+    half_length = abs(width - height) / 2.0
+    dx, dy = _rotate(half_length, 0.0, angle_deg) if width >= height else _rotate(0.0, half_length, angle_deg)
+    dx, dy = int(round(dx)), int(round(dy))
+    px, py = int(round(px)), int(round(py))
+    return HoleRecord(px - dx, py - dy, px + dx, py + dy, min(width, height) // 2, uuid, layers)
+
+class SexprBoard:
+    """.kicad_pcbをpcbnew無しで読み、BoardGeometryと削除用のVIA範囲を保持する
+
+    stateにstate()の結果（ディスクキャッシュから読んだもの）を渡すと読み込みを省略する。
+    """
+    def __init__(self, path, settings, state=None):
+        self.path = path
+        self.settings = settings
+        self.geometry = BoardGeometry()
+        self.via_spans = []       # geometry.viasと同じ順のバイト範囲 (開始, 終了)
+        self.groups = {}          # グループ名 → メンバーUUIDのリスト
+        self.group_members = {}   # グループUUID → メンバーUUIDのリスト
+        self._net_codes = {}      # ネット名 → ネットコード
+        self._edge_points = []    # Edge.Cuts外形ボックス用の点
+        self._layer_spans = {}    # VIAの(開始層, 終了層) → 貫通する銅箔層名のタプル
+
+        self._file = open(path, 'rb')
+        self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if state is not None:
+            self.geometry, self.via_spans, self.groups, self.group_members = state
+            return
+        try:
+            self._read()
+        except Exception:
+            self.close()
+            raise
+
+    def state(self):
+        """キャッシュ用の読み込み結果"""
+        return self.geometry, self.via_spans, self.groups, self.group_members
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.close()
+            self._file.close()
+            self._buffer = None
+
+    def _read(self):
+        handlers = {
+            'layers': self._read_layers,
+            'net': self._read_net,
+            'group': self._read_group,
+            'via': self._read_via,
+            'segment': self._read_track,
+            'arc': self._read_track,
+            'zone': self._read_zone,
+            'footprint': self._read_footprint
+        }
+        for keyword, node, start, end in iter_top_level(self._buffer):
+            if node is None:
+                continue
+            if keyword.startswith('gr_'):
+                self._read_drawing(node)
+            else:
+                handlers[keyword](node, start, end)
+
+        if self._edge_points:
+            xs = [x for x, y in self._edge_points]
+            ys = [y for x, y in self._edge_points]
+            self.geometry.board_bbox = (int(math.floor(min(xs))), int(math.floor(min(ys))),
+                                        int(math.ceil(max(xs))), int(math.ceil(max(ys))))
+        if self.settings['check_nets'] or self.settings['check_components']:
+            load_design_rules(self.geometry, self.path)
+
+    def _net_code(self, node):
+        """(net 3) / (net 3 "GND") / (net "GND") からネットコードを得る"""
+        child = _child(node, 'net')
+        if child is None or len(child) < 2:
+            return 0
+        try:
+            return int(child[1])
+        except ValueError:
+            return self._register_net_name(child[1])
+
+    def _register_net_name(self, name):
+        if name not in self._net_codes:
+            code = max(self.geometry.net_names, default=0) + 1
+            self._net_codes[name] = code
+            self.geometry.net_names[code] = name
+        return self._net_codes[name]
+
+    def _read_layers(self, node, start, end):
+        """ヘッダの層定義から銅箔層を積層順に並べる"""
+        names = [child[1] for child in node[1:] if isinstance(child, list) and len(child) > 1]
+        self.geometry.copper_layers = sorted((name for name in names if name.endswith('.Cu')), key=_copper_order)
+
+    def _expand_layers(self, names):
+        """"*.Cu"・"F&B.Cu"などの層指定を銅箔層名に展開"""
+        copper = self.geometry.copper_layers
+        layers = []
+        for name in names:
+            if name == '*.Cu':
+                layers.extend(copper)
+            elif name == 'F&B.Cu':
+                layers.extend(['F.Cu', 'B.Cu'])
+            elif name.endswith('.Cu'):
+                layers.append(name)
+        return tuple(layer for layer in copper if layer in layers) if copper else tuple(layers)
+
+    def _via_layers(self, node):
+        """VIAの(layers 開始層 終了層)から貫通する銅箔層を求める"""
+        child = _child(node, 'layers')
+        if child is None or len(child) < 3:
+            return ()
+        key = (child[1], child[2])
+        if key not in self._layer_spans:
+            copper = self.geometry.copper_layers
+            if child[1] in copper and child[2] in copper:
+                first, last = sorted((copper.index(child[1]), copper.index(child[2])))
+                self._layer_spans[key] = tuple(copper[first:last + 1])
+            else:
+                self._layer_spans[key] = self._expand_layers(child[1:])
+        return self._layer_spans[key]
+
+    def _read_net(self, node, start, end):
+        code = int(node[1])
+        name = node[2] if len(node) > 2 else ""
+        self.geometry.net_names[code] = name
+        self._net_codes[name] = code
+
+    def _read_group(self, node, start, end):
+        name = node[1] if len(node) > 1 and isinstance(node[1], str) else ""
+        members_node = _child(node, 'members')
+        members = [member for member in members_node[1:]] if members_node else []
+        self.groups.setdefault(name, []).extend(members)
+        self.group_members[_uuid(node)] = members
+
+    def _read_via(self, node, start, end):
+        x, y = _point(node, 'at')
+        size = _child(node, 'size')
+        radius = _iu(size[1]) // 2 if size else 0
+        drill = _child(node, 'drill')
+        drill_radius = _iu(drill[1]) // 2 if drill else 0
+        net = self._net_code(node)
+        self.geometry.vias.append(ViaRecord(x, y, radius, net, _uuid(node), self._via_layers(node), drill_radius))
+        self.via_spans.append((start, end))
+
+    def _read_track(self, node, start, end):
+        if not self.settings['check_nets']:
+            return
+        x1, y1 = _point(node, 'start')
+        x2, y2 = _point(node, 'end')
+        width = _child(node, 'width')
+        half_width = _iu(width[1]) // 2 if width else 0
+        if node[0] == 'arc':
+            mx, my = _point(node, 'mid')
+            self.geometry.tracks.append(TrackRecord('arc', x1, y1, x2, y2, mx, my, half_width,
+                                                    self._net_code(node), _uuid(node), _layer(node)))
+        else:
+            self.geometry.tracks.append(TrackRecord('segment', x1, y1, x2, y2, 0, 0, half_width,
+                                                    self._net_code(node), _uuid(node), _layer(node)))
+
+    def _read_zone(self, node, start, end):
+        keepout = _child(node, 'keepout')  # ルールエリア（銅箔ではない）
+        if keepout is not None:
+            if not (self.settings.get('check_keepouts') and ['vias', 'not_allowed'] in keepout[1:]):
+                return
+        elif not (self.settings['check_zones'] or self.settings.get('thin_stitching')):
+            return
+        # 最初のpolygonが外周、以降は穴（KiCadの保存形式）
+        rings = [_pts(polygon) for polygon in _children(node, 'polygon')]
+        rings = [ring for ring in rings if len(ring) >= 3]
+        if not rings:
+            return
+        layers = _child(node, 'layers') or _child(node, 'layer') or []
+        name = _child(node, 'name')
+        if keepout is not None:
+            self.geometry.keepouts.append({
+                'uuid': _uuid(node),
+                'name': name[1] if name and len(name) > 1 else "",
+                'layers': self._expand_layers(layers[1:]),
+                'polygons': [(rings[0], rings[1:])]
+            })
+            return
+        record = {
+            'uuid': _uuid(node),
+            'name': name[1] if name and len(name) > 1 else "",
+            'net': self._net_code(node),
+            'layers': self._expand_layers(layers[1:]),
+            'polygons': [(rings[0], rings[1:])]
+        }
+        if self.settings.get('use_zone_fills') or self.settings.get('thin_stitching'):
+            fills = self._zone_fills(node, record['layers'])
+            if fills is not None:
+                record['fills'] = fills
+        self.geometry.zones.append(record)
+
+    def _zone_fills(self, node, layers):
+        """(filled_polygon (layer ..) (pts ..))を層ごとにまとめる（塗りつぶされていなければNone）
+
+        塗りつぶし形状は穴を切れ目で外周に繋いだ1本の点列で保存されている。
+        """
+        fill = _child(node, 'fill')
+        filled_polygons = _children(node, 'filled_polygon')
+        if not (filled_polygons or (fill is not None and 'yes' in fill[1:2])):
+            return None
+        fills = {layer: [] for layer in layers}
+        for polygon in filled_polygons:
+            ring = _pts(polygon)
+            layer = _layer(polygon)
+            if len(ring) >= 3 and layer in fills:
+                fills[layer].append((ring, []))
+        return fills
+
+    def _read_drawing(self, node):
+        if _layer(node) != 'Edge.Cuts':
+            return
+        if not (self.settings['check_board_edge'] or self.settings['check_outside_board']):
+            return
+        kind = node[0]
+        uuid = _uuid(node)
+        if kind == 'gr_circle':
+            cx, cy = _point(node, 'center')
+            ex, ey = _point(node, 'end')
+            primitives = [('circle', cx, cy, int(round(math.hypot(ex - cx, ey - cy))), uuid)]
+        elif kind == 'gr_arc':
+            (sx, sy), (mx, my), (ex, ey) = _point(node, 'start'), _point(node, 'mid'), _point(node, 'end')
+            primitives = [('arc', sx, sy, mx, my, ex, ey, uuid)]
+        elif kind == 'gr_rect':
+            (x0, y0), (x1, y1) = _point(node, 'start'), _point(node, 'end')
+            primitives = polyline_primitives([(x0, y0), (x1, y0), (x1, y1), (x0, y1)], closed=True, uuid=uuid)
+        elif kind == 'gr_poly':
+            primitives = _pts_primitives(node, uuid)
+        elif kind == 'gr_curve':
+            points = _pts(node)
+            if len(points) != 4:
+                return
+            primitives = polyline_primitives(bezier_points(*[value for point in points for value in point]),
+                                             uuid=uuid)
+        else:
+            start = _point(node, 'start')
+            end = _point(node, 'end')
+            primitives = [('segment', start[0], start[1], end[0], end[1], uuid)]
+
+        self.geometry.outlines.extend(primitives)
+        for primitive in primitives:
+            self._edge_points.extend(_primitive_extent(primitive))
+
+    def _read_footprint(self, node, start, end):
+        check_drills = self.settings.get('check_drills', False)
+        if not (self.settings['check_components'] or check_drills):
+            return
+        at = _child(node, 'at')
+        fx, fy = _iu(at[1]), _iu(at[2])
+        angle = float(at[3]) if len(at) > 3 else 0.0
+
+        def to_board(x, y):
+            rx, ry = _rotate(x, y, angle)
+            return fx + rx, fy + ry
+
+        points = []
+        courtyard_segments = []
+        courtyards = []
+        for child in node[1:]:
+            if not isinstance(child, list) or not child or not child[0].startswith('fp_'):
+                continue
+            kind = child[0]
+            if kind == 'fp_text':
+                continue  # 文字は外形ボックスに含めない
+            if kind == 'fp_circle':
+                cx, cy = _point(child, 'center')
+                ex, ey = _point(child, 'end')
+                shape_points = _circle_points(cx, cy, math.hypot(ex - cx, ey - cy))
+                closed = True
+            elif kind == 'fp_rect':
+                (x0, y0), (x1, y1) = _point(child, 'start'), _point(child, 'end')
+                shape_points = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+                closed = True
+            elif kind == 'fp_poly':
+                shape_points = _pts(child)
+                closed = True
+            elif kind == 'fp_arc':
+                (sx, sy), (mx, my), (ex, ey) = _point(child, 'start'), _point(child, 'mid'), _point(child, 'end')
+                shape_points = _arc_points(sx, sy, mx, my, ex, ey)
+                closed = False
+            elif kind == 'fp_line':
+                shape_points = [_point(child, 'start'), _point(child, 'end')]
+                closed = False
+            else:
+                continue
+            shape_points = [to_board(x, y) for x, y in shape_points]
+            points.extend(shape_points)
+
+            if _layer(child) in ('F.CrtYd', 'B.CrtYd') and len(shape_points) >= 2:
+                if closed:
+                    courtyards.append(shape_points)
+                else:
+                    courtyard_segments.extend(zip(shape_points[:-1], shape_points[1:]))
+
+        pads = []
+        for pad in _children(node, 'pad'):
+            pad_at = _child(pad, 'at')
+            size = _child(pad, 'size')
+            if pad_at is None or size is None:
+                continue
+            px, py = to_board(_iu(pad_at[1]), _iu(pad_at[2]))
+            pad_angle = float(pad_at[3]) if len(pad_at) > 3 else 0.0  # パッド角度は基板上の絶対角度
+            rratio = _child(pad, 'roundrect_rratio')
+            outline = _pad_outline(pad[3] if len(pad) > 3 else 'rect', _iu(size[1]), _iu(size[2]),
+                                   float(rratio[1]) if rratio else 0.25)
+            outline = [(px + rx, py + ry) for rx, ry in (_rotate(x, y, pad_angle) for x, y in outline)]
+            points.extend(outline)
+            layers = _child(pad, 'layers')
+            pad_layers = self._expand_layers(layers[1:]) if layers else ()
+            pads.append((self._net_code(pad), outline, polygon_bounding_box(outline), pad_layers))
+            drill = _child(pad, 'drill')
+            if check_drills and drill is not None:
+                hole = _pad_hole(drill, px, py, pad_angle, _uuid(pad), pad_layers)
+                if hole is not None:
+                    self.geometry.holes.append(hole)
+
+        if not self.settings['check_components']:
+            return
+
+        if not points:
+            points = [(fx, fy)]
+        x0, y0, x1, y1 = polygon_bounding_box(points)
+        record = {
+            'uuid': _uuid(node),
+            'bbox': (int(math.floor(x0)), int(math.floor(y0)), int(math.ceil(x1)), int(math.ceil(y1))),
+            'courtyards': [],
+            'pads': []
+        }
+        if self.settings['precise_components']:
+            record['courtyards'] = courtyards + _chain_loops(courtyard_segments)
+            record['pads'] = pads
+        self.geometry.footprints.append(record)
+
+    def select_vias(self, net_names=None, group_names=None):
+        """ネット名・グループ名でVIAを選ぶ（どちらも指定しなければ全VIA）。geometry.viasの番号を返す"""
+        if not net_names and not group_names:
+            return list(range(len(self.geometry.vias)))
+
+        group_uuids = set()
+        for name in group_names or ():
+            pending = list(self.groups.get(name, ()))
+            while pending:
+                uuid = pending.pop()
+                if uuid in group_uuids:
+                    continue
+                group_uuids.add(uuid)
+                pending.extend(self.group_members.get(uuid, ()))  # 入れ子のグループ
+
+        net_names = set(net_names or ())
+        selected = []
+        for index, via in enumerate(self.geometry.vias):
+            if self.geometry.net_names.get(via.net, "") in net_names or via.uuid in group_uuids:
+                selected.append(index)
+        return selected
+
+    def write(self, out_path, removed_indices):
+        """削除するVIAの範囲だけを落として書き出す（他のバイト列はそのままコピー）"""
+        buffer = self._buffer
+        spans = sorted(self._line_span(*self.via_spans[index]) for index in removed_indices)
+        temp_path = out_path + '.tmp'
+        with open(temp_path, 'wb') as out:
+            position = 0
+            for start, end in spans + [(len(buffer), len(buffer))]:
+                while position < start:
+                    chunk_end = min(start, position + COPY_CHUNK_SIZE)
+                    out.write(buffer[position:chunk_end])
+                    position = chunk_end
+                position = max(position, end)
+
+        if os.path.abspath(out_path) == os.path.abspath(self.path):
+            self.close()  # 上書きする場合は元ファイルを閉じてから置き換える
+        os.replace(temp_path, out_path)
+
+    def _line_span(self, start, end):
+        """VIAが1行を占めている場合は、行頭の空白と行末の改行まで削除範囲に含める"""
+        buffer = self._buffer
+        line_start = start
+        while line_start > 0 and buffer[line_start - 1:line_start] in (b' ', b'\t'):
+            line_start -= 1
+        line_end = end
+        while line_end < len(buffer) and buffer[line_end:line_end + 1] in (b' ', b'\t', b'\r'):
+            line_end += 1
+        at_line_start = line_start == 0 or buffer[line_start - 1:line_start] == b'\n'
+        if at_line_start and buffer[line_end:line_end + 1] == b'\n':
+            return line_start, line_end + 1
+        return start, end